@@ -1,14 +1,36 @@
+import time
+_IMPORT_T0 = time.perf_counter()  # cold-start clock: module imports + create_app
+
+import click
 from datetime import timedelta
-from flask import Flask, jsonify
+from flask import Flask, Request as FlaskRequest, current_app, jsonify, request
 from flask_cors import CORS
+from pymongo.errors import PyMongoError
+import db
 from config import Config
 from routes.auth import bp as auth_bp
 from routes.transactions import bp as tx_bp
 from routes.imports import bp as imports_bp
+from routes.analytics import bp as analytics_bp
+from utils import metrics, parse_pool
+
+
+# endpoints allowed a larger body than MAX_CONTENT_LENGTH, and the config key of their limit
+BODY_LIMITS = {"imports.import_statement": "STATEMENT_MAX_BYTES"}
+
+
+class Request(FlaskRequest):
+    @property
+    def max_content_length(self):
+        # werkzeug enforces this while reading the body, chunked uploads included
+        key = BODY_LIMITS.get(self.endpoint)
+        return current_app.config[key] if key else super().max_content_length
 
 
 def create_app():
+    t0 = time.perf_counter()
     app = Flask(__name__)
+    app.request_class = Request
     app.config.from_object(Config)
 
     app.secret_key = Config.SECRET_KEY
@@ -24,14 +46,92 @@ def create_app():
          resources={r"/api/*": {"origins": cors_allowed}},
          supports_credentials=True)
 
+    metrics.init_app(app)  # Server-Timing header + request latency histogram
+
     app.register_blueprint(auth_bp)
     app.register_blueprint(tx_bp)
     app.register_blueprint(imports_bp)
+    app.register_blueprint(analytics_bp)
+
+    @app.errorhandler(413)
+    def _too_large(e):
+        hint = "" if request.endpoint in BODY_LIMITS else "; use /api/imports/statement for CSV/OFX exports"
+        return jsonify({"error": "Upload too large" + hint}), 413
+
+    parse_pool.init(app.config.get("PARSE_WORKERS", 0))
+
+    if app.config.get("DB_ENSURE_INDEXES"):
+        # first request (not import) pays for index creation, once per process;
+        # a worker can boot while Mongo is unreachable: requests then go ahead
+        # (those needing Mongo fail on their own) and creation is retried after
+        # db.INDEX_RETRY_SECONDS
+        @app.before_request
+        def _ensure_indexes():
+            try:
+                db.ensure_indexes()
+            except PyMongoError as e:
+                app.logger.warning("index creation failed, retrying in %ss: %s", db.INDEX_RETRY_SECONDS, e)
 
     @app.get("/api/health")
     def health():
-        return jsonify({"ok": True})
+        from utils import cache, parse_cache
+        return jsonify({"ok": True, "startup": app.config["STARTUP_TIMING"],
+                        "cache": cache.stats(), "parse_cache": parse_cache.stats()})
+
+    @app.get("/api/metrics")
+    def prometheus_metrics():
+        return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.cli.command("init-db")
+    def init_db():
+        """Create all MongoDB indexes (run on deploy; safe to repeat)."""
+        db.ensure_indexes(force=True)
+        click.echo(f"ensured {len(db.INDEXES)} indexes")
+
+    @app.cli.command("rebuild-rollups")
+    @click.option("--user", "user_id", default=None, help="Only rebuild this user_id")
+    def rebuild_rollups(user_id):
+        """Recompute monthly rollups from raw transactions (backfill / drift repair)."""
+        from utils import rollups
+        n = rollups.rebuild(user_id)
+        click.echo(f"rebuilt {n} rollup docs")
+
+    @app.cli.command("backfill-search")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def backfill_search(batch_size):
+        """Add search tokens to transactions written before indexed search existed."""
+        from utils import search
+        n = search.backfill(batch_size)
+        click.echo(f"tokenized {n} transactions")
+
+    @app.cli.command("backfill-fingerprints")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def backfill_fingerprints(batch_size):
+        """Add duplicate-detection fingerprints to transactions written before them."""
+        from utils import fingerprint
+        n = fingerprint.backfill(batch_size)
+        click.echo(f"fingerprinted {n} transactions")
+
+    @app.cli.command("migrate-schema")
+    @click.option("--batch-size", default=1000, show_default=True)
+    @click.option("--user", "user_id", default=None, help="Only migrate this user_id")
+    @click.option("--no-rollups", is_flag=True, help="Skip the rollup rebuild afterwards")
+    def migrate_schema(batch_size, user_id, no_rollups):
+        """Rewrite v1 transactions (string dates, float amounts) to schema v2, online."""
+        from db import transactions
+        from utils import rollups, schema
+        n = schema.migrate(transactions, batch_size, user_id)
+        click.echo(f"migrated {n} transactions, {schema.remaining(transactions)} v1 remaining")
+        if not no_rollups:
+            click.echo(f"rebuilt {rollups.rebuild(user_id)} rollup docs")
 
+    now = time.perf_counter()
+    app.config["STARTUP_TIMING"] = {
+        "imports_ms": round((t0 - _IMPORT_T0) * 1000, 1),
+        "create_app_ms": round((now - t0) * 1000, 1),
+    }
+    app.logger.info("startup: %(imports_ms)s ms imports, %(create_app_ms)s ms create_app",
+                    app.config["STARTUP_TIMING"])
     return app
 
 app = create_app()
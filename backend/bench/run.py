@@ -0,0 +1,272 @@
+"""
+Benchmark runner.
+
+    python -m bench.run --sizes 10k,100k --out bench-results.json [--seed]
+    python -m bench.run compare base.json new.json [--threshold 0.2]
+
+Drives the real Flask app in-process (test client, configured MongoDB) as the
+bench users created by `bench.seed` and measures:
+  list       GET /api/transactions latency per filter / include combination
+             (response cache invalidated before every call, so this is the cold path)
+  paging     page-number depth vs. cursor walking
+  export     CSV / NDJSON / gzip export throughput (rows/s, MB/s)
+  parse      parse_tabular_pdf / parse_pdf_pages / receipt OCR time per page
+Results are JSON ({"meta", "results": [{"name", "params", ...stats}]}); `compare`
+matches results by name + params and exits 1 if any p50 regressed by more than
+--threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from bench import seed as bench_seed
+from config import Config
+from db import users
+from utils import cache
+
+LIST_CASES = [
+    ("all_sections", {}),
+    ("items_only", {"include": "items"}),
+    ("summary_only", {"include": "totals,series,kpis"}),
+    ("category", {"category": "Groceries"}),
+    ("search", {"q": "starbucks"}),
+    ("search_prefix", {"q": "whole fo"}),
+    ("month", {"start": "{month_start}", "end": "{month_end}"}),
+    ("year", {"start": "{year_start}", "end": "{month_end}"}),
+    ("category_year", {"category": "Dining", "start": "{year_start}", "end": "{month_end}"}),
+    ("search_category", {"q": "uber", "category": "Transport"}),
+]
+PAGE_DEPTHS = [1, 10, 100, 1000]
+PAGE_SIZE = 50
+
+
+def _stats(samples):
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "n": n,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(samples[n // 2] * 1000, 3),
+        "p95_ms": round(samples[min(n - 1, int(n * 0.95))] * 1000, 3),
+        "min_ms": round(samples[0] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def _timed(fn, repeat, before=None):
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return samples
+
+
+def _dates():
+    today = datetime.utcnow().date()
+    month_start = today.replace(day=1)
+    return {
+        "month_start": month_start.isoformat(),
+        "month_end": today.isoformat(),
+        "year_start": month_start.replace(year=month_start.year - 1).isoformat(),
+    }
+
+
+def _client(app, size):
+    client = app.test_client()
+    r = client.post("/api/auth/login", json={"email": bench_seed.bench_email(size),
+                                              "password": bench_seed.PASSWORD})
+    if r.status_code != 200:
+        raise SystemExit(f"bench user for {size} missing; run `python -m bench.seed --sizes {size}`")
+    return client, r.get_json()["user"]["id"]
+
+
+def _get_ok(client, url):
+    r = client.get(url)
+    if r.status_code != 200:
+        raise RuntimeError(f"GET {url} → {r.status_code}: {r.get_data(as_text=True)[:200]}")
+    return r
+
+
+def bench_list(client, uid, size, repeat):
+    dates = _dates()
+    out = []
+    for name, params in LIST_CASES:
+        params = {k: v.format(**dates) for k, v in params.items()}
+        url = "/api/transactions?" + "&".join(f"{k}={v}" for k, v in params.items())
+        samples = _timed(lambda: _get_ok(client, url), repeat, before=lambda: cache.bump(uid))
+        out.append({"name": f"list.{name}", "params": {"size": size, **params}, **_stats(samples)})
+    return out
+
+
+def bench_paging(client, uid, size, repeat):
+    out = []
+    for depth in PAGE_DEPTHS:
+        if (depth - 1) * PAGE_SIZE >= bench_seed.SIZES[size]:
+            break
+        url = f"/api/transactions?include=items&page_size={PAGE_SIZE}&page={depth}"
+        samples = _timed(lambda: _get_ok(client, url), repeat, before=lambda: cache.bump(uid))
+        out.append({"name": "paging.page_number", "params": {"size": size, "depth": depth},
+                    **_stats(samples)})
+
+    # cursor walk: per-page latency at the same depths
+    cursor, page, per_depth = "", 0, {}
+    while cursor is not None and page < max(PAGE_DEPTHS):
+        page += 1
+        cache.bump(uid)
+        t = time.perf_counter()
+        body = _get_ok(client, f"/api/transactions?include=items&page_size={PAGE_SIZE}&cursor={cursor}").get_json()
+        if page in PAGE_DEPTHS:
+            per_depth[page] = time.perf_counter() - t
+        cursor = body.get("next_cursor")
+    for depth, secs in per_depth.items():
+        out.append({"name": "paging.cursor", "params": {"size": size, "depth": depth}, **_stats([secs])})
+    return out
+
+
+def bench_export(client, size, repeat):
+    out = []
+    for fmt, gz in (("csv", False), ("ndjson", False), ("csv", True)):
+        url = f"/api/transactions/export?format={fmt}" + ("&gzip=1" if gz else "")
+        nbytes = 0
+
+        def run():
+            nonlocal nbytes
+            r = client.get(url)
+            nbytes = sum(len(chunk) for chunk in r.response)
+            r.close()
+
+        samples = _timed(run, repeat)
+        rows = bench_seed.SIZES[size]
+        p50 = sorted(samples)[len(samples) // 2]
+        out.append({"name": "export", "params": {"size": size, "format": fmt, "gzip": gz},
+                    "rows_per_s": round(rows / p50), "mb_per_s": round(nbytes / p50 / 1e6, 2),
+                    "bytes": nbytes, **_stats(samples)})
+    return out
+
+
+def bench_parse(data_dir, repeat):
+    from utils import ocr_receipt, pdf_table
+    out = []
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if name.endswith(".pdf"):
+            pages = ocr_receipt.page_count(data)
+            for fn in (pdf_table.parse_tabular_pdf, pdf_table.parse_pdf_pages):
+                samples = [s / pages for s in _timed(lambda: fn(data), repeat)]
+                out.append({"name": f"parse.{fn.__name__}", "params": {"file": name, "pages": pages},
+                            "rows": len(fn(data)) if fn is pdf_table.parse_tabular_pdf else None,
+                            "per": "page", **_stats(samples)})
+        elif name.endswith(".png"):
+            try:
+                samples = _timed(lambda: ocr_receipt.parse_receipt_image_or_pdf(data), repeat)
+            except Exception as e:  # e.g. tesseract binary not installed
+                out.append({"name": "parse.parse_receipt_image_or_pdf", "params": {"file": name},
+                            "skipped": f"{type(e).__name__}: {e}"})
+                continue
+            out.append({"name": "parse.parse_receipt_image_or_pdf", "params": {"file": name},
+                        "per": "page", **_stats(samples)})
+    return out
+
+
+def _meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "mongodb_db": Config.MONGODB_DB,
+        "sizes": args.sizes,
+        "repeat": args.repeat,
+    }
+
+
+def run(args):
+    from app import create_app
+    app = create_app()
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    if args.seed:
+        for size in sizes:
+            if not users.find_one({"email": bench_seed.bench_email(size)}, {"_id": 1}):
+                bench_seed.seed_user(size)
+        if not os.path.isdir(args.data):
+            bench_seed.write_samples(args.data)
+
+    results = []
+    for size in sizes:
+        client, uid = _client(app, size)
+        results += bench_list(client, uid, size, args.repeat)
+        results += bench_paging(client, uid, size, args.repeat)
+        results += bench_export(client, size, max(1, args.repeat // 5))
+    if os.path.isdir(args.data):
+        results += bench_parse(args.data, max(1, args.repeat // 5))
+
+    report = {"meta": _meta(args), "results": results}
+    with open(args.out, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"wrote {len(results)} results to {args.out}")
+    return report
+
+
+def _key(r):
+    return r["name"], json.dumps(r.get("params", {}), sort_keys=True)
+
+
+def compare(base_path, new_path, threshold):
+    """Print p50 changes; returns the list of regressions beyond `threshold` (fraction)."""
+    with open(base_path) as fh:
+        base = {_key(r): r for r in json.load(fh)["results"] if "p50_ms" in r}
+    with open(new_path) as fh:
+        new = {_key(r): r for r in json.load(fh)["results"] if "p50_ms" in r}
+    regressions = []
+    for key in sorted(base.keys() & new.keys()):
+        old_ms, new_ms = base[key]["p50_ms"], new[key]["p50_ms"]
+        change = (new_ms - old_ms) / old_ms if old_ms else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append({"name": key[0], "params": json.loads(key[1]),
+                                "base_p50_ms": old_ms, "new_p50_ms": new_ms, "change": round(change, 3)})
+            flag = "  REGRESSION"
+        print(f"{key[0]:<40} {key[1]:<60} {old_ms:>10.2f} → {new_ms:>10.2f} ms ({change:+.0%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["compare"]:
+        ap = argparse.ArgumentParser(prog="python -m bench.run compare")
+        ap.add_argument("base")
+        ap.add_argument("new")
+        ap.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown (0.2 = 20%%)")
+        args = ap.parse_args(argv[1:])
+        regressions = compare(args.base, args.new, args.threshold)
+        print(f"{len(regressions)} regression(s)")
+        sys.exit(1 if regressions else 0)
+
+    ap = argparse.ArgumentParser(prog="python -m bench.run")
+    ap.add_argument("--sizes", default="10k", help=f"comma list of {','.join(bench_seed.SIZES)}")
+    ap.add_argument("--repeat", type=int, default=20, help="samples per latency case")
+    ap.add_argument("--out", default="bench-results.json")
+    ap.add_argument("--data", default=os.path.join(os.path.dirname(__file__), "data"),
+                    help="sample PDFs / receipt images (from bench.seed)")
+    ap.add_argument("--seed", action="store_true", help="seed missing bench users / sample files first")
+    run(ap.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Synthetic data for the benchmark suite.
+
+    python -m bench.seed --sizes 10k,100k,1m --out bench/data
+
+creates one user per size (bench-<size>@bench.local / password "bench") with a
+realistic transaction history (monthly salary and rent, weighted everyday
+spending with log-normal amounts, a few refunds), rebuilds that user's rollups,
+and writes sample statement PDFs and receipt images to --out. Re-seeding a size
+replaces that user's rows. Point MONGODB_DB at a scratch database.
+"""
+import argparse
+import math
+import os
+import random
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import db
+from db import transactions, users
+from utils import ledger, rollups
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+PASSWORD = "bench"
+INSERT_CHUNK = 5000
+
+# category → (weight, merchants, median amount)
+SPENDING = {
+    "Groceries":     (30, ["Whole Foods Market", "Trader Joe's", "Safeway", "Costco"], 45),
+    "Dining":        (22, ["Starbucks", "Chipotle", "Corner Cafe", "Sushi House", "Pizza Place"], 18),
+    "Transport":     (14, ["Uber Trip", "Lyft Ride", "Shell Gas", "Metro Card"], 22),
+    "Shopping":      (12, ["Amazon Marketplace", "Target", "IKEA", "Best Buy"], 60),
+    "Entertainment": (7,  ["Netflix", "Spotify", "AMC Theatres", "Steam Games"], 15),
+    "Health":        (5,  ["CVS Pharmacy", "City Dental", "Gym Membership"], 40),
+    "Utilities":     (5,  ["PG&E Electric", "Comcast Internet", "Water Utility"], 80),
+    "Travel":        (3,  ["Delta Air Lines", "Marriott Hotel", "Airbnb"], 350),
+}
+_CATS = list(SPENDING)
+_WEIGHTS = [SPENDING[c][0] for c in _CATS]
+
+
+def bench_email(size):
+    return f"bench-{size}@bench.local"
+
+
+def generate(rows, years=None, seed=42, today=None):
+    """`rows` raw transactions (create_transaction payloads), oldest first."""
+    rnd = random.Random(seed)
+    today = today or date.today()
+    # roughly 2-3 rows a day for small users, denser histories for the big sizes
+    years = years or max(1, min(10, math.ceil(rows / 1000)))
+    start = today - timedelta(days=365 * years)
+    days = (today - start).days + 1
+    months = [date(start.year + (start.month - 1 + m) // 12, (start.month - 1 + m) % 12 + 1, 1)
+              for m in range(years * 12 + 1)]
+    fixed = []
+    for m in months:
+        if m <= today:
+            fixed.append({"date": m.isoformat(), "type": "income", "category": "Salary",
+                          "description": "ACME Corp Payroll", "amount": 5200.0})
+            fixed.append({"date": (m + timedelta(days=2)).isoformat(), "type": "expense",
+                          "category": "Rent", "description": "Oakwood Apartments Rent", "amount": 1850.0})
+    fixed = fixed[:max(0, rows // 10)]
+    out = []
+    for _ in range(rows - len(fixed)):
+        d = start + timedelta(days=rnd.randrange(days))
+        if rnd.random() < 0.02:
+            out.append({"date": d.isoformat(), "type": "income", "category": "Refund",
+                        "description": f"Refund {rnd.choice(SPENDING['Shopping'][1])}",
+                        "amount": round(rnd.uniform(5, 120), 2)})
+            continue
+        cat = rnd.choices(_CATS, _WEIGHTS)[0]
+        _, merchants, median = SPENDING[cat]
+        out.append({
+            "date": d.isoformat(),
+            "type": "expense",
+            "category": cat,
+            "description": f"{rnd.choice(merchants)} #{rnd.randrange(100, 999)}",
+            "amount": round(max(1.0, rnd.lognormvariate(math.log(median), 0.6)), 2),
+        })
+    out.extend(fixed)
+    out.sort(key=lambda r: r["date"])
+    return out
+
+
+def seed_user(size, rows=None, seed=42):
+    """(Re)create the bench user for `size` with `rows` transactions. Returns its id."""
+    rows = rows or SIZES[size]
+    db.ensure_indexes()
+    email = bench_email(size)
+    users.update_one({"email": email},
+                     {"$setOnInsert": {"name": f"Bench {size}", "email": email,
+                                       "password": generate_password_hash(PASSWORD)}},
+                     upsert=True)
+    uid = str(users.find_one({"email": email}, {"_id": 1})["_id"])
+    transactions.delete_many({"user_id": uid})
+    batch = []
+    for raw in generate(rows, seed=seed):
+        batch.append(ledger.build_doc(uid, raw))
+        if len(batch) >= INSERT_CHUNK:
+            transactions.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        transactions.insert_many(batch, ordered=False)
+    rollups.rebuild(uid)
+    return uid
+
+
+# ---------- sample files ----------
+def statement_pdf(rows, rows_per_page=30, repeat_header=True):
+    """
+    Ruled statement table (S.No | Date | Description | Category | Type | Amount) as
+    PDF bytes; with repeat_header=False only the first page has the header row.
+    """
+    cols = [40, 75, 145, 345, 445, 500, 572]
+    headers = ["S.No", "Date", "Description", "Category", "Type", "Amount"]
+    pages = []
+    for p in range(0, len(rows), rows_per_page):
+        chunk = rows[p:p + rows_per_page]
+        top, h = 740, 20
+        head = [headers] if repeat_header or p == 0 else []
+        bottom = top - h * (len(chunk) + len(head))
+        ops = ["0.5 w"]
+        for i in range(len(chunk) + len(head) + 1):
+            y = top - h * i
+            ops.append(f"{cols[0]} {y} m {cols[-1]} {y} l S")
+        for x in cols:
+            ops.append(f"{x} {top} m {x} {bottom} l S")
+        cells = head + [
+            [str(p + n + 1), date.fromisoformat(r["date"]).strftime("%d/%m/%Y"), r["description"][:30],
+             r["category"], r["type"], f"{r['amount']:.2f}"]
+            for n, r in enumerate(chunk)
+        ]
+        for i, row in enumerate(cells):
+            y = top - h * i - 14
+            for x, text in zip(cols, row):
+                text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+                ops.append(f"BT /F1 8 Tf {x + 3} {y} Td ({text}) Tj ET")
+        pages.append("\n".join(ops) + "\n")
+    return _pdf(pages)
+
+
+def _pdf(streams):
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for ops in streams:
+        objs.append(f"<< /Length {len(ops)} >>\nstream\n{ops}endstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = "%PDF-1.4\n", []
+    for n, body in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def receipt_png(seed=0):
+    """A printed-receipt style PNG (merchant, date, items, TOTAL) as bytes."""
+    import cv2
+    import numpy as np
+    rnd = random.Random(seed)
+    cat = rnd.choice(_CATS)
+    merchant = rnd.choice(SPENDING[cat][1]).upper()
+    items = [(f"ITEM {rnd.randrange(1000, 9999)}", round(rnd.uniform(1, 40), 2)) for _ in range(rnd.randrange(3, 9))]
+    lines = [merchant, "123 MAIN ST", f"DATE: {date(2024, rnd.randrange(1, 13), rnd.randrange(1, 28)):%d/%m/%Y}", ""]
+    lines += [f"{name:<20}{price:>8.2f}" for name, price in items]
+    lines += ["", f"{'TOTAL':<20}{sum(p for _, p in items):>8.2f}", "THANK YOU"]
+    img = np.full((60 + 36 * len(lines), 640), 255, np.uint8)
+    for n, text in enumerate(lines):
+        cv2.putText(img, text, (30, 50 + 36 * n), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2, cv2.LINE_AA)
+    _, buf = cv2.imencode(".png", img)
+    return buf.tobytes()
+
+
+def write_samples(out_dir, pdf_pages=(1, 5, 20), receipts=5):
+    os.makedirs(out_dir, exist_ok=True)
+    rows = generate(max(pdf_pages) * 30, years=1, seed=7)
+    for n in pdf_pages:
+        with open(os.path.join(out_dir, f"statement_{n}p.pdf"), "wb") as fh:
+            fh.write(statement_pdf(rows[:n * 30]))
+    for i in range(receipts):
+        with open(os.path.join(out_dir, f"receipt_{i}.png"), "wb") as fh:
+            fh.write(receipt_png(i))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", default="10k,100k", help=f"comma list of {','.join(SIZES)}")
+    ap.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "data"),
+                    help="directory for sample PDFs / receipt images")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        if size not in SIZES:
+            ap.error(f"unknown size {size!r}")
+        uid = seed_user(size, seed=args.seed)
+        print(f"seeded {SIZES[size]} rows for {bench_email(size)} ({uid})")
+    write_samples(args.out)
+    print(f"wrote sample files to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,52 @@ class Config:
     SECRET_KEY   = os.getenv("SECRET_KEY", "dev-key-change-me")
     MONGODB_URI  = os.getenv("MONGODB_URI", "")
     MONGODB_DB   = os.getenv("MONGODB_DB", "typeface_finance")
+    # create indexes before the first request (set 0 if deploys run `flask init-db`)
+    DB_ENSURE_INDEXES = os.getenv("DB_ENSURE_INDEXES", "1") == "1"
     CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
-    UPLOAD_DIR = "./uploads"        
-    MAX_CONTENT_LENGTH = 15 * 1024 * 1024  
-    ALLOWED_EXTS = {"png","jpg","jpeg","webp","pdf"}
+    UPLOAD_DIR = "./uploads"        # spool dir for uploads above UPLOAD_SPOOL_THRESHOLD
+    UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(4 * 1024 * 1024)))
+    # request body cap: the /api/imports/parse limit for every route; only
+    # POST /api/imports/statement (multi-year CSV/OFX exports, streamed) accepts
+    # up to STATEMENT_MAX_BYTES (see app.Request)
+    PARSE_MAX_BYTES = 15 * 1024 * 1024
+    MAX_CONTENT_LENGTH = PARSE_MAX_BYTES
+    STATEMENT_MAX_BYTES = int(os.getenv("STATEMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+    ALLOWED_EXTS = {"png","jpg","jpeg","webp","pdf","csv","ofx","qfx"}
+    # process pool for OCR / table extraction in /api/imports/parse (0 = run inline)
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+    # OCR engine: auto | tesserocr | pytesseract (auto prefers tesserocr when installed);
+    # with tesserocr, OCR_WORKERS persistent worker processes keep the model loaded
+    OCR_ENGINE  = os.getenv("OCR_ENGINE", "auto")
+    OCR_LANG    = os.getenv("OCR_LANG", "eng")
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+    OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "30"))  # seconds per page, 0 = none
+    # background import jobs (?async=1): concurrent parses and result retention (seconds)
+    IMPORT_JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+    IMPORT_JOB_TTL     = int(os.getenv("IMPORT_JOB_TTL", "3600"))
+    # rows accepted per POST /api/imports/commit
+    IMPORT_COMMIT_MAX_ROWS = int(os.getenv("IMPORT_COMMIT_MAX_ROWS", "5000"))
+    # content-addressed parse result cache (PARSE_CACHE_DIR empty → memory only)
+    PARSE_CACHE_MAX_ENTRIES    = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "512"))
+    PARSE_CACHE_MAX_BYTES      = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    PARSE_CACHE_DIR            = os.getenv("PARSE_CACHE_DIR", "")
+    PARSE_CACHE_DISK_MAX_BYTES = int(os.getenv("PARSE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+    # serve dashboard totals/series/KPIs from tx_rollups. Off by default: rollups only
+    # count writes made since they were introduced, so enable it once
+    # `flask rebuild-rollups` has backfilled them for existing users
+    ROLLUPS_READ = os.getenv("ROLLUPS_READ", "0") == "1"
+    # reads also accept v1 transaction docs (string dates, float amounts); turn off
+    # once `flask migrate-schema` reports none remaining
+    SCHEMA_READ_V1 = os.getenv("SCHEMA_READ_V1", "1") == "1"
+    # documents per cursor round trip for GET /api/transactions/export
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+    # per-process columnar snapshots behind /api/analytics (users kept, max age in seconds)
+    ANALYTICS_MAX_USERS = int(os.getenv("ANALYTICS_MAX_USERS", "64"))
+    ANALYTICS_TTL       = int(os.getenv("ANALYTICS_TTL", "900"))
+    # dashboard response cache: memory | redis | none
+    CACHE_BACKEND     = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_URL         = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+    CACHE_TTL         = int(os.getenv("CACHE_TTL", "300"))
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+    CACHE_MAX_BYTES   = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
 
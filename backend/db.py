@@ -1,13 +1,139 @@
+"""
+MongoDB handles.
+
+Nothing here touches the network at import time: the client is created on
+first use (with connect=False, so even that does not block), and the
+collection names below are lightweight handles that resolve on first
+attribute access. Indexes are created by `ensure_indexes()`, which runs once
+per process before the first request (DB_ENSURE_INDEXES=1) or from
+`flask init-db` during deploys. After a failed attempt (Mongo unreachable) it
+is not retried for INDEX_RETRY_SECONDS, so requests do not each wait out the
+server-selection timeout again.
+"""
+import threading
+import time
+
 from pymongo import MongoClient, ASCENDING, DESCENDING
 from config import Config
+from utils import metrics
+
+client = None
+db = None  # set on first use (tests may assign their own Database first)
+_lock = threading.Lock()
+_index_lock = threading.Lock()
+_indexed = False
+_index_failed_at = None
+INDEX_RETRY_SECONDS = 60
+
+
+def get_client():
+    global client
+    if client is None:
+        with _lock:
+            if client is None:
+                client = MongoClient(Config.MONGODB_URI, connect=False,
+                                     event_listeners=[metrics.CommandTimer()])
+    return client
+
+
+def get_db():
+    global db
+    if db is None:
+        db = get_client()[Config.MONGODB_DB]
+    return db
+
+
+class _LazyCollection:
+    """Stands in for a Collection until first use, then forwards to it."""
+
+    def __init__(self, name):
+        self._name = name
+        self._coll = None
+
+    def _resolve(self):
+        if self._coll is None:
+            self._coll = get_db()[self._name]
+        return self._coll
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __repr__(self):
+        return f"<lazy collection {self._name!r}>"
+
+
+users = _LazyCollection("users")
+transactions = _LazyCollection("transactions")
+monthly_rollups = _LazyCollection("tx_rollups")
+import_jobs = _LazyCollection("import_jobs")
+
+# serves the newest-first item order (user_id, date desc, _id desc) of list
+# pages, cursor pages and exports without an in-memory sort
+ITEM_INDEX = [("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)]
+
+# (collection, keys, options) — created by ensure_indexes()
+INDEXES = [
+    (users, "email", {"unique": True}),
+    (transactions, ITEM_INDEX, {}),
+    (transactions, [("user_id", ASCENDING), ("category", ASCENDING)], {}),
+    (transactions, [("user_id", ASCENDING), ("description", ASCENDING)], {}),
+    (transactions, [("user_id", ASCENDING), ("search_tokens", ASCENDING)], {}),
+    # duplicate detection: (user_id, fingerprint) lookups per import batch
+    (transactions, [("user_id", ASCENDING), ("fingerprint", ASCENDING)], {}),
+    # idempotency keys of bulk-committed import rows
+    (transactions, [("user_id", ASCENDING), ("import_key", ASCENDING)],
+     {"unique": True, "partialFilterExpression": {"import_key": {"$exists": True}}}),
+    (monthly_rollups,
+     [("user_id", ASCENDING), ("month", ASCENDING), ("type", ASCENDING), ("category", ASCENDING)],
+     {"unique": True}),
+    (import_jobs, "expires_at", {"expireAfterSeconds": 0}),
+    (import_jobs, [("user_id", ASCENDING), ("created_at", DESCENDING)], {}),
+]
+
+
+def _settled():
+    recent_failure = (_index_failed_at is not None
+                      and time.monotonic() - _index_failed_at < INDEX_RETRY_SECONDS)
+    return _indexed or recent_failure
+
+
+def ensure_indexes(force=False):
+    """
+    Create all indexes (idempotent on the server). No-op after the first success
+    and within INDEX_RETRY_SECONDS of a failure, unless `force`.
+    """
+    global _indexed, _index_failed_at
+    if _settled() and not force:
+        return False
+    with _index_lock:
+        if _settled() and not force:
+            return False
+        try:
+            for coll, keys, options in INDEXES:
+                coll.create_index(keys, **options)
+        except Exception:
+            _index_failed_at = time.monotonic()
+            raise
+        _indexed, _index_failed_at = True, None
+    return True
+
 
-client = MongoClient(Config.MONGODB_URI)
-db = client[Config.MONGODB_DB]
+_present = set()
 
-users = db["users"]
-transactions = db["transactions"]
 
-users.create_index("email", unique=True)
-transactions.create_index([("user_id", ASCENDING), ("date", DESCENDING)])
-transactions.create_index([("user_id", ASCENDING), ("category", ASCENDING)])
-transactions.create_index([("user_id", ASCENDING), ("description", ASCENDING)])
+def has_index(coll, keys):
+    """
+    True if `keys` is known to exist on `coll`: created by this process, or seen
+    on the server (flask init-db). Positive answers are remembered.
+    """
+    name = (coll.full_name, tuple(keys))
+    if _indexed or name in _present:
+        return True
+    specs = coll.index_information().values()
+    if any([tuple(k) for k in spec["key"]] == list(keys) for spec in specs):
+        _present.add(name)
+        return True
+    return False
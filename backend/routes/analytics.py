@@ -0,0 +1,53 @@
+from datetime import date
+from flask import Blueprint, request, jsonify
+
+from utils import identity
+
+bp = Blueprint("analytics", __name__, url_prefix="/api/analytics")
+
+# ---------- helpers ----------
+def _uid():
+    return identity.user_id()
+
+def _as_of():
+    raw = (request.args.get("as_of") or "").strip()
+    if not raw:
+        return date.today()
+    return date.fromisoformat(raw[:10])
+
+def _int_arg(name, default, lo, hi):
+    return max(lo, min(hi, int(request.args.get(name, default))))
+
+def _run(metric, **limits):
+    """Resolve user, as_of and bounded int args, then run analytics.<metric>(snapshot, as_of, **args)."""
+    uid = _uid()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        as_of = _as_of()
+        args = {name: _int_arg(name, *spec) for name, spec in limits.items()}
+    except ValueError:
+        return jsonify({"error": "as_of must be YYYY-MM-DD; numeric args must be integers"}), 400
+    from utils import analytics  # numpy: loaded on first analytics request, not at app start
+    return jsonify(getattr(analytics, metric)(analytics.get(uid), as_of, **args))
+
+# ---------- API ----------
+@bp.get("/rolling")
+def rolling():
+    """Daily income/expense with trailing means (?days=90&window=30)."""
+    return _run("rolling", days=(90, 1, 1095), window=(30, 1, 365))
+
+@bp.get("/categories")
+def category_trends():
+    """Monthly expense per category with a trend slope (?months=6&top=10)."""
+    return _run("category_trends", months=(6, 1, 60), top=(10, 1, 100))
+
+@bp.get("/recurring")
+def recurring():
+    """Merchants charged on a regular cadence (?lookback_days=400)."""
+    return _run("recurring", lookback_days=(400, 30, 3650))
+
+@bp.get("/forecast")
+def forecast():
+    """Month-end income/expense projection (?baseline_days=90)."""
+    return _run("forecast", baseline_days=(90, 7, 730))
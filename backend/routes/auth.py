@@ -1,19 +1,14 @@
 from flask import Blueprint, request, jsonify, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from db import users
-from pymongo.errors import PyMongoError
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from utils import identity
 
 # Blueprint for authentication routes
 bp = Blueprint("auth", __name__, url_prefix="/api/auth")
 
 # Utility: Strip private fields when returning a user
-def _public_user(u):
-    """
-    Convert a MongoDB user document into a safe public dictionary
-    - Excludes password hash
-    - Converts _id (ObjectId) into string
-    """
-    return {"id": str(u["_id"]), "name": u.get("name", ""), "email": u["email"]}
+_public_user = identity.public_user
 
 
 @bp.post("/signup")
@@ -33,10 +28,6 @@ def signup():
         if not name or not email or not password:
             return jsonify({"error": "name, email, password are required"}), 400
 
-        # Ensure uniqueness
-        if users.find_one({"email": email}):
-            return jsonify({"error": "Email already in use"}), 409
-
         # Hash password before storing
         doc = {
             "name": name,
@@ -44,16 +35,16 @@ def signup():
             "password": generate_password_hash(password),
         }
 
-        res = users.insert_one(doc)
-        u = users.find_one({"_id": res.inserted_id})
+        # Single write: the unique email index rejects taken addresses
+        try:
+            users.insert_one(doc)  # sets doc["_id"]
+        except DuplicateKeyError:
+            return jsonify({"error": "Email already in use"}), 409
 
-        # Start a session
-        session.clear()
-        session["user_id"] = str(u["_id"])
-        session["email"] = u["email"]
-        session.permanent = True  # make cookie persistent
+        # Start a session (carries the public profile, see utils.identity)
+        identity.start_session(doc)
 
-        return jsonify({"user": _public_user(u)}), 201
+        return jsonify({"user": _public_user(doc)}), 201
 
     except PyMongoError as e:
         # Database errors
@@ -81,10 +72,7 @@ def login():
             return jsonify({"error": "Invalid email or password"}), 401
 
         # Start session
-        session.clear()
-        session["user_id"] = str(u["_id"])
-        session["email"] = u["email"]
-        session.permanent = True
+        identity.start_session(u)
 
         return jsonify({"user": _public_user(u)})
 
@@ -110,14 +98,10 @@ def logout():
 def me():
     """
     Get the currently logged-in user's public profile.
-    Uses session cookie.
+    Served from the signed session cookie, no database read.
     """
     try:
-        if "user_id" not in session:
-            return jsonify({"user": None}), 200
-
-        u = users.find_one({"email": session.get("email")})
-        return jsonify({"user": _public_user(u) if u else None}), 200
+        return jsonify({"user": identity.current_user()}), 200
     except PyMongoError as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
     except Exception as e:
@@ -1,19 +1,14 @@
 import os
-import uuid
-from datetime import datetime
-from werkzeug.utils import secure_filename
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, jsonify, current_app
 
-from db import transactions
 from bson.objectid import ObjectId
 
-from utils.ocr_receipt import parse_receipt_image_or_pdf
-from utils.pdf_table import parse_tabular_pdf
+from utils import identity, import_jobs, import_pipeline, ledger, statement_import
 
 bp = Blueprint("imports", __name__, url_prefix="/api/imports")
 
 def _user_id():
-    uid = session.get("user_id")
+    uid = identity.user_id()
     if not uid:
         return None
     return ObjectId(uid)
@@ -24,7 +19,11 @@ def _allowed(filename):
 
 @bp.post("/parse")
 def parse_upload():
-    """Accept one or more files, auto-detect type, return candidate txns (not committed)."""
+    """
+    Accept one or more files, auto-detect type, return candidate txns (not committed).
+    Rows that look like already-stored transactions come back with duplicate=True.
+    With ?async=1 the parse runs as a background job: returns 202 {job_id} to poll.
+    """
     uid = _user_id()
     if not uid:
         return jsonify({"error":"Unauthorized"}), 401
@@ -38,60 +37,96 @@ def parse_upload():
 
     os.makedirs(current_app.config["UPLOAD_DIR"], exist_ok=True)
 
-    all_candidates = []
-    for f in files:
-        if not f.filename or not _allowed(f.filename):
-            continue
-
-        # Save to temp path
-        fname = f"{uuid.uuid4().hex}_{secure_filename(f.filename)}"
-        fpath = os.path.join(current_app.config["UPLOAD_DIR"], fname)
-        f.save(fpath)
-
-        ext = fname.split(".")[-1].lower()
-        try:
-            if ext == "pdf":
-                # Heuristic: try to parse as table first; if no rows, treat pages as images (OCR)
-                rows = parse_tabular_pdf(fpath)
-                if rows:
-                    # normalize to unified schema
-                    for r in rows:
-                        all_candidates.append({
-                            "date": r.get("date"),
-                            "type": r.get("type"),
-                            "category": r.get("category") or "",  # user can adjust
-                            "description": r.get("description") or "",
-                            "amount": float(r.get("amount") or 0),
-                            "_source": {"file": f.filename, "mode": "pdf_table"}
-                        })
-                else:
-                    ocr_items = parse_receipt_image_or_pdf(fpath)  # it can handle pdf->images
-                    for it in ocr_items:
-                        all_candidates.append({
-                            "date": it.get("date"),
-                            "type": it.get("type") or "expense",
-                            "category": it.get("category") or "",
-                            "description": it.get("description") or "",
-                            "amount": float(it.get("amount") or 0),
-                            "_source": {"file": f.filename, "mode": "ocr_pdf"}
-                        })
-            else:
-                # image types → OCR
-                ocr_items = parse_receipt_image_or_pdf(fpath)
-                for it in ocr_items:
-                    all_candidates.append({
-                        "date": it.get("date"),
-                        "type": it.get("type") or "expense",
-                        "category": it.get("category") or "",
-                        "description": it.get("description") or "",
-                        "amount": float(it.get("amount") or 0),
-                        "_source": {"file": f.filename, "mode": "ocr_image"}
-                    })
-        finally:
-            # clean up temp file
-            try: os.remove(fpath)
-            except: pass
-
-    # Basic sanitization: drop empties
-    all_candidates = [c for c in all_candidates if c.get("amount")]
+    async_mode = (request.args.get("async") or "").lower() in ("1", "true", "yes")
+
+    uploads = []  # (original filename, bytes or spooled file, ext) in upload order
+    try:
+        for f in files:
+            if not f.filename or not _allowed(f.filename):
+                continue
+
+            # Keep small uploads in memory; spool big ones to an anonymous temp file
+            src = import_pipeline.spool_upload(f.stream,
+                                               current_app.config["UPLOAD_SPOOL_THRESHOLD"],
+                                               current_app.config["UPLOAD_DIR"])
+            uploads.append((f.filename, src, f.filename.rsplit(".", 1)[-1].lower()))
+
+        if async_mode:
+            import_jobs.cleanup()
+            job_id = import_jobs.submit(uid, uploads)
+            uploads = []  # the job owns the spooled files now
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+        all_candidates = import_pipeline.parse_uploads(uploads)
+        ledger.flag_duplicates(str(uid), all_candidates)
+    finally:
+        import_pipeline.close_uploads(uploads)
+
     return jsonify({"items": all_candidates})
+
+
+@bp.post("/commit")
+def commit_candidates():
+    """
+    Write reviewed candidates in bulk. Expects JSON {items: [...]} where every row
+    carries the `idempotency_key` handed out by /parse (or one of the client's own),
+    so a retried commit never double-inserts. Rows whose fingerprint matches a stored
+    transaction are skipped unless they set `allow_duplicate`. Returns per-row results.
+    """
+    uid = _user_id()
+    if not uid:
+        return jsonify({"error":"Unauthorized"}), 401
+
+    items = (request.get_json(silent=True) or {}).get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error":"items must be a non-empty list"}), 400
+    if len(items) > current_app.config["IMPORT_COMMIT_MAX_ROWS"]:
+        return jsonify({"error":f"at most {current_app.config['IMPORT_COMMIT_MAX_ROWS']} rows per commit"}), 413
+
+    results = ledger.commit_rows(str(uid), items)  # transactions keep user_id as a string
+    counts = {s: 0 for s in ("inserted", "duplicate", "invalid", "error")}
+    for r in results:
+        counts[r["status"]] += 1
+    return jsonify({"results": results, **counts})
+
+@bp.post("/statement")
+def import_statement():
+    """
+    Stream a bank CSV/OFX/QFX export (multipart field `file`) straight into the
+    ledger in batches, without a review step. Idempotent: re-importing the same
+    export writes nothing new. Returns row counts.
+    """
+    uid = _user_id()
+    if not uid:
+        return jsonify({"error":"Unauthorized"}), 401
+
+    f = request.files.get("file")
+    if not f or not f.filename:
+        return jsonify({"error":"No file uploaded"}), 400
+    ext = f.filename.rsplit(".", 1)[-1].lower()
+    if ext not in statement_import.FORMATS:
+        return jsonify({"error":f"file must be one of {','.join(statement_import.FORMATS)}"}), 400
+
+    # werkzeug has already spooled a large upload to disk; rows are read off that stream
+    return jsonify(statement_import.commit_stream(str(uid), f.stream, ext))
+
+@bp.get("/jobs/<job_id>")
+def get_job(job_id):
+    """Status, page progress and (once done) the candidate rows of an async parse."""
+    uid = _user_id()
+    if not uid:
+        return jsonify({"error":"Unauthorized"}), 401
+    job = import_jobs.get(job_id, uid)
+    if not job:
+        return jsonify({"error":"Job not found"}), 404
+    return jsonify(job)
+
+@bp.delete("/jobs/<job_id>")
+def delete_job(job_id):
+    """Cancel (if running) and forget an async parse."""
+    uid = _user_id()
+    if not uid:
+        return jsonify({"error":"Unauthorized"}), 401
+    if not import_jobs.delete(job_id, uid):
+        return jsonify({"error":"Job not found"}), 404
+    return jsonify({"ok": True})
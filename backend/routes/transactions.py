@@ -1,38 +1,75 @@
-from flask import Blueprint, request, jsonify, session
-from datetime import datetime, date, timedelta
-from pymongo import DESCENDING
+from flask import Blueprint, request, jsonify, current_app
+from datetime import date, timedelta
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
 from db import transactions
+from utils.dashboard import SECTIONS, parse_include, run_dashboard, fetch_after
+from utils import cache, export, identity, ledger, rollups, schema, search
+from utils.ledger import norm_date_str as _norm_date_str
 
 bp = Blueprint("transactions", __name__, url_prefix="/api/transactions")
 
+# ids per bulk request (one $in); larger edits go through a filter
+MAX_BULK_IDS = 10000
+
 # ---------- helpers ----------
 def _uid():
-    uid = session.get("user_id")
-    return str(uid) if uid else None
-
-def _norm_date_str(x):
-    # accept datetime/date/str and return 'YYYY-MM-DD' or None
-    if isinstance(x, (datetime, date)):
-        return x.isoformat()[:10]
-    if isinstance(x, str):
-        return x[:10] if len(x) >= 10 else None
-    return None
+    return identity.user_id()
 
 def _pages(total, size):
     return (total + size - 1) // size if size > 0 else 1
 
 def _build_filter(uid, start=None, end=None, cat=None, q=None):
-    f = {"user_id": uid}
-    if start:
-        f["date"] = {"$gte": start}
-    if end:
-        f.setdefault("date", {}).update({"$lte": end})
+    f = {"user_id": uid, **schema.date_clause(start, end)}
     if cat:
         f["category"] = cat
     if q:
-        f["description"] = {"$regex": q, "$options": "i"}
+        f.update(search.query_filter(q))
     return f
 
+def _item(doc):
+    return {
+        "id": str(doc["_id"]),
+        "date": schema.date_str(doc),
+        "description": doc.get("description", ""),
+        "type": doc.get("type", "expense"),
+        "category": doc.get("category", ""),
+        "amount": schema.amount(doc)
+    }
+
+def _bad_dates(*days):
+    return any(d and schema.to_date(d) is None for d in days)
+
+def _oid(tx_id):
+    try:
+        return ObjectId(tx_id)
+    except (InvalidId, TypeError):
+        return None
+
+def _bulk_target(uid, data):
+    """
+    (filter, error) for a bulk request body: {"ids": [...]} or {"filter": {start,
+    end, category, q}} with the list's semantics ({} matches every transaction).
+    """
+    ids, flt = data.get("ids"), data.get("filter")
+    if (ids is None) == (flt is None):
+        return None, "provide either ids or filter"
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) > MAX_BULK_IDS:
+            return None, f"ids must be a list of at most {MAX_BULK_IDS} transaction ids"
+        oids = [_oid(i) for i in ids]
+        if None in oids:
+            return None, "ids must be transaction ids"
+        return {"user_id": uid, "_id": {"$in": oids}}, None
+    if not isinstance(flt, dict):
+        return None, "filter must be an object"
+    start, end = _norm_date_str(flt.get("start")), _norm_date_str(flt.get("end"))
+    if _bad_dates(start, end):
+        return None, "start/end must be YYYY-MM-DD"
+    return _build_filter(uid, start, end, (flt.get("category") or "").strip(),
+                         (flt.get("q") or "").strip()), None
+
 # ---------- API ----------
 @bp.get("")
 def list_transactions():
@@ -47,130 +84,139 @@ def list_transactions():
     cat     = (request.args.get("category") or "").strip()
     page    = max(1, int(request.args.get("page", 1)))
     size    = max(1, min(200, int(request.args.get("page_size", 20))))
+    # keyset mode: `?cursor=` (empty → first page) or the `next_cursor` of the previous page
+    cursor  = request.args.get("cursor")
 
-    # base filter for current list/summary
-    cur_filter = _build_filter(uid, start, end, cat, q)
-
-    # ---- paged items ----
-    total = transactions.count_documents(cur_filter)
-    cursor = (transactions.find(cur_filter)
-              .sort("date", DESCENDING)
-              .skip((page-1)*size)
-              .limit(size))
-
-    items = []
-    for doc in cursor:
-        items.append({
-            "id": str(doc["_id"]),
-            "date": _norm_date_str(doc.get("date")),
-            "description": doc.get("description", ""),
-            "type": doc.get("type", "expense"),
-            "category": doc.get("category", ""),
-            "amount": float(doc.get("amount", 0))
-        })
-
-    # ---- totals under current filters (all pages) ----
-    pipeline_totals = [
-        {"$match": cur_filter},
-        {"$group": {"_id": "$type", "total": {"$sum": "$amount"}}}
-    ]
-    agg = {row["_id"]: float(row["total"]) for row in transactions.aggregate(pipeline_totals)}
-    total_income = float(agg.get("income", 0.0))
-    total_expense = float(agg.get("expense", 0.0))
-    totals = {
-        "income": total_income,
-        "expense": total_expense,
-        "net": total_income - total_expense
-    }
+    if _bad_dates(start, end):
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+
+    include = parse_include(request.args.get("include"))
+    if include is None:
+        return jsonify({"error": f"include must be a subset of {','.join(SECTIONS)}"}), 400
 
-    # ---- server-side series so charts match KPIs exactly ----
-    # by month (YYYY-MM) within the current filter window
-    by_month_pipeline = [
-        {"$match": cur_filter},
-        {"$addFields": {"month": {"$substr": ["$date", 0, 7]}}},
-        {"$group": {
-            "_id": "$month",
-            "income":  {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount", 0]}},
-            "expense": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount", 0]}},
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-    by_month = []
-    for r in transactions.aggregate(by_month_pipeline):
-        by_month.append({
-            "month": r["_id"],
-            "income": float(r.get("income", 0)),
-            "expense": float(r.get("expense", 0))
-        })
-
-    # expenses by category within the current filter window
-    by_category_pipeline = [
-        {"$match": {**cur_filter, "type": "expense"}},
-        {"$group": {
-            "_id": {"$ifNull": ["$category", "Uncategorized"]},
-            "total": {"$sum": "$amount"}
-        }},
-        {"$sort": {"total": -1}}
-    ]
-    by_category = []
-    for r in transactions.aggregate(by_category_pipeline):
-        by_category.append({
-            "category": r["_id"],
-            "total": float(r.get("total", 0))
-        })
-
-    series = {"by_month": by_month, "by_category": by_category}
-
-    # ---- MoM deltas (compare current vs previous month) ----
-    # IMPORTANT: apply the SAME non-date filters (category + q) so MoM aligns with what user is viewing,
-    # but we set our own date windows for the comparison.
+    # MoM compares current vs previous calendar month with the SAME non-date filters
+    # (category + q) so it aligns with what the user is viewing.
     today = date.today()
     cur_start = today.replace(day=1)  # current month start
     prev_end = cur_start - timedelta(days=1)
     prev_start = prev_end.replace(day=1)
-
-    base_filter_mom = _build_filter(uid, None, None, cat, q)  # include cat + q, exclude start/end
-    cur_month_filter = {**base_filter_mom,
-                        "date": {"$gte": _norm_date_str(cur_start), "$lte": _norm_date_str(today)}}
-    prev_month_filter = {**base_filter_mom,
-                         "date": {"$gte": _norm_date_str(prev_start), "$lte": _norm_date_str(prev_end)}}
-
-    def _sum_by_type(flt):
-        p = [
-            {"$match": flt},
-            {"$group": {"_id": "$type", "total": {"$sum": "$amount"}}}
-        ]
-        d = {r["_id"]: float(r["total"]) for r in transactions.aggregate(p)}
-        return d.get("income", 0.0), d.get("expense", 0.0)
-
-    cur_inc, cur_exp = _sum_by_type(cur_month_filter)
-    prev_inc, prev_exp = _sum_by_type(prev_month_filter)
-
-    def _pct(cur, prev):
-        if prev <= 0 and cur <= 0: return 0.0
-        if prev == 0: return 100.0  # from 0 to positive — treat as +100%
-        return ((cur - prev) / prev) * 100.0
-
-    kpis = {
-        "income": totals["income"],
-        "expense": totals["expense"],
-        "net": totals["net"],
-        "mom_income_pct": _pct(cur_inc, prev_inc),
-        "mom_expense_pct": _pct(cur_exp, prev_exp),
-        "cur_month_income": cur_inc,
-        "cur_month_expense": cur_exp,
-        "prev_month_income": prev_inc,
-        "prev_month_expense": prev_exp,
+    mom = {
+        "cur_start": _norm_date_str(cur_start),
+        "today": _norm_date_str(today),
+        "prev_start": _norm_date_str(prev_start),
     }
 
-    return jsonify({
-        "items": items,
-        "total": total,
-        "pages": _pages(total, size),
-        "totals": totals,
-        "kpis": kpis,
-        "series": series
+    # versioned response cache: any write for this user bumps the version
+    cache_key = cache.make_key("tx_list", uid, {
+        "q": search.tokenize(q), "start": start, "end": end, "category": cat,
+        "page": page, "size": size, "cursor": cursor, "include": sorted(include),
+        "today": mom["today"],
     })
+    hit = cache.get(cache_key)
+    if hit is not None:
+        return current_app.response_class(hit, mimetype="application/json")
+
+    # date window for the list/summary; category + q apply to every section
+    base_filter = _build_filter(uid, None, None, cat, q)
+    date_range = schema.date_clause(start, end)
+
+    out = {}
+    if cursor is not None and "items" in include:
+        # items walk the (user_id, date) index from the cursor; only the
+        # summary sections go through the aggregate
+        try:
+            docs, next_cursor = fetch_after(transactions, base_filter, date_range,
+                                            cursor or None, limit=size)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        out["items"] = [_item(doc) for doc in docs]
+        out["next_cursor"] = next_cursor
+        include = include - {"items"}
+
+    # whole-month windows without free text are answered from the monthly rollups;
+    # anything else takes one aggregate round trip for every (remaining) section
+    res = {}
+    if (include - {"items"} and not q and current_app.config.get("ROLLUPS_READ")
+            and rollups.covers_whole_months(start, end)):
+        res = rollups.dashboard(uid, cat, start, end, mom, include)
+        include_raw = include & {"items"}
+    else:
+        include_raw = include
+    if include_raw:
+        res.update(run_dashboard(transactions, base_filter, date_range, mom, include_raw,
+                                 skip=(page-1)*size, limit=size))
+
+    if "items" in include:
+        out["items"] = [_item(doc) for doc in res["items"]]
+
+    if "total" in include:
+        out["total"] = res["total"]
+        out["pages"] = _pages(res["total"], size)
+
+    if "totals" in include:
+        out["totals"] = res["totals"]
+
+    if "series" in include:
+        out["series"] = {"by_month": res["by_month"], "by_category": res["by_category"]}
+
+    if "kpis" in include:
+        totals, m = res["totals"], res["mom"]
+
+        def _pct(cur, prev):
+            if prev <= 0 and cur <= 0: return 0.0
+            if prev == 0: return 100.0  # from 0 to positive — treat as +100%
+            return ((cur - prev) / prev) * 100.0
+
+        out["kpis"] = {
+            "income": totals["income"],
+            "expense": totals["expense"],
+            "net": totals["net"],
+            "mom_income_pct": _pct(m["cur_income"], m["prev_income"]),
+            "mom_expense_pct": _pct(m["cur_expense"], m["prev_expense"]),
+            "cur_month_income": m["cur_income"],
+            "cur_month_expense": m["cur_expense"],
+            "prev_month_income": m["prev_income"],
+            "prev_month_expense": m["prev_expense"],
+        }
+
+    resp = jsonify(out)
+    cache.set(cache_key, resp.get_data())
+    return resp
+
+
+@bp.get("/export")
+def export_transactions():
+    """
+    Stream every matching transaction as CSV or NDJSON (?format=csv|ndjson),
+    with the same q/start/end/category filters as the list. ?gzip=1 compresses
+    the stream on the fly.
+    """
+    uid = _uid()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"format must be one of {','.join(export.FORMATS)}"}), 400
+    gz = (request.args.get("gzip") or "").lower() in ("1", "true", "yes")
+
+    start = _norm_date_str(request.args.get("start"))
+    end = _norm_date_str(request.args.get("end"))
+    if _bad_dates(start, end):
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+    flt = _build_filter(uid, start, end,
+                        (request.args.get("category") or "").strip(),
+                        (request.args.get("q") or "").strip())
+    try:
+        body = export.stream(transactions, flt, fmt, current_app.config["EXPORT_BATCH_SIZE"], gzip=gz)
+    except PyMongoError as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    resp = current_app.response_class(body, mimetype=export.FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f"attachment; filename=transactions.{fmt}"
+    if gz:
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
 
 
 @bp.post("")
@@ -181,16 +227,74 @@ def create_transaction():
 
     data = request.get_json(silent=True) or {}
     try:
-        doc = {
-            "user_id": uid,  # keep as string id
-            "date": _norm_date_str(data.get("date")),
-            "type": "income" if (data.get("type") == "income") else "expense",
-            "category": (data.get("category") or "").strip() or "Uncategorized",
-            "description": (data.get("description") or "").strip(),
-            "amount": float(data.get("amount") or 0.0),
-            "created_at": datetime.utcnow(),
-        }
-        res = transactions.insert_one(doc)
-        return jsonify({"id": str(res.inserted_id)}), 201
+        doc = ledger.build_doc(uid, data)
+        inserted_id = ledger.insert_one(uid, doc)
+        return jsonify({"id": str(inserted_id)}), 201
     except Exception as e:
         return jsonify({"error": "Insert failed", "detail": str(e)}), 400
+
+
+@bp.put("/<tx_id>")
+def update_transaction(tx_id):
+    """Change any of date/type/category/description/amount of one transaction."""
+    uid = _uid()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    oid = _oid(tx_id)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON object body required"}), 400
+    try:
+        doc = ledger.update_one(uid, oid, data) if oid else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if doc is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"item": _item(doc)})
+
+
+@bp.delete("/<tx_id>")
+def delete_transaction(tx_id):
+    uid = _uid()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    oid = _oid(tx_id)
+    if not (oid and ledger.delete_one(uid, oid)):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"deleted": 1})
+
+
+@bp.put("")
+def recategorize_transactions():
+    """
+    Bulk recategorize: {"category": ..., "ids": [...]} or {"category": ...,
+    "filter": {...}}. A few round trips however many rows match; returns
+    {"updated": #rows changed}.
+    """
+    uid = _uid()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True) or {}
+    category = data.get("category")
+    if not isinstance(category, str) or not category.strip():
+        return jsonify({"error": "category is required"}), 400
+    flt, err = _bulk_target(uid, data)
+    if err:
+        return jsonify({"error": err}), 400
+    return jsonify({"updated": ledger.recategorize(uid, flt, category)})
+
+
+@bp.delete("")
+def delete_transactions():
+    """Bulk delete: {"ids": [...]} or {"filter": {...}}; returns {"deleted": #rows}."""
+    uid = _uid()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    flt, err = _bulk_target(uid, request.get_json(silent=True) or {})
+    if err:
+        return jsonify({"error": err}), 400
+    return jsonify({"deleted": ledger.delete_matching(uid, flt)})
@@ -24,7 +24,7 @@ def mock_db():
     users = mdb["users"]
     transactions = mdb["transactions"]
     users.create_index("email", unique=True)
-    transactions.create_index([("user_id", 1), ("date", -1)])
+    transactions.create_index([("user_id", 1), ("date", -1), ("_id", -1)])
     transactions.create_index([("user_id", 1), ("category", 1)])
     transactions.create_index([("user_id", 1), ("description", 1)])
     return types.SimpleNamespace(db=mdb, users=users, transactions=transactions)
@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+
+def _login(client):
+    client.post("/api/auth/signup", json={"name": "A", "email": "analytics@test.com", "password": "pw"})
+    client.post("/api/auth/login", json={"email": "analytics@test.com", "password": "pw"})
+
+
+def _post(client, d, amount, category, description, typ="expense"):
+    r = client.post("/api/transactions", json={"date": d.isoformat(), "type": typ, "category": category,
+                                                "description": description, "amount": amount})
+    assert r.status_code == 201
+
+
+def test_analytics_endpoints_and_incremental_snapshot(client):
+    from utils import analytics
+    _login(client)
+    for m in range(1, 7):  # rent on the 1st, salary on the 2nd, Jan..Jun
+        _post(client, date(2030, m, 1), 1500, "Rent", "Oakwood Rent #%d" % m)
+        _post(client, date(2030, m, 2), 4000, "Salary", "ACME Payroll", "income")
+    for w in range(20):  # weekly coffee subscription
+        _post(client, date(2030, 2, 1) + timedelta(days=7 * w), 12.5, "Dining", "Bean Club %d" % w)
+    _post(client, date(2030, 6, 10), 99.99, "Shopping", "One-off Store")
+
+    r = client.get("/api/analytics/recurring?as_of=2030-06-15")
+    assert r.status_code == 200
+    rec = {x["merchant"]: x for x in r.get_json()["recurring"]}
+    assert rec["oakwood rent"]["cadence"] == "monthly" and rec["oakwood rent"]["amount"] == 1500.0
+    assert rec["bean club"]["cadence"] == "weekly" and rec["bean club"]["count"] == 20
+    assert "one off store" not in rec and "acme payroll" not in rec  # single row / income
+
+    fc = client.get("/api/analytics/forecast?as_of=2030-06-15").get_json()
+    assert fc["month"] == "2030-06" and fc["days_left"] == 15
+    assert fc["income"]["month_to_date"] == 4000.0
+    # baseline: Mar 3..May 31 = 2 rents + 13 coffees over 90 days
+    assert fc["expense"]["daily_rate"] == round((2 * 1500 + 13 * 12.5) / 90, 2)
+
+    roll = client.get("/api/analytics/rolling?as_of=2030-06-15&days=10&window=7").get_json()
+    assert len(roll["days"]) == 10 and roll["days"][-1] == "2030-06-15"
+    assert roll["expense"][roll["days"].index("2030-06-10")] == 99.99
+    assert roll["rolling_expense"][-1] == round((99.99 + 12.5) / 7, 2)
+
+    cats = client.get("/api/analytics/categories?as_of=2030-06-15&months=3").get_json()
+    assert cats["months"] == ["2030-04", "2030-05", "2030-06"]
+    by_cat = {c["category"]: c for c in cats["categories"]}
+    assert by_cat["Rent"]["monthly"] == [1500.0, 1500.0, 1500.0] and by_cat["Rent"]["slope"] == 0.0
+    assert "Salary" not in by_cat
+
+    # a write bumps the data version: the next read appends only the new row
+    before = analytics.stats()
+    _post(client, date(2030, 6, 12), 50, "Shopping", "Another Store")
+    fc2 = client.get("/api/analytics/forecast?as_of=2030-06-15").get_json()
+    after = analytics.stats()
+    assert after["catchups"] == before["catchups"] + 1 and after["loads"] == before["loads"]
+    assert fc2["expense"]["month_to_date"] == round(fc["expense"]["month_to_date"] + 50, 2)
+
+    assert client.get("/api/analytics/forecast?as_of=nope").status_code == 400
+
+
+def test_catch_up_accounts_for_rows_without_a_usable_date(app):
+    from bson import ObjectId
+    from db import transactions
+    from utils import analytics
+    uid = "undated-analytics-user"
+    transactions.insert_many([
+        {"_id": ObjectId(), "user_id": uid, "date": "sometime in May", "type": "expense",
+         "category": "Misc", "description": "v1 row", "amount": 5.0},
+        {"_id": ObjectId(), "user_id": uid, "date": "2030-05-04", "type": "expense",
+         "category": "Misc", "description": "v1 dated", "amount": 7.0},
+    ])
+    snap = analytics._load(uid, None)
+    assert (len(snap), snap.skipped) == (1, 1)
+
+    transactions.insert_one({"_id": ObjectId(), "user_id": uid, "date": "2030-05-05", "type": "expense",
+                             "category": "Misc", "description": "new", "amount": 3.0})
+    caught_up = analytics._catch_up(snap, uid, None)
+    assert caught_up is not None and (len(caught_up), caught_up.skipped) == (2, 1)
+
+    transactions.delete_one({"user_id": uid, "description": "v1 dated"})
+    assert analytics._catch_up(caught_up, uid, None) is None  # a removal forces a full load
+    transactions.delete_many({"user_id": uid})
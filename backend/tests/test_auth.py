@@ -49,3 +49,28 @@ def test_login_success_and_fail(client):
     # Bad login
     bad = client.post("/api/auth/login", json={"email":"c@x.com","password":"nope"})
     assert bad.status_code == 401
+
+def test_me_and_signup_avoid_extra_reads(client, monkeypatch):
+    from routes import auth
+    from utils import identity
+
+    reads = []
+    real_find_one = auth.users.find_one
+    def spy(*a, **kw):
+        reads.append(a)
+        return real_find_one(*a, **kw)
+    monkeypatch.setattr(auth.users, "find_one", spy)
+    monkeypatch.setattr(identity.users, "find_one", spy)
+
+    res = client.post("/api/auth/signup", json={"name":"Dee","email":"dee@x.com","password":"pw"})
+    assert res.status_code == 201
+    for _ in range(3):
+        assert client.get("/api/auth/me").get_json()["user"]["email"] == "dee@x.com"
+    assert reads == []
+
+    # sessions from before the profile was cached resolve once, then stick
+    with client.session_transaction() as s:
+        s.pop("user")
+    assert client.get("/api/auth/me").get_json()["user"]["name"] == "Dee"
+    client.get("/api/auth/me")
+    assert len(reads) == 1
@@ -31,3 +31,386 @@ def test_parse_endpoint_is_mockable(client, monkeypatch, tmp_path):
     with open(sample, "rb") as f:
         r = client.post("/api/imports/parse", data={"files": f}, content_type="multipart/form-data")
 
+
+def test_parse_keeps_file_order_and_falls_back_to_ocr(client, monkeypatch):
+    _login(client)
+    client.post("/api/auth/login", json={"email":"imp@test.com","password":"pw"})
+
+    import io
+    import utils.ocr_receipt as ocr
+    import utils.pdf_table as pdfp
+
+    def fake_pages(src, pages=None):
+        assert isinstance(src, bytes)  # uploads are parsed from memory, not a temp path
+        if b"statement" in src:
+            return [{"page": 0, "kind": "table", "rows": [
+                {"date":"2025-01-01","type":"income","category":"Salary","description":"Pay","amount":10}]}]
+        return [{"page": 0, "kind": "image", "rows": []}]  # scanned PDF: no text layer
+
+    def fake_ocr(src, pages=None):
+        return [{"date":"2025-01-02","description":src.decode(),"amount":5}]
+
+    monkeypatch.setattr(pdfp, "parse_pdf_pages", fake_pages)
+    monkeypatch.setattr(ocr, "parse_receipt_image_or_pdf", fake_ocr)
+
+    data = {"files": [
+        (io.BytesIO(b"img"), "a.png"),
+        (io.BytesIO(b"%PDF scan"), "scan.pdf"),
+        (io.BytesIO(b"%PDF statement"), "statement.pdf"),
+    ]}
+    r = client.post("/api/imports/parse", data=data, content_type="multipart/form-data")
+    assert r.status_code == 200
+    sources = [(it["_source"]["file"], it["_source"]["mode"]) for it in r.get_json()["items"]]
+    assert sources == [("a.png", "ocr_image"), ("scan.pdf", "ocr_pdf"), ("statement.pdf", "pdf_table")]
+
+def test_async_parse_job_progress_and_result(client, monkeypatch):
+    _login(client)
+    client.post("/api/auth/login", json={"email":"imp@test.com","password":"pw"})
+
+    import io
+    import time
+    import utils.ocr_receipt as ocr
+
+    monkeypatch.setattr(ocr, "parse_receipt_image_or_pdf", lambda src, pages=None: [
+        {"date":"2025-02-01","description":"Cafe","amount":7}
+    ])
+
+    data = {"files": [(io.BytesIO(b"img1"), "a.png"), (io.BytesIO(b"img2"), "b.jpg")]}
+    r = client.post("/api/imports/parse?async=1", data=data, content_type="multipart/form-data")
+    assert r.status_code == 202
+    job_id = r.get_json()["job_id"]
+
+    for _ in range(100):
+        job = client.get(f"/api/imports/jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.02)
+
+    assert job["status"] == "done"
+    assert job["progress"] == {"done": 2, "total": 2}
+    assert [it["_source"]["file"] for it in job["items"]] == ["a.png", "b.jpg"]
+
+    assert client.delete(f"/api/imports/jobs/{job_id}").status_code == 200
+    assert client.get(f"/api/imports/jobs/{job_id}").status_code == 404
+
+
+def test_duplicate_upload_served_from_parse_cache(client, monkeypatch):
+    _login(client)
+    client.post("/api/auth/login", json={"email":"imp@test.com","password":"pw"})
+
+    import io
+    import utils.ocr_receipt as ocr
+    from utils import parse_cache
+
+    calls = []
+    def fake_ocr(src, pages=None):
+        calls.append(src)
+        return [{"date":"2025-03-01","description":"Bakery","amount":12}]
+    monkeypatch.setattr(ocr, "parse_receipt_image_or_pdf", fake_ocr)
+
+    def upload(name):
+        data = {"files": [(io.BytesIO(b"same receipt bytes"), name)]}
+        return client.post("/api/imports/parse", data=data, content_type="multipart/form-data").get_json()
+
+    hits = parse_cache.stats()["hits"]
+    first = upload("r1.png")
+    second = upload("r2.png")
+    assert len(calls) == 1
+    assert parse_cache.stats()["hits"] == hits + 1
+    assert first["items"][0]["description"] == second["items"][0]["description"] == "Bakery"
+    assert second["items"][0]["_source"] == {"file": "r2.png", "mode": "ocr_image"}
+
+
+def _text_pdf(pages):
+    """Minimal PDF: one page per list of text lines (empty list → page without text layer)."""
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops = "".join(f"BT /F1 10 Tf 40 {760 - 14 * n} Td ({ln}) Tj ET\n" for n, ln in enumerate(lines))
+        objs.append(f"<< /Length {len(ops)} >>\nstream\n{ops}endstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = "%PDF-1.4\n", []
+    for n, body in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode()
+
+
+def test_pdf_pages_routed_by_text_layer():
+    from utils.pdf_table import parse_pdf_pages
+
+    pdf = _text_pdf([
+        ["Account statement for September 2025",
+         "05/09/2025 UPI Grocery Mart 1,250.00 Dr 48,750.00",
+         "07/09/2025 Salary credit 50,000.00 Cr 98,750.00"],
+        [],  # scanned page: nothing in the text layer
+    ])
+    pages = parse_pdf_pages(pdf)
+    assert [(p["page"], p["kind"]) for p in pages] == [(0, "text"), (1, "image")]
+    assert pages[0]["rows"] == [
+        {"date": "2025-09-05", "description": "UPI Grocery Mart", "amount": 1250.0, "type": "expense", "category": ""},
+        {"date": "2025-09-07", "description": "Salary credit", "amount": 50000.0, "type": "income", "category": ""},
+    ]
+
+
+def test_statement_continuation_pages_use_first_page_profile():
+    from bench.seed import statement_pdf
+    from utils.pdf_table import parse_pdf_pages, parse_tabular_pdf, stitch_pages
+
+    rows = [{"date": f"2025-03-{n % 28 + 1:02d}", "description": f"Shop {n}", "category": "Food",
+             "type": "expense" if n % 3 else "income", "amount": 10 + n} for n in range(45)]
+    pdf = statement_pdf(rows, rows_per_page=20, repeat_header=False)  # header on page 1 only
+    want = [{**r, "amount": float(r["amount"])} for r in rows]
+
+    assert parse_tabular_pdf(pdf) == want
+    # pages classified one at a time (parse pool) and stitched afterwards
+    pages = stitch_pages([pg for p in range(3) for pg in parse_pdf_pages(pdf, [p])])
+    assert [pg["kind"] for pg in pages] == ["table"] * 3
+    assert [r for pg in pages for r in pg["rows"]] == want
+    assert all(set(pg) == {"page", "kind", "rows"} for pg in pages)
+
+
+def test_per_page_parsing_opens_each_file_in_a_few_batches(monkeypatch):
+    from bench.seed import statement_pdf
+    from utils import import_pipeline, parse_cache, pdf_table
+
+    rows = [{"date": f"2024-07-{n % 28 + 1:02d}", "description": f"Row {n}", "category": "Batch",
+             "type": "expense", "amount": 1 + n} for n in range(40)]
+    pdf = statement_pdf(rows, rows_per_page=1)  # 40 pages
+    monkeypatch.setattr(parse_cache, "get", lambda key: None)
+    calls = []
+    real = pdf_table.parse_pdf_pages
+    monkeypatch.setattr(pdf_table, "parse_pdf_pages", lambda src, pages=None: calls.append(pages) or real(src, pages))
+
+    progress = import_pipeline.Progress()
+    out = import_pipeline.parse_uploads([("s.pdf", pdf, "pdf")], progress)
+    assert [r["amount"] for r in out] == [float(r["amount"]) for r in rows]
+    assert len(calls) == import_pipeline.BATCHES_PER_WORKER
+    assert sorted(p for batch in calls for p in batch) == list(range(40))
+    assert (progress.done, progress.total) == (40, 40)
+
+
+def test_bulk_commit_is_idempotent(client):
+    _login(client)
+    client.post("/api/auth/login", json={"email":"imp@test.com","password":"pw"})
+
+    rows = [
+        {"date":"2020-04-01","type":"expense","category":"Commit","description":"Rent","amount":900,"idempotency_key":"k1"},
+        {"date":"2020-04-02","type":"income","category":"Commit","description":"Pay","amount":3000,"idempotency_key":"k2"},
+        {"date":"2020-04-02","type":"income","category":"Commit","description":"Pay","amount":3000,"idempotency_key":"k2"},
+        {"date":"not a date","amount":5,"idempotency_key":"k3"},
+        {"date":"2020-04-03","amount":5},
+    ]
+    r = client.post("/api/imports/commit", json={"items": rows})
+    assert r.status_code == 200
+    body = r.get_json()
+    assert [x["status"] for x in body["results"]] == ["inserted", "inserted", "duplicate", "invalid", "invalid"]
+    assert body["results"][2]["id"] == body["results"][1]["id"]
+    assert (body["inserted"], body["duplicate"], body["invalid"]) == (2, 1, 2)
+
+    # retrying the same commit inserts nothing and points at the existing rows
+    again = client.post("/api/imports/commit", json={"items": rows[:2]}).get_json()
+    assert [x["status"] for x in again["results"]] == ["duplicate", "duplicate"]
+    assert [x["id"] for x in again["results"]] == [x["id"] for x in body["results"][:2]]
+
+    listed = client.get("/api/transactions?category=Commit&include=total,totals").get_json()
+    assert listed["total"] == 2
+    assert listed["totals"]["income"] == 3000.0
+
+
+def test_overlapping_statement_rows_flagged_and_skipped(client, monkeypatch):
+    _login(client)
+    client.post("/api/auth/login", json={"email":"imp@test.com","password":"pw"})
+
+    import io
+    import utils.ocr_receipt as ocr
+
+    stored = {"date":"2020-05-07","type":"expense","category":"Fp","description":"Corner Cafe #12",
+              "amount":4.5,"idempotency_key":"fp-1"}
+    assert client.post("/api/imports/commit", json={"items": [stored]}).get_json()["inserted"] == 1
+
+    # same purchase as exported by another statement: different case/punctuation
+    monkeypatch.setattr(ocr, "parse_receipt_image_or_pdf", lambda src, pages=None: [
+        {"date":"2020-05-07","description":"CORNER CAFE 12","amount":4.50},
+        {"date":"2020-05-08","description":"Bookshop","amount":20},
+    ])
+    data = {"files": [(io.BytesIO(b"overlap-a"), "a.png"), (io.BytesIO(b"overlap-b"), "b.png")]}
+    items = client.post("/api/imports/parse", data=data, content_type="multipart/form-data").get_json()["items"]
+    # a.png: cafe already stored; b.png repeats both rows of a.png
+    assert [i["duplicate"] for i in items] == [True, False, True, True]
+    assert items[0]["duplicate_of"] and items[1]["duplicate_of"] is None
+
+    rows = [dict(i, category="Fp") for i in items[:2]]
+    body = client.post("/api/imports/commit", json={"items": rows}).get_json()
+    assert [x["status"] for x in body["results"]] == ["duplicate", "inserted"]
+    assert body["results"][0]["reason"] == "fingerprint"
+    assert body["results"][0]["id"] == items[0]["duplicate_of"]
+
+    # a genuine repeat purchase can still be kept explicitly
+    forced = dict(stored, idempotency_key="fp-2", allow_duplicate=True)
+    assert client.post("/api/imports/commit", json={"items": [forced]}).get_json()["inserted"] == 1
+
+    # one statement uploaded as two files, committed together: repeats inside a
+    # file are genuine, the second file's copies are not
+    twice = [{"date":"2020-05-09","type":"expense","category":"Fp","description":"Bakery","amount":3,
+              "idempotency_key":f"fp-{f}-{n}","_source":{"file":f}} for f in ("x.pdf", "y.pdf") for n in (0, 1)]
+    body = client.post("/api/imports/commit", json={"items": twice}).get_json()
+    assert [x["status"] for x in body["results"]] == ["inserted", "inserted", "duplicate", "duplicate"]
+    assert body["results"][2]["reason"] == "fingerprint" and body["results"][2]["id"] == body["results"][0]["id"]
+
+
+def test_only_statement_import_accepts_large_bodies(client, app, monkeypatch):
+    _login(client)
+    client.post("/api/auth/login", json={"email":"imp@test.com","password":"pw"})
+    import io
+
+    monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 2000)
+    monkeypatch.setitem(app.config, "STATEMENT_MAX_BYTES", 100000)
+    body = "Date,Description,Amount\n" + "".join(f"2019-01-{d:02d},Big {d},-1.00\n" for d in range(1, 29)) * 5
+    assert 2000 < len(body) < 100000
+
+    def post(path, field):
+        data = {field: (io.BytesIO(body.encode()), "big.csv")}
+        return client.post(path, data=data, content_type="multipart/form-data")
+
+    assert post("/api/imports/statement", "file").status_code == 200
+    r = post("/api/imports/parse", "files")
+    assert r.status_code == 413 and "/api/imports/statement" in r.get_json()["error"]
+    assert client.post("/api/imports/commit", data=body, content_type="application/json").status_code == 413
+
+
+def test_statement_export_streams_in_batches(client, monkeypatch):
+    _login(client)
+    client.post("/api/auth/login", json={"email":"imp@test.com","password":"pw"})
+
+    import io
+    from utils import ledger, statement_import
+
+    batch_sizes = []
+    real_commit = ledger.commit_rows
+    def spy(uid, items, import_id=None):
+        batch_sizes.append(len(items))
+        return real_commit(uid, items, import_id)
+    monkeypatch.setattr(ledger, "commit_rows", spy)
+    monkeypatch.setattr(ledger, "CHUNK_SIZE", 2)
+
+    csv_body = (
+        "Account;12345\n"
+        "\n"
+        "Txn Date;Narration;Withdrawal;Deposit\n"
+        "01/06/2018;Grocer;45.10;\n"
+        "02/06/2018;Salary;;1,200.00\n"
+        "01/06/2018;Grocer;45.10;\n"
+        "bad;row;;\n"
+    ).encode()
+    def upload(name, body):
+        data = {"file": (io.BytesIO(body), name)}
+        return client.post("/api/imports/statement", data=data, content_type="multipart/form-data")
+
+    # the repeated purchase lands in the second batch and is still kept
+    r = upload("bank.csv", csv_body)
+    assert r.status_code == 200
+    body = r.get_json()
+    assert (body["rows"], body["inserted"], body["duplicate"]) == (3, 3, 0)
+    assert batch_sizes == [2, 1]
+
+    # importing the same export again writes nothing
+    again = upload("bank.csv", csv_body).get_json()
+    assert (again["inserted"], again["duplicate"]) == (0, 3)
+
+    # the same rows under another account's preamble are keyed apart
+    other = csv_body.replace(b"12345", b"67890")
+    keys = lambda body: [r["idempotency_key"] for r in statement_import.iter_csv(body)]
+    assert keys(csv_body) == keys(io.BytesIO(csv_body))
+    assert not set(keys(csv_body)) & set(keys(other))
+
+    ofx_body = (
+        "OFXHEADER:100\nDATA:OFXSGML\nCHARSET:1252\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>"
+        "<BANKACCTFROM><ACCTID>999</BANKACCTFROM><BANKTRANLIST>"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20180603120000[-5:EST]<TRNAMT>-9.99<FITID>A1<NAME>Caf&amp;e<MEMO>card</STMTTRN>"
+        "<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20180604<TRNAMT>50.00<FITID>A2<NAME>Refund</STMTTRN>"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"
+    ).encode()
+    rows = list(statement_import.iter_ofx(ofx_body))
+    assert [(x["date"], x["type"], x["amount"], x["description"]) for x in rows] == [
+        ("2018-06-03", "expense", 9.99, "Caf&e card"), ("2018-06-04", "income", 50.0, "Refund")]
+    assert upload("bank.ofx", ofx_body).get_json()["inserted"] == 2
+
+    # the same exports are accepted by /parse for review
+    data = {"files": [(io.BytesIO(csv_body), "bank.csv")]}
+    items = client.post("/api/imports/parse", data=data, content_type="multipart/form-data").get_json()["items"]
+    assert [(i["date"], i["type"], i["amount"]) for i in items] == [
+        ("2018-06-01", "expense", 45.10), ("2018-06-02", "income", 1200.0), ("2018-06-01", "expense", 45.10)]
+    assert items[1]["_source"] == {"file": "bank.csv", "mode": "csv"}
+    assert all(i["duplicate"] for i in items)
+
+
+def test_app_start_is_lazy():
+    """Importing the app neither contacts Mongo nor loads the OCR/PDF stacks."""
+    import os, subprocess, sys
+    from pathlib import Path
+    code = (
+        "import sys, app\n"
+        "heavy = [m for m in ('cv2', 'numpy', 'pytesseract', 'pypdfium2', 'pdfplumber') if m in sys.modules]\n"
+        "print(heavy, sorted(app.app.config['STARTUP_TIMING']))\n"
+    )
+    env = dict(os.environ, MONGODB_URI="mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=100")
+    out = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1],
+                         env=env, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "[] ['create_app_ms', 'imports_ms']"
+
+
+def test_receipt_prepare_crops_deskews_and_rescales():
+    import cv2
+    import numpy as np
+    from bench.seed import receipt_png
+    from utils import receipt_prep
+
+    receipt = cv2.imdecode(np.frombuffer(receipt_png(1), np.uint8), cv2.IMREAD_GRAYSCALE)
+    # a tilted receipt on a dark table, photographed at high resolution
+    canvas = np.full((1600, 1400), 70, np.uint8)
+    canvas[300:300 + receipt.shape[0], 350:350 + receipt.shape[1]] = receipt
+    rot = cv2.getRotationMatrix2D((700, 800), 7, 1.0)
+    photo = cv2.resize(cv2.warpAffine(canvas, rot, (1400, 1600), borderValue=70), (2800, 3200))
+
+    page = receipt_prep.prepare(photo, 4000 * 4000)
+    assert page.size < photo.size / 8
+    assert abs(receipt_prep.text_height(page) - receipt_prep.TARGET_TEXT_PX) <= 2
+    assert receipt_prep.text_angle(page) == 0.0
+
+
+def test_receipt_ocr_reads_bands_then_falls_back_to_full_page(monkeypatch):
+    import numpy as np
+    import utils.ocr_receipt as ocr
+    from utils import ocr_engine, receipt_prep
+
+    monkeypatch.setattr(receipt_prep, "prepare", lambda gray, max_pixels: gray)
+    texts, heights = [], []
+
+    def fake_recognize(image, psm=6):
+        heights.append(image.shape[0])
+        return texts.pop(0)
+
+    monkeypatch.setattr(ocr_engine, "recognize", fake_recognize)
+    tall = np.full((2000, 600), 255, np.uint8)
+
+    texts[:] = ["CORNER CAFE\nDATE: 03/04/2024", "TOTAL 12.50\nTHANK YOU"]
+    item = ocr._ocr_page(tall)
+    assert heights == [600, 700]  # header + footer bands only
+    assert (item["description"], item["date"], item["amount"]) == ("CORNER CAFE", "2024-04-03", 12.5)
+
+    # no keyword total in the footer band → one full-page pass
+    heights.clear()
+    texts[:] = ["CORNER CAFE", "THANK YOU", "CORNER CAFE\nDATE: 03/04/2024\nTOTAL 9.00"]
+    item = ocr._ocr_page(tall)
+    assert heights == [600, 700, 2000]
+    assert (item["date"], item["amount"]) == ("2024-04-03", 9.0)
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+
+def test_server_timing_header_and_metrics_endpoint(client):
+    client.post("/api/auth/signup", json={"name":"M","email":"metrics@test.com","password":"pw"})
+    client.post("/api/auth/login", json={"email":"metrics@test.com","password":"pw"})
+
+    r = client.get("/api/transactions?include=items")
+    assert r.status_code == 200
+    assert r.headers["Server-Timing"].startswith("total;dur=")
+
+    body = client.get("/api/metrics").get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_count{method="GET",endpoint="/api/transactions",status="200"}' in body
+
+
+def test_mongo_commands_and_parse_stages_recorded(app):
+    from utils import metrics
+
+    timer = metrics.CommandTimer()
+    timer.started(SimpleNamespace(command={"aggregate": "transactions"}, command_name="aggregate",
+                                  connection_id=("h", 1), request_id=7))
+    timer.succeeded(SimpleNamespace(command_name="aggregate", connection_id=("h", 1), request_id=7,
+                                    duration_micros=1500))
+    timer.started(SimpleNamespace(command={"getMore": 123, "collection": "transactions"},
+                                  command_name="getMore", connection_id=("h", 1), request_id=8))
+    timer.failed(SimpleNamespace(command_name="getMore", connection_id=("h", 1), request_id=8,
+                                 duration_micros=10))
+
+    # stage samples recorded in a pool worker come back with the result
+    result, samples = metrics.captured(lambda: metrics.observe_stage("tesseract", 0.2) or "ok")
+    assert result == "ok" and samples == [("tesseract", 0.2)]
+
+    with app.test_request_context("/"):
+        from flask import g
+        with metrics.stage("rasterize"):
+            pass
+        assert "rasterize" in g._timing
+
+    body = metrics.render()
+    assert 'mongodb_command_duration_seconds_bucket{command="aggregate",collection="transactions",le="0.0025"}' in body
+    assert 'mongodb_command_failures_total{command="getMore",collection="transactions"} 1.0' in body
+    assert 'parse_stage_duration_seconds_count{stage="tesseract"}' in body
+
+
+def test_index_creation_backs_off_while_mongo_is_down(client, monkeypatch):
+    import db
+    from pymongo.errors import ServerSelectionTimeoutError
+
+    calls = []
+
+    class Down:
+        def create_index(self, keys, **options):
+            calls.append(keys)
+            raise ServerSelectionTimeoutError("no servers")
+
+    monkeypatch.setattr(db, "INDEXES", [(Down(), "k", {})])
+    monkeypatch.setattr(db, "_indexed", False)
+    monkeypatch.setattr(db, "_index_failed_at", None)
+
+    # requests that do not need Mongo still answer, and only the first one tries
+    assert client.get("/api/health").status_code == 200
+    assert client.get("/api/health").status_code == 200
+    assert len(calls) == 1
+
+    monkeypatch.setattr(db, "_index_failed_at", db._index_failed_at - db.INDEX_RETRY_SECONDS)
+    client.get("/api/health")
+    assert len(calls) == 2
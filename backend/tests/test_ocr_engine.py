@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+import pytest
+
+
+class EchoEngine:
+    """Stands in for tesserocr inside the pool workers (must be importable by them)."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def recognize(self, image, psm=6):
+        self.calls += 1
+        if image[0, 0] == 255:
+            time.sleep(self.delay)
+        return f"{image.shape[1]}x{image.shape[0]} psm{psm} sum{int(image.sum())} call{self.calls}"
+
+
+def test_pool_keeps_engine_loaded_and_times_out_stuck_pages():
+    from functools import partial
+    from utils import metrics, ocr_engine
+
+    pool = ocr_engine.OcrPool(1, 5, partial(EchoEngine, delay=30))
+    try:
+        img = np.arange(12, dtype=np.uint8).reshape(3, 4)
+        assert pool.recognize(img) == "4x3 psm6 sum66 call1"
+        # same worker, same engine object: its state survived between jobs
+        assert pool.recognize(img[:, :2], psm=4) == "2x3 psm4 sum27 call2"
+
+        pool.timeout = 0.5
+        stuck = np.full((2, 2), 255, np.uint8)
+        with pytest.raises(ocr_engine.OcrTimeout):
+            pool.recognize(stuck)
+        assert 'ocr_timeouts_total{engine="tesserocr"}' in metrics.render()
+
+        # the killed worker is replaced by a fresh one on the next job
+        pool.timeout = 30
+        assert pool.recognize(img) == "4x3 psm6 sum66 call1"
+    finally:
+        pool.close()
+
+
+def test_waiting_caller_replaces_workers_discarded_after_timeouts():
+    import threading
+    from functools import partial
+    from utils import ocr_engine
+
+    # every worker busy with a stuck page, one more caller waiting for a worker
+    pool = ocr_engine.OcrPool(2, 1.0, partial(EchoEngine, delay=30))
+    outcomes = []
+
+    def ocr():
+        try:
+            pool.recognize(np.full((2, 2), 255, np.uint8))
+            outcomes.append("ok")
+        except ocr_engine.OcrTimeout:
+            outcomes.append("timeout")
+
+    threads = [threading.Thread(target=ocr, daemon=True) for _ in range(3)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=60)
+        # the discards woke the third caller, which started its own worker
+        assert not any(t.is_alive() for t in threads)
+        assert outcomes == ["timeout"] * 3
+        assert pool._started == 0
+    finally:
+        pool.close()
+
+
+def test_falls_back_to_pytesseract_without_tesserocr(monkeypatch):
+    import pytesseract
+    from utils import ocr_engine
+
+    monkeypatch.setattr(ocr_engine, "_kind", lambda: "pytesseract")
+    monkeypatch.setattr(ocr_engine, "_local", type(ocr_engine._local)())
+    seen = {}
+
+    def fake_image_to_string(image, lang=None, config=None, timeout=0):
+        seen.update(lang=lang, config=config, timeout=timeout)
+        return "TOTAL 9.99"
+
+    monkeypatch.setattr(pytesseract, "image_to_string", fake_image_to_string)
+    assert ocr_engine.get_pool() is None
+    assert ocr_engine.recognize(np.zeros((4, 4), np.uint8)) == "TOTAL 9.99"
+    assert seen["config"] == "--oem 3 --psm 6" and seen["timeout"] == 30
@@ -7,6 +7,8 @@ def _login(client):
     client.post("/api/auth/signup", json={
         "name":"User","email":"user@test.com","password":"S3cret_pw"
     })
+    # already registered by an earlier test → fall back to login
+    client.post("/api/auth/login", json={"email":"user@test.com","password":"S3cret_pw"})
 
 def test_create_and_list_transactions_basic(client):
     _login(client)
@@ -65,3 +67,358 @@ def test_kpis_mom_calculation(client):
 
     r = client.get("/api/transactions?page=1&page_size=100&start=2025-09-01&end=2025-09-30")
     data = r.get_json()
+
+def test_include_limits_sections(client):
+    _login(client)
+    _post(client, "/api/transactions", {
+        "date": "2025-09-02", "type": "expense", "category": "Food",
+        "description": "Snack", "amount": 40
+    })
+
+    r = client.get("/api/transactions?include=items,kpis")
+    assert r.status_code == 200
+    data = r.get_json()
+    assert set(data) == {"items", "kpis"}
+    assert "mom_income_pct" in data["kpis"]
+
+    full = client.get("/api/transactions").get_json()
+    assert {"items", "total", "pages", "totals", "kpis", "series"} <= set(full)
+    assert full["kpis"]["expense"] == full["totals"]["expense"]
+
+    # the items facet reads only the listed fields, not tokens / fingerprints
+    from db import transactions
+    from utils import dashboard
+    uid = client.get("/api/auth/me").get_json()["user"]["id"]
+    mom = {"cur_start": "2025-09-01", "today": "2025-09-15", "prev_start": "2025-08-01"}
+    res = dashboard.run_dashboard(transactions, {"user_id": uid}, {}, mom, {"items", "total"})
+    assert res["items"] and all(set(d) <= {"_id", *dashboard.ITEM_FIELDS} for d in res["items"])
+
+    bad = client.get("/api/transactions?include=bogus")
+    assert bad.status_code == 400
+
+def test_cursor_pagination_walks_all_rows(client):
+    _login(client)
+    for i in range(7):
+        _post(client, "/api/transactions", {
+            "date": "2024-03-0%d" % (1 + i % 3), "type": "expense", "category": "Cursor",
+            "description": f"Cur {i}", "amount": 10 + i
+        })
+
+    seen, cursor = [], ""
+    while cursor is not None:
+        r = client.get(f"/api/transactions?category=Cursor&page_size=3&include=items&cursor={cursor}")
+        assert r.status_code == 200
+        data = r.get_json()
+        seen.extend(data["items"])
+        cursor = data["next_cursor"]
+
+    assert len(seen) == 7
+    assert len({it["id"] for it in seen}) == 7
+    dates = [it["date"] for it in seen]
+    assert dates == sorted(dates, reverse=True)
+
+    # page mode returns the same order
+    paged = client.get("/api/transactions?category=Cursor&page_size=7&include=items").get_json()
+    assert [it["id"] for it in paged["items"]] == [it["id"] for it in seen]
+
+    bad = client.get("/api/transactions?cursor=not-a-cursor")
+    assert bad.status_code == 400
+
+def test_rollups_match_raw_aggregates(client, app, monkeypatch):
+    _login(client)
+    for d, typ, amt in [("2023-05-03", "expense", 120), ("2023-05-20", "income", 900),
+                        ("2023-06-11", "expense", 80)]:
+        _post(client, "/api/transactions", {
+            "date": d, "type": typ, "category": "Rollup", "description": "R", "amount": amt
+        })
+
+    from utils import cache
+    url = "/api/transactions?category=Rollup&start=2023-05-01&end=2023-06-30&include=items,total,totals,series"
+    monkeypatch.setitem(app.config, "ROLLUPS_READ", False)
+    raw = client.get(url).get_json()
+    cache.backend.clear()
+    monkeypatch.setitem(app.config, "ROLLUPS_READ", True)
+    rolled = client.get(url).get_json()
+    assert rolled == raw  # items through a plain find when rollups serve the summary
+    assert rolled["total"] == 3 and [it["amount"] for it in rolled["items"]] == [80.0, 900.0, 120.0]
+    assert rolled["series"]["by_month"] == [
+        {"month": "2023-05", "income": 900.0, "expense": 120.0},
+        {"month": "2023-06", "income": 0.0, "expense": 80.0},
+    ]
+
+    # drift repair: wipe the rollups and rebuild them from raw rows
+    from utils import rollups
+    rollups.monthly_rollups.delete_many({"category": "Rollup"})
+    result = app.test_cli_runner().invoke(args=["rebuild-rollups"])
+    assert result.exit_code == 0
+    cache.backend.clear()
+    assert client.get(url).get_json() == raw
+
+    # rebuilding over drifted and stale docs overwrites them in place
+    uid = client.get("/api/auth/me").get_json()["user"]["id"]
+    rollups.monthly_rollups.update_many({"user_id": uid, "category": "Rollup"}, {"$inc": {"cents": 7, "count": 1}})
+    rollups.monthly_rollups.insert_one({"user_id": uid, "month": "2023-05", "type": "expense",
+                                        "category": "Rollup-gone", "cents": 500, "count": 2})
+    rollups.rebuild(uid)
+    assert rollups.monthly_rollups.find_one({"category": "Rollup-gone"})["count"] == 0
+    cache.backend.clear()
+    assert client.get(url).get_json() == raw
+
+def test_search_uses_tokens_and_escapes_input(client, app):
+    _login(client)
+    _post(client, "/api/transactions", {
+        "date": "2022-02-02", "type": "expense", "category": "Search",
+        "description": "Uber Taxi (airport)", "amount": 15
+    })
+    _post(client, "/api/transactions", {
+        "date": "2022-02-03", "type": "expense", "category": "Search",
+        "description": "Coffee", "amount": 3
+    })
+
+    def descs(q):
+        r = client.get(f"/api/transactions?category=Search&include=items&q={q}")
+        assert r.status_code == 200
+        return [it["description"] for it in r.get_json()["items"]]
+
+    assert descs("taxi") == ["Uber Taxi (airport)"]
+    assert descs("AIR ub") == ["Uber Taxi (airport)"]
+    assert descs("cof") == ["Coffee"]
+    assert descs("(airport") == ["Uber Taxi (airport)"]  # regex metachars are not a pattern
+    assert descs("xyz") == []
+
+    # rows written before tokens existed are picked up by the backfill
+    from utils import cache, search
+    search.transactions.update_many({"category": "Search"}, {"$unset": {"search_tokens": ""}})
+    cache.backend.clear()
+    assert descs("coffee") == []
+    result = app.test_cli_runner().invoke(args=["backfill-search"])
+    assert result.exit_code == 0
+    cache.backend.clear()
+    assert descs("coffee") == ["Coffee"]
+
+def test_list_cache_hits_and_write_invalidation(client):
+    from utils import cache
+    _login(client)
+    url = "/api/transactions?category=Cached&include=total"
+    before = cache.stats()
+    assert client.get(url).get_json()["total"] == 0
+    assert client.get(url).get_json()["total"] == 0
+    after = cache.stats()
+    assert after["hits"] == before["hits"] + 1
+
+    # a write bumps the user's data version → next read is a miss with fresh data
+    _post(client, "/api/transactions", {
+        "date": "2021-01-01", "type": "expense", "category": "Cached",
+        "description": "C", "amount": 1
+    })
+    assert client.get(url).get_json()["total"] == 1
+
+
+def test_export_streams_csv_and_ndjson(client):
+    import csv, gzip, io, json
+    _login(client)
+    for i in range(5):
+        _post(client, "/api/transactions", {
+            "date": "2019-02-0%d" % (1 + i), "type": "expense", "category": "Export",
+            "description": f"Exp, \"quoted\" {i}", "amount": 1.5 + i
+        })
+
+    r = client.get("/api/transactions/export?category=Export&start=2019-02-02")
+    assert r.status_code == 200
+    assert r.is_streamed and r.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(r.get_data(as_text=True))))
+    assert [row["date"] for row in rows] == ["2019-02-05", "2019-02-04", "2019-02-03", "2019-02-02"]
+    assert rows[0]["description"] == 'Exp, "quoted" 4' and float(rows[0]["amount"]) == 5.5
+
+    r = client.get("/api/transactions/export?format=ndjson&category=Export&gzip=1")
+    assert r.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(r.get_data()).decode().splitlines()
+    assert len(lines) == 5
+    assert json.loads(lines[-1])["date"] == "2019-02-01"
+
+    assert client.get("/api/transactions/export?format=xlsx").status_code == 400
+
+
+def test_export_fails_before_streaming_and_hints_only_known_indexes(client, monkeypatch):
+    import mongomock
+    from pymongo.errors import OperationFailure
+    import db
+    from utils import export
+    _login(client)
+
+    class Failing:
+        closed = False
+        def __iter__(self):
+            return self
+        def __next__(self):
+            raise OperationFailure("planner returned error")
+        def close(self):
+            Failing.closed = True
+
+    monkeypatch.setattr(export, "open_cursor", lambda *a: Failing())
+    r = client.get("/api/transactions/export")
+    assert r.status_code == 500
+    assert "planner returned error" in r.get_json()["error"] and Failing.closed
+
+    monkeypatch.setattr(db, "_indexed", False)
+    assert db.has_index(db.transactions, db.ITEM_INDEX)
+    assert not db.has_index(mongomock.MongoClient()["t"]["transactions"], db.ITEM_INDEX)
+
+
+def test_v1_documents_read_alongside_v2_and_migrate(client, app, monkeypatch):
+    from datetime import datetime
+    from db import transactions
+    from utils import cache, fingerprint, rollups
+    _login(client)
+    uid = client.get("/api/auth/me").get_json()["user"]["id"]
+    # v2 rows through the API, v1 rows (string date, float amount) as older code stored them
+    _post(client, "/api/transactions", {"date": "2018-04-20", "type": "expense",
+                                        "category": "Schema", "description": "New", "amount": 0.1})
+    legacy = [{"user_id": uid, "date": d, "type": "expense", "category": "Schema",
+               "description": f"Old {d}", "amount": amt, "created_at": datetime.utcnow()}
+              for d, amt in [("2018-04-10", 0.2), ("2018-03-05", 19.99)]]
+    for doc in legacy:
+        doc["fingerprint"] = fingerprint.of_doc(doc)
+    transactions.insert_many(legacy)
+    rollups.rebuild(uid)
+
+    stored = transactions.find_one({"description": "New"})
+    assert stored["v"] == 2 and stored["cents"] == 10 and "amount" not in stored
+    assert stored["date"] == datetime(2018, 4, 20) and "created_at" not in stored
+
+    url = "/api/transactions?category=Schema&start=2018-04-01&end=2018-04-30&include=items,totals,series"
+    cache.backend.clear()
+    before = client.get(url).get_json()
+    assert [it["date"] for it in before["items"]] == ["2018-04-20", "2018-04-10"]
+    assert before["totals"]["expense"] == 0.3  # integer cents: no 0.30000000000000004
+    assert before["series"]["by_month"] == [{"month": "2018-04", "income": 0.0, "expense": 0.3}]
+
+    # cursor pages cross from v2 dates to v1 strings without skipping rows
+    seen, cursor = [], ""
+    while cursor is not None:
+        page = client.get(f"/api/transactions?category=Schema&page_size=1&include=items&cursor={cursor}").get_json()
+        seen += [it["date"] for it in page["items"]]
+        cursor = page["next_cursor"]
+    assert seen == ["2018-04-20", "2018-04-10", "2018-03-05"]
+
+    result = app.test_cli_runner().invoke(args=["migrate-schema", "--batch-size", "1", "--user", uid])
+    assert result.exit_code == 0 and "migrated 2 transactions" in result.output
+    old = transactions.find_one({"description": "Old 2018-03-05"})
+    assert old["cents"] == 1999 and old["date"] == datetime(2018, 3, 5) and old["v"] == 2
+    assert "amount" not in old and "created_at" not in old
+    assert old["fingerprint"] == legacy[1]["fingerprint"]  # unchanged by the migration
+
+    cache.backend.clear()
+    monkeypatch.setitem(app.config, "ROLLUPS_READ", False)
+    assert client.get(url).get_json() == before
+
+
+def test_edit_and_bulk_mutations_keep_rollups_in_step(client, app, monkeypatch):
+    from utils import cache
+    _login(client)
+    ids = [_post(client, "/api/transactions", {
+        "date": d, "type": "expense", "category": "Misc", "description": desc, "amount": amt
+    }).get_json()["id"] for d, desc, amt in [("2017-05-02", "Bulk coffee", 10), ("2017-05-09", "Bulk coffee", 20),
+                                             ("2017-06-01", "Bulk rent", 500)]]
+    url = "/api/transactions?start=2017-05-01&end=2017-06-30&include=items,totals,series"
+
+    def check():
+        cache.backend.clear()
+        monkeypatch.setitem(app.config, "ROLLUPS_READ", False)
+        raw = client.get(url).get_json()
+        cache.backend.clear()
+        monkeypatch.setitem(app.config, "ROLLUPS_READ", True)
+        rolled = client.get(url).get_json()
+        assert rolled["series"] == raw["series"] and rolled["totals"] == raw["totals"]
+        return raw
+
+    r = client.put(f"/api/transactions/{ids[0]}", json={"amount": 12.5, "description": "Bulk espresso"})
+    assert r.status_code == 200
+    assert r.get_json()["item"] == {"id": ids[0], "date": "2017-05-02", "description": "Bulk espresso",
+                                    "type": "expense", "category": "Misc", "amount": 12.5}
+    assert client.get("/api/transactions?q=espresso&include=items").get_json()["items"][0]["id"] == ids[0]
+    assert client.put(f"/api/transactions/{ids[0]}", json={"amount": -1}).status_code == 400
+    assert client.put("/api/transactions/not-an-id", json={"amount": 1}).status_code == 404
+    assert check()["totals"]["expense"] == 532.5
+
+    r = client.put("/api/transactions", json={"ids": ids[:2], "category": "Coffee"})
+    assert r.get_json() == {"updated": 2}
+    assert client.put("/api/transactions", json={"ids": ids[:2], "category": "Coffee"}).get_json() == {"updated": 0}
+    assert client.put("/api/transactions", json={"category": "Coffee"}).status_code == 400
+    assert check()["series"]["by_category"] == [{"category": "Misc", "total": 500.0},
+                                                {"category": "Coffee", "total": 32.5}]
+
+    assert client.delete(f"/api/transactions/{ids[2]}").get_json() == {"deleted": 1}
+    assert client.delete(f"/api/transactions/{ids[2]}").status_code == 404
+    r = client.delete("/api/transactions", json={"filter": {"q": "bulk", "start": "2017-05-01", "end": "2017-05-31"}})
+    assert r.get_json() == {"deleted": 2}
+    assert check()["items"] == []
+
+
+def test_edit_checks_only_sent_fields_and_keeps_concurrent_edits(client, monkeypatch):
+    from bson import ObjectId
+    from db import transactions
+    from utils import ledger, rollups, schema
+    _login(client)
+    uid = client.get("/api/auth/me").get_json()["user"]["id"]
+
+    # a v1 row neither the date nor the amount of which would pass validate()
+    legacy = transactions.insert_one({"user_id": uid, "date": "sometime", "type": "expense",
+                                      "category": "Odd", "description": "Legacy", "amount": 0}).inserted_id
+    r = client.put(f"/api/transactions/{legacy}", json={"category": "Fixed"})
+    assert r.status_code == 200 and r.get_json()["item"]["category"] == "Fixed"
+    doc = transactions.find_one({"_id": legacy})
+    assert doc["v"] == 2 and doc["date"] is None and doc[schema.LEGACY_DATE] == "sometime"
+    assert client.put(f"/api/transactions/{legacy}", json={"date": "soon"}).status_code == 400
+    assert client.put(f"/api/transactions/{legacy}", json={"description": 5}).status_code == 400
+    client.put(f"/api/transactions/{legacy}", json={"date": "2016-03-04"})
+    assert schema.LEGACY_DATE not in transactions.find_one({"_id": legacy})
+
+    tx = client.post("/api/transactions", json={"date": "2016-03-05", "type": "expense", "category": "Race",
+                                                "description": "Before", "amount": 10}).get_json()["id"]
+
+    class Racy:
+        # another request changes the amount right after ours read the row
+        raced = False
+        def __getattr__(self, name):
+            return getattr(transactions, name)
+        def find_one(self, flt, *a, **kw):
+            doc = transactions.find_one(flt, *a, **kw)
+            if not Racy.raced:
+                Racy.raced = True
+                transactions.update_one({"_id": ObjectId(tx)}, {"$set": {"cents": 2500}})
+            return doc
+    monkeypatch.setattr(ledger, "transactions", Racy())
+    r = client.put(f"/api/transactions/{tx}", json={"description": "After"})
+    assert r.get_json()["item"]["amount"] == 25.0 and r.get_json()["item"]["description"] == "After"
+
+    transactions.delete_many({"_id": {"$in": [legacy, ObjectId(tx)]}})
+    rollups.rebuild(uid)  # the raced write went around them
+
+
+def test_migration_keeps_unparseable_legacy_dates_out_of_v2_dates(client, app, monkeypatch):
+    from db import transactions
+    from utils import cache, schema
+    _login(client)
+    uid = client.get("/api/auth/me").get_json()["user"]["id"]
+    transactions.insert_one({"user_id": uid, "date": "05/01/2024", "type": "expense",
+                             "category": "Malformed", "description": "Odd", "amount": 7.0})
+
+    result = app.test_cli_runner().invoke(args=["migrate-schema", "--user", uid])  # also rebuilds rollups
+    assert result.exit_code == 0, result.output
+    doc = transactions.find_one({"category": "Malformed"})
+    assert doc["v"] == 2 and doc["date"] is None and doc["cents"] == 700
+    assert doc[schema.LEGACY_DATE] == "05/01/2024"
+
+    cache.backend.clear()
+    r = client.get("/api/transactions?category=Malformed&include=items,totals,series")
+    assert r.status_code == 200
+    body = r.get_json()
+    assert [(it["date"], it["amount"]) for it in body["items"]] == [(None, 7.0)]
+    assert body["totals"]["expense"] == 7.0
+    # undated rows group under a null month on both read paths
+    for rollups_read in (False, True):
+        monkeypatch.setitem(app.config, "ROLLUPS_READ", rollups_read)
+        cache.backend.clear()
+        by_month = client.get("/api/transactions?include=series").get_json()["series"]["by_month"]
+        assert by_month[0] == {"month": None, "income": 0.0, "expense": 7.0}
@@ -0,0 +1,364 @@
+"""
+Per-user columnar snapshots for /api/analytics.
+
+A user's transactions are loaded once into parallel NumPy columns:
+
+    day       int32   days since 1970-01-01
+    cents     int64   amount in cents (always positive)
+    income    bool    type == income
+    category  int32   code into `categories` (interned strings)
+    merchant  int32   code into `merchants` (description without digits / ref numbers)
+
+about 21 bytes per row, so a million-row history is ~21 MB. Every metric below
+is computed with array operations (masks, bincount, cumsum, lexsort) over those
+columns, never with a per-row Python loop or another Mongo query.
+
+Snapshots live in a per-process LRU (ANALYTICS_MAX_USERS) keyed by user id and
+remember the response-cache data version they were built at. When a write has
+bumped the version, `get()` catches up incrementally: only rows with an _id
+above the snapshot's newest one are fetched and appended. A count check (one
+indexed count) falls back to a full reload if rows were removed or arrived out
+of _id order, and ANALYTICS_TTL bounds how long a snapshot is trusted at all,
+which covers in-place edits made by other worker processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from config import Config
+from utils import cache, schema, search
+
+EPOCH = date(1970, 1, 1)
+_EPOCH_DT = datetime(1970, 1, 1)
+_FIELDS = {"type": 1, "category": 1, "description": 1, **dict.fromkeys(schema.FIELDS, 1)}
+_LOAD_BATCH = 5000
+
+# recurring detection: (label, min interval days, max interval days)
+CADENCES = (("weekly", 6, 8), ("biweekly", 13, 15), ("monthly", 27, 33), ("yearly", 358, 372))
+RECURRING_MIN_ROWS = 3
+RECURRING_MAX_JITTER_DAYS = 3.0
+RECURRING_MAX_AMOUNT_CV = 0.2
+
+
+def to_day(d):
+    """date → int days since EPOCH."""
+    return (d - EPOCH).days
+
+
+def from_day(n):
+    return EPOCH + timedelta(days=int(n))
+
+
+def merchant_key(description):
+    """Description reduced to its first three digit-free tokens ('Uber Trip #123' → 'uber trip')."""
+    toks = [t for t in search.tokenize(description) if not any(c.isdigit() for c in t)]
+    return " ".join(toks[:3])
+
+
+class Snapshot:
+    """Immutable column set for one user; `extended` returns a new one."""
+
+    def __init__(self, day, cents, income, category, merchant, categories, merchants,
+                 last_id, version, loaded_at=None, skipped=0):
+        self.day, self.cents, self.income = day, cents, income
+        self.category, self.merchant = category, merchant
+        self.categories, self.merchants = categories, merchants
+        self.last_id = last_id
+        self.version = version
+        self.skipped = skipped  # rows read but left out (no usable date)
+        # time of the last full load; catch-ups keep it, so ANALYTICS_TTL still applies
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def __len__(self):
+        return len(self.day)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.day, self.cents, self.income, self.category, self.merchant))
+
+    @classmethod
+    def empty(cls, version=None):
+        return cls(np.empty(0, np.int32), np.empty(0, np.int64), np.empty(0, bool),
+                   np.empty(0, np.int32), np.empty(0, np.int32), [], [], None, version)
+
+    def extended(self, docs, version):
+        """New snapshot with `docs` appended; string tables are copied and only grow."""
+        cat_codes = {c: i for i, c in enumerate(self.categories)}
+        mer_codes = {m: i for i, m in enumerate(self.merchants)}
+        categories, merchants = list(self.categories), list(self.merchants)
+
+        def intern(table, codes, value):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(table)
+                table.append(value)
+            return code
+
+        day, cents, income, cat, mer = [], [], [], [], []
+        last_id, skipped = self.last_id, self.skipped
+        for d in docs:
+            if last_id is None or d["_id"] > last_id:
+                last_id = d["_id"]
+            stored = d.get("date")
+            if isinstance(stored, datetime):
+                n = (stored - _EPOCH_DT).days
+            else:
+                dt = schema.to_date(schema.date_str(d))
+                if dt is None:
+                    skipped += 1
+                    continue
+                n = (dt - _EPOCH_DT).days
+            day.append(n)
+            cents.append(abs(schema.cents(d)))
+            income.append(d.get("type") == "income")
+            cat.append(intern(categories, cat_codes, d.get("category") or "Uncategorized"))
+            mer.append(intern(merchants, mer_codes, merchant_key(d.get("description"))))
+        return Snapshot(
+            np.concatenate([self.day, np.asarray(day, np.int32)]),
+            np.concatenate([self.cents, np.asarray(cents, np.int64)]),
+            np.concatenate([self.income, np.asarray(income, bool)]),
+            np.concatenate([self.category, np.asarray(cat, np.int32)]),
+            np.concatenate([self.merchant, np.asarray(mer, np.int32)]),
+            categories, merchants, last_id, version, self.loaded_at, skipped,
+        )
+
+
+# ---------- snapshot cache ----------
+_snapshots = OrderedDict()  # user_id → Snapshot
+_lock = threading.Lock()
+_stats = {"hits": 0, "loads": 0, "catchups": 0}
+
+
+def _collection():
+    from db import transactions
+    return transactions
+
+
+def _version(user_id):
+    return cache.backend.version(user_id) if cache.backend else None
+
+
+def _load(user_id, version):
+    coll = _collection()
+    cur = coll.find({"user_id": user_id}, _FIELDS).batch_size(_LOAD_BATCH)
+    try:
+        return Snapshot.empty().extended(cur, version)
+    finally:
+        cur.close()
+
+
+def _catch_up(snap, user_id, version):
+    coll = _collection()
+    flt = {"user_id": user_id}
+    if snap.last_id is not None:
+        flt["_id"] = {"$gt": snap.last_id}
+    snap = snap.extended(coll.find(flt, _FIELDS).batch_size(_LOAD_BATCH), version)
+    # every row read is either in the columns or counted as skipped
+    if coll.count_documents({"user_id": user_id}) != len(snap) + snap.skipped:
+        return None
+    return snap
+
+
+def get(user_id):
+    """The user's snapshot, loading or catching it up as needed."""
+    version = _version(user_id)
+    with _lock:
+        snap = _snapshots.get(user_id)
+        if snap is not None:
+            _snapshots.move_to_end(user_id)
+    expired = snap is not None and time.monotonic() - snap.loaded_at > Config.ANALYTICS_TTL
+    if snap is not None and not expired and version is not None and snap.version == version:
+        _stats["hits"] += 1
+        return snap
+
+    fresh = None
+    if snap is not None and not expired:
+        fresh = _catch_up(snap, user_id, version)
+        if fresh is not None:
+            _stats["catchups"] += 1
+    if fresh is None:
+        fresh = _load(user_id, version)
+        _stats["loads"] += 1
+    with _lock:
+        _snapshots[user_id] = fresh
+        _snapshots.move_to_end(user_id)
+        while len(_snapshots) > Config.ANALYTICS_MAX_USERS:
+            _snapshots.popitem(last=False)
+    return fresh
+
+
+def forget(user_id=None):
+    """Drop one user's snapshot (or all); the next read reloads it."""
+    with _lock:
+        if user_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(user_id, None)
+
+
+def stats():
+    with _lock:
+        return {"users": len(_snapshots), "bytes": sum(s.nbytes for s in _snapshots.values()),
+                **_stats}
+
+
+# ---------- metrics ----------
+def _dollars(a):
+    return [round(float(x) / 100, 2) for x in np.asarray(a)]
+
+
+def _month_index(days):
+    """int days → months since 1970-01 (vectorized)."""
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _month_label(m):
+    return str(np.datetime64(int(m), "M"))
+
+
+def rolling(snap, as_of, days=90, window=30):
+    """
+    Daily income/expense totals for the `days` days ending at `as_of`, with a
+    trailing `window`-day mean of each (days before the range count toward it).
+    """
+    end = to_day(as_of)
+    lo = end - days - window + 2  # earliest day any window touches
+    sel = (snap.day >= lo) & (snap.day <= end)
+    offset = snap.day[sel] - lo
+    size = end - lo + 1
+    inc = np.bincount(offset, weights=np.where(snap.income[sel], snap.cents[sel], 0), minlength=size)
+    exp = np.bincount(offset, weights=np.where(snap.income[sel], 0, snap.cents[sel]), minlength=size)
+
+    def trailing_mean(x):
+        c = np.concatenate([[0.0], np.cumsum(x)])
+        return (c[window:] - c[:-window]) / window
+
+    keep = slice(window - 1, None)
+    return {
+        "days": [from_day(d).isoformat() for d in range(end - days + 1, end + 1)],
+        "window": window,
+        "income": _dollars(inc[keep]),
+        "expense": _dollars(exp[keep]),
+        "rolling_income": _dollars(trailing_mean(inc)),
+        "rolling_expense": _dollars(trailing_mean(exp)),
+    }
+
+
+def category_trends(snap, as_of, months=6, top=10):
+    """
+    Monthly expense per category over the last `months` calendar months (the
+    current one included), with a least-squares slope in dollars/month.
+    """
+    cur = int(_month_index(np.array([to_day(as_of)]))[0])
+    first = cur - months + 1
+    mon = _month_index(snap.day)
+    sel = ~snap.income & (mon >= first) & (mon <= cur) & (snap.day <= to_day(as_of))
+    ncat = len(snap.categories)
+    if not ncat or not sel.any():
+        return {"months": [_month_label(m) for m in range(first, cur + 1)], "categories": []}
+    cell = snap.category[sel].astype(np.int64) * months + (mon[sel] - first)
+    grid = np.bincount(cell, weights=snap.cents[sel], minlength=ncat * months).reshape(ncat, months)
+
+    x = np.arange(months, dtype=float)
+    xc = x - x.mean()
+    slope = (grid @ xc) / (xc @ xc) if months > 1 else np.zeros(ncat)
+    totals = grid.sum(axis=1)
+    order = np.argsort(-totals, kind="stable")[:top]
+    order = order[totals[order] > 0]
+    return {
+        "months": [_month_label(m) for m in range(first, cur + 1)],
+        "categories": [{
+            "category": snap.categories[c],
+            "total": round(float(totals[c]) / 100, 2),
+            "monthly": _dollars(grid[c]),
+            "slope": round(float(slope[c]) / 100, 2),
+        } for c in order],
+    }
+
+
+def recurring(snap, as_of, lookback_days=400):
+    """
+    Expense merchants that repeat on a regular cadence with a stable amount:
+    at least RECURRING_MIN_ROWS rows, interval mean inside one of CADENCES,
+    interval std <= RECURRING_MAX_JITTER_DAYS, amount CV <= RECURRING_MAX_AMOUNT_CV.
+    """
+    end = to_day(as_of)
+    sel = ~snap.income & (snap.day > end - lookback_days) & (snap.day <= end)
+    mer, day, cents = snap.merchant[sel], snap.day[sel], snap.cents[sel].astype(float)
+    if not len(mer):
+        return {"recurring": []}
+    order = np.lexsort((day, mer))
+    mer, day, cents = mer[order], day[order], cents[order]
+
+    nm = len(snap.merchants)
+    n = np.bincount(mer, minlength=nm)
+    amt_sum = np.bincount(mer, weights=cents, minlength=nm)
+    amt_sq = np.bincount(mer, weights=cents * cents, minlength=nm)
+    last = np.flatnonzero(np.append(mer[1:] != mer[:-1], True))  # last row of each merchant
+    last_day = np.full(nm, -1, np.int64)
+    last_day[mer[last]] = day[last]
+    last_amt = np.zeros(nm)
+    last_amt[mer[last]] = cents[last]
+
+    same = mer[1:] == mer[:-1]
+    gaps = (day[1:] - day[:-1])[same].astype(float)
+    gap_mer = mer[1:][same]
+    gn = np.bincount(gap_mer, minlength=nm)
+    g_sum = np.bincount(gap_mer, weights=gaps, minlength=nm)
+    g_sq = np.bincount(gap_mer, weights=gaps * gaps, minlength=nm)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amt_mean = amt_sum / n
+        amt_cv = np.sqrt(np.maximum(amt_sq / n - amt_mean ** 2, 0)) / amt_mean
+        g_mean = g_sum / gn
+        g_std = np.sqrt(np.maximum(g_sq / gn - g_mean ** 2, 0))
+
+    base = (n >= RECURRING_MIN_ROWS) & (g_std <= RECURRING_MAX_JITTER_DAYS) & \
+        (amt_cv <= RECURRING_MAX_AMOUNT_CV)
+    names = np.array(snap.merchants, dtype=object)
+    out = []
+    for label, lo, hi in CADENCES:
+        hit = np.flatnonzero(base & (g_mean >= lo) & (g_mean <= hi) & (names != ""))
+        for m in hit:
+            out.append({
+                "merchant": snap.merchants[m],
+                "cadence": label,
+                "count": int(n[m]),
+                "interval_days": round(float(g_mean[m]), 1),
+                "amount": round(float(amt_mean[m]) / 100, 2),
+                "last_amount": round(float(last_amt[m]) / 100, 2),
+                "last_date": from_day(last_day[m]).isoformat(),
+                "next_date": from_day(last_day[m] + round(g_mean[m])).isoformat(),
+            })
+    out.sort(key=lambda r: -r["amount"])
+    return {"recurring": out}
+
+
+def forecast(snap, as_of, baseline_days=90):
+    """
+    Month-end projection for the month containing `as_of`: month-to-date totals
+    plus the remaining days at the trailing `baseline_days` daily rate (taken
+    from before this month, so this month's spending does not feed itself).
+    """
+    end = to_day(as_of)
+    month_start = to_day(as_of.replace(day=1))
+    nxt = (as_of.replace(day=28) + timedelta(days=4)).replace(day=1)
+    days_left = to_day(nxt) - 1 - end
+
+    mtd = (snap.day >= month_start) & (snap.day <= end)
+    base = (snap.day >= month_start - baseline_days) & (snap.day < month_start)
+    out = {"as_of": as_of.isoformat(), "month": as_of.strftime("%Y-%m"),
+           "days_elapsed": end - month_start + 1, "days_left": days_left}
+    for kind, mask in (("income", snap.income), ("expense", ~snap.income)):
+        so_far = int(snap.cents[mtd & mask].sum())
+        rate = float(snap.cents[base & mask].sum()) / baseline_days
+        out[kind] = {
+            "month_to_date": round(so_far / 100, 2),
+            "daily_rate": round(rate / 100, 2),
+            "projected": round((so_far + rate * days_left) / 100, 2),
+        }
+    out["projected_net"] = round(out["income"]["projected"] - out["expense"]["projected"], 2)
+    return out
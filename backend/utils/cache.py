@@ -0,0 +1,177 @@
+"""
+Versioned response cache for dashboard reads.
+
+Keys are `<namespace>:<user_id>:v<data version>:<digest of normalized args>`.
+Every transaction write calls `bump(user_id)`, which moves the user to a new
+data version, so stale entries are never read again and simply age out through
+LRU / TTL eviction — no key scanning on invalidation.
+
+Backends are pluggable:
+  * MemoryBackend – in-process LRU + TTL with an entry and a byte cap (default)
+  * RedisBackend  – any redis-py compatible client (real Redis or a local
+                    stand-in), shared by all workers
+  * None          – caching disabled (CACHE_BACKEND=none)
+
+Version counters are kept outside the LRU so they can never be evicted and
+resurrect an old version. With the memory backend they are per worker, so in a
+multi-worker deployment another worker may serve a stale entry until its TTL
+expires; use the redis backend when that matters.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class MemoryBackend:
+    """Thread-safe LRU + TTL byte cache with hit/miss/eviction counters."""
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, bytes)
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, value = self._data.pop(key)
+        self._bytes -= len(key) + len(value)
+
+    def version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class RedisBackend:
+    """
+    Same interface on top of a redis-py compatible client. LRU eviction and the
+    memory cap are Redis' own (maxmemory / allkeys-lru); hit/miss are counted here.
+    """
+
+    def __init__(self, client, ttl=300, prefix="tf:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.client.setex(self.prefix + key, ttl or self.ttl, value)
+
+    def version(self, user_id):
+        return int(self.client.get(f"{self.prefix}ver:{user_id}") or 0)
+
+    def bump(self, user_id):
+        self.client.incr(f"{self.prefix}ver:{user_id}")
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+def _make_backend():
+    kind = (Config.CACHE_BACKEND or "").lower()
+    if kind in ("", "none", "off"):
+        return None
+    if kind == "redis":
+        import redis  # optional dependency, only needed for this backend
+        return RedisBackend(redis.Redis.from_url(Config.CACHE_URL), ttl=Config.CACHE_TTL)
+    return MemoryBackend(max_entries=Config.CACHE_MAX_ENTRIES,
+                         max_bytes=Config.CACHE_MAX_BYTES,
+                         ttl=Config.CACHE_TTL)
+
+
+backend = _make_backend()
+
+
+def make_key(namespace, user_id, args):
+    """Cache key for `args` (a dict of already-normalized request params) under the user's version."""
+    digest = hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()
+    version = backend.version(user_id) if backend else 0
+    return f"{namespace}:{user_id}:v{version}:{digest}"
+
+
+def get(key):
+    return backend.get(key) if backend else None
+
+
+def set(key, value, ttl=None):
+    if backend:
+        backend.set(key, value, ttl)
+
+
+def bump(user_id):
+    """Invalidate every cached read for `user_id` (call after any transaction write)."""
+    if backend:
+        backend.bump(user_id)
+
+
+def stats():
+    return backend.stats() if backend else {"backend": "none"}
@@ -0,0 +1,240 @@
+"""
+Single-round-trip dashboard query for GET /api/transactions.
+
+Everything the dashboard shows (paged items, total count, type totals, monthly
+and category series, month-over-month windows) is computed by one `$facet`
+aggregate over the union of the user's filter window and the MoM window, so the
+matched range is scanned once instead of once per section.
+
+Deep pages can use keyset pagination instead (`fetch_after`): an opaque cursor
+encoding the last (date, _id) seen resumes with a range predicate on the
+(user_id, date) index, so page N costs the same as page 1.
+
+Amounts are summed as integer cents and dates/months read through
+utils.schema, so both stored schema versions aggregate the same way.
+"""
+import base64
+import json
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+from utils import schema
+
+SECTIONS = ("items", "total", "totals", "series", "kpis")
+
+
+# newest first; _id breaks ties so page and cursor modes agree on order
+ITEM_SORT = {"date": -1, "_id": -1}
+ITEM_FIELDS = {"description": 1, "type": 1, "category": 1, **dict.fromkeys(schema.FIELDS, 1)}
+
+
+def parse_include(raw):
+    """
+    Parse `?include=items,kpis` into a set of section names.
+    Empty/missing → every section. Returns None if an unknown section is asked for.
+    """
+    wanted = {s.strip().lower() for s in (raw or "").split(",") if s.strip()}
+    if not wanted:
+        return set(SECTIONS)
+    if wanted - set(SECTIONS):
+        return None
+    return wanted
+
+
+def _type_sum(match=None):
+    stages = [{"$match": match}] if match else []
+    return stages + [{"$group": {"_id": "$type", "total": {"$sum": schema.cents_expr()}}}]
+
+
+def build_pipeline(base_filter, date_range, mom, sections, skip=0, limit=20):
+    """
+    base_filter : filter without any date predicate (user_id + category + q);
+                  must not use a top-level $or (the window union needs it)
+    date_range  : schema.date_clause(start, end), or {}/None for "all dates"
+    mom         : dict(cur_start, today, prev_start) as 'YYYY-MM-DD' strings
+    """
+    want_kpis = "kpis" in sections
+    mom_range = schema.date_clause(mom["prev_start"], mom["today"])
+    cents = schema.cents_expr()
+
+    # one $match covering both windows; each facet narrows to its own window
+    if date_range and want_kpis:
+        match = {**base_filter, "$or": [date_range, mom_range]}
+        in_range = date_range
+    elif date_range:
+        match = {**base_filter, **date_range}
+        in_range = None
+    else:
+        match = dict(base_filter)
+        in_range = None
+
+    def scoped(*stages):
+        return ([{"$match": in_range}] if in_range else []) + list(stages)
+
+    facets = {}
+    if "items" in sections:
+        facets["items"] = scoped(
+            {"$sort": ITEM_SORT},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": ITEM_FIELDS},
+        )
+    if "total" in sections:
+        facets["total"] = scoped({"$count": "n"})
+    if "totals" in sections or want_kpis:
+        facets["totals"] = scoped(*_type_sum())
+    if "series" in sections:
+        facets["by_month"] = scoped(
+            {"$group": {
+                "_id": schema.month_expr(),
+                "income":  {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, cents, 0]}},
+                "expense": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, cents, 0]}},
+            }},
+            {"$sort": {"_id": 1}},
+        )
+        facets["by_category"] = scoped(
+            {"$match": {"type": "expense"}},
+            {"$group": {
+                "_id": {"$ifNull": ["$category", "Uncategorized"]},
+                "total": {"$sum": cents},
+            }},
+            {"$sort": {"total": -1}},
+        )
+    if want_kpis:
+        facets["mom"] = [
+            {"$match": mom_range},
+            {"$group": {
+                "_id": {
+                    "window": {"$cond": [schema.on_or_after_expr(mom["cur_start"]), "cur", "prev"]},
+                    "type": "$type",
+                },
+                "total": {"$sum": cents},
+            }},
+        ]
+
+    return [{"$match": match}, {"$facet": facets}]
+
+
+def run_dashboard(collection, base_filter, date_range, mom, sections, skip=0, limit=20):
+    """
+    Execute the combined pipeline and unpack the facets into plain python values:
+      items (raw docs), total, totals{income,expense,net}, by_month, by_category,
+      mom{cur_income,cur_expense,prev_income,prev_expense}
+    Only the keys needed for `sections` are returned.
+    """
+    if set(sections) == {"items"}:
+        # nothing to aggregate: an indexed find instead of a $facet over every match
+        return {"items": fetch_page(collection, base_filter, date_range, skip, limit)}
+    pipeline = build_pipeline(base_filter, date_range, mom, sections, skip, limit)
+    facet = next(iter(collection.aggregate(pipeline)), {}) or {}
+    out = {}
+
+    if "items" in facet:
+        out["items"] = facet["items"]
+
+    if "total" in facet:
+        rows = facet["total"]
+        out["total"] = int(rows[0]["n"]) if rows else 0
+
+    if "totals" in facet:
+        agg = {r["_id"]: schema.from_cents(r["total"]) for r in facet["totals"]}
+        inc, exp = agg.get("income", 0.0), agg.get("expense", 0.0)
+        out["totals"] = {"income": inc, "expense": exp, "net": inc - exp}
+
+    if "by_month" in facet:
+        out["by_month"] = [
+            {"month": r["_id"], "income": schema.from_cents(r.get("income")),
+             "expense": schema.from_cents(r.get("expense"))}
+            for r in facet["by_month"]
+        ]
+        out["by_category"] = [
+            {"category": r["_id"], "total": schema.from_cents(r.get("total"))}
+            for r in facet["by_category"]
+        ]
+
+    if "mom" in facet:
+        d = {(r["_id"]["window"], r["_id"]["type"]): schema.from_cents(r["total"]) for r in facet["mom"]}
+        out["mom"] = {
+            "cur_income": d.get(("cur", "income"), 0.0),
+            "cur_expense": d.get(("cur", "expense"), 0.0),
+            "prev_income": d.get(("prev", "income"), 0.0),
+            "prev_expense": d.get(("prev", "expense"), 0.0),
+        }
+
+    return out
+
+
+# ---------- keyset pagination ----------
+def encode_cursor(doc):
+    """Opaque, url-safe token for the position right after `doc`."""
+    data = {"d": schema.date_str(doc), "i": str(doc["_id"])}
+    if not isinstance(doc.get("date"), str):
+        data["v"] = schema.VERSION  # BSON date, not a v1 string
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Inverse of encode_cursor → (date as stored, ObjectId): a datetime for v2
+    positions, the 'YYYY-MM-DD' string for v1 ones. Raises ValueError if malformed.
+    """
+    try:
+        pad = "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(token + pad))
+        last_date, last_id = data["d"], ObjectId(data["i"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+    if last_date is not None and data.get("v") == schema.VERSION:
+        last_date = schema.to_date(last_date)
+        if last_date is None:
+            raise ValueError("Invalid cursor")
+    return last_date, last_id
+
+
+def _after(last_date, last_id):
+    # strictly "below" (last_date, last_id) in ITEM_SORT order; descending BSON
+    # order puts dates before strings before null, so a v2 position is followed
+    # by every remaining v1 row
+    if last_date is None:
+        return {"date": None, "_id": {"$lt": last_id}}
+    below = [
+        {"date": {"$lt": last_date}},
+        {"date": last_date, "_id": {"$lt": last_id}},
+        {"date": None},
+    ]
+    if not isinstance(last_date, str) and schema.reads_v1():
+        below.append({"date": {"$type": "string"}})
+    return {"$or": below}
+
+
+def _items_filter(base_filter, *clauses):
+    # date_range / cursor clauses may be $or's: $and them in, never merge keys
+    flt = dict(base_filter)
+    clauses = [c for c in clauses if c]
+    if clauses:
+        flt["$and"] = list(base_filter.get("$and", [])) + clauses
+    return flt
+
+
+def fetch_page(collection, base_filter, date_range, skip=0, limit=20):
+    """One offset page of items in ITEM_SORT order (the `items` section on its own)."""
+    return list(collection.find(_items_filter(base_filter, date_range), ITEM_FIELDS)
+                .sort(list(ITEM_SORT.items()))
+                .skip(skip)
+                .limit(limit))
+
+
+def fetch_after(collection, base_filter, date_range, cursor=None, limit=20):
+    """
+    One page of items in ITEM_SORT order starting after `cursor` (None → first page).
+    Returns (docs, next_cursor); next_cursor is None on the last page.
+    """
+    flt = _items_filter(base_filter, date_range, cursor and _after(*decode_cursor(cursor)))
+    docs = list(collection.find(flt, ITEM_FIELDS)
+                .sort(list(ITEM_SORT.items()))
+                .limit(limit + 1))
+    more = len(docs) > limit
+    docs = docs[:limit]
+    return docs, (encode_cursor(docs[-1]) if more and docs else None)
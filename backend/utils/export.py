@@ -0,0 +1,115 @@
+"""
+Streaming transaction export.
+
+Rows are read from a server-side cursor (EXPORT_BATCH_SIZE documents per
+getMore, projected to the exported columns) and encoded into ~64 KiB chunks by
+a generator, so memory stays flat regardless of history size. `gzip_chunks`
+compresses the same stream on the fly.
+"""
+import csv
+import io
+import json
+import zlib
+
+from db import ITEM_INDEX, has_index
+from utils import schema
+from utils.dashboard import ITEM_FIELDS, ITEM_SORT
+
+COLUMNS = ("id", "date", "type", "category", "description", "amount")
+PROJECTION = ITEM_FIELDS
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+_CHUNK = 64 * 1024
+
+
+def open_cursor(collection, flt, batch_size):
+    """
+    Newest-first cursor over `flt`. Hinted to walk db.ITEM_INDEX: with a category
+    or search filter the planner could otherwise pick that index and sort the
+    whole history in memory before the first row. Not hinted while the index
+    is missing (DB_ENSURE_INDEXES=0 before `flask init-db`): the server rejects
+    a hint naming an unknown index.
+    """
+    cursor = collection.find(flt, PROJECTION).sort(list(ITEM_SORT.items()))
+    if has_index(collection, ITEM_INDEX):
+        cursor = cursor.hint(ITEM_INDEX)
+    return cursor.batch_size(batch_size)
+
+
+def _prefetched(cursor):
+    """Fetch the first batch now; returns a generator over all documents."""
+    try:
+        first = next(cursor, None)
+    except Exception:
+        cursor.close()
+        raise
+
+    def docs():
+        try:
+            if first is not None:
+                yield first
+                yield from cursor
+        finally:
+            cursor.close()
+    return docs()
+
+
+def _row(doc):
+    return {
+        "id": str(doc["_id"]),
+        "date": schema.date_str(doc),
+        "type": doc.get("type", "expense"),
+        "category": doc.get("category", ""),
+        "description": doc.get("description", ""),
+        "amount": schema.amount(doc),
+    }
+
+
+def iter_csv(docs):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=COLUMNS)
+    writer.writeheader()
+    try:
+        for doc in docs:
+            writer.writerow(_row(doc))
+            if buf.tell() >= _CHUNK:
+                yield buf.getvalue().encode()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode()
+    finally:
+        docs.close()
+
+
+def iter_ndjson(docs):
+    parts, size = [], 0
+    try:
+        for doc in docs:
+            line = json.dumps(_row(doc), separators=(",", ":")) + "\n"
+            parts.append(line)
+            size += len(line)
+            if size >= _CHUNK:
+                yield "".join(parts).encode()
+                parts, size = [], 0
+        yield "".join(parts).encode()
+    finally:
+        docs.close()
+
+
+def gzip_chunks(chunks, level=6):
+    """gzip-encode a stream of byte chunks without buffering it."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+def stream(collection, flt, fmt, batch_size, gzip=False):
+    docs = _prefetched(open_cursor(collection, flt, batch_size))
+    chunks = iter_csv(docs) if fmt == "csv" else iter_ndjson(docs)
+    return gzip_chunks(chunks) if gzip else chunks
@@ -0,0 +1,61 @@
+"""
+Duplicate-transaction fingerprints.
+
+A fingerprint is a sha1 over (user_id, date, amount in cents, type,
+normalized description), where the description is reduced to its search
+tokens so case, punctuation and spacing differences between two statement
+exports of the same row do not matter. It is stored on every transaction and
+covered by the (user_id, fingerprint) index, so checking a whole batch of
+candidates costs one indexed `$in` query.
+"""
+import hashlib
+
+from pymongo import UpdateOne
+
+from db import transactions
+from utils import schema, search
+
+FIELD = "fingerprint"
+
+
+def compute(user_id, date, amount, ttype, description):
+    cents = int(round(float(amount or 0) * 100))
+    desc = " ".join(search.tokenize(description))
+    raw = f"{user_id}|{date or ''}|{cents}|{ttype or ''}|{desc}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def of_doc(doc):
+    """Fingerprint of a stored transaction document (either schema version)."""
+    return compute(doc.get("user_id"), schema.date_str(doc), schema.amount(doc),
+                   doc.get("type"), doc.get("description"))
+
+
+def find_existing(user_id, fingerprints, exclude_import=None):
+    """
+    {fingerprint: _id of an existing transaction} for those already stored (one
+    query), ignoring rows written by the import `exclude_import`.
+    """
+    fps = list(set(fingerprints))
+    if not fps:
+        return {}
+    flt = {"user_id": user_id, FIELD: {"$in": fps}}
+    if exclude_import:
+        flt["import_id"] = {"$ne": exclude_import}
+    found = {}
+    for d in transactions.find(flt, {FIELD: 1}):
+        found.setdefault(d[FIELD], d["_id"])
+    return found
+
+
+def backfill(batch_size=1000):
+    """Add fingerprints to documents written before they existed. Returns #updated."""
+    updated = 0
+    fields = {"user_id": 1, "type": 1, "description": 1, **dict.fromkeys(schema.FIELDS, 1)}
+    while True:
+        batch = list(transactions.find({FIELD: {"$exists": False}}, fields).limit(batch_size))
+        if not batch:
+            return updated
+        transactions.bulk_write([UpdateOne({"_id": d["_id"]}, {"$set": {FIELD: of_doc(d)}})
+                                 for d in batch], ordered=False)
+        updated += len(batch)
@@ -0,0 +1,54 @@
+"""
+Who is making the request, resolved from the signed session cookie.
+
+Login/signup store the public profile in the session (Flask signs the cookie
+with SECRET_KEY, so clients cannot alter it), so `/api/auth/me` and the
+blueprints' user-id helpers never touch Mongo. Sessions created before the
+profile was stored fall back to one lookup by _id, after which the profile is
+written into the session.
+"""
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from flask import session
+
+from db import users
+
+
+def public_user(u):
+    """
+    Convert a MongoDB user document into a safe public dictionary
+    - Excludes password hash
+    - Converts _id (ObjectId) into string
+    """
+    return {"id": str(u["_id"]), "name": u.get("name", ""), "email": u["email"]}
+
+
+def start_session(u):
+    session.clear()
+    session["user_id"] = str(u["_id"])
+    session["email"] = u["email"]
+    session["user"] = public_user(u)
+    session.permanent = True  # make cookie persistent
+
+
+def user_id():
+    """The logged-in user's id as a string, or None."""
+    return session.get("user_id")
+
+
+def current_user():
+    """Public profile of the logged-in user, or None."""
+    uid = session.get("user_id")
+    if not uid:
+        return None
+    profile = session.get("user")
+    if profile and profile.get("id") == uid:
+        return profile
+    try:
+        u = users.find_one({"_id": ObjectId(uid)}, {"password": 0})
+    except InvalidId:
+        u = None
+    if not u:
+        return None
+    session["user"] = public_user(u)
+    return session["user"]
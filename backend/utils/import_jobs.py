@@ -0,0 +1,103 @@
+"""
+Background import jobs for large uploads.
+
+`submit()` records a job in the `import_jobs` collection and hands the parse to
+a small local thread pool (IMPORT_JOB_WORKERS), so the HTTP worker returns
+immediately and the number of concurrent heavy parses is bounded separately
+from API traffic. The heavy OCR/table work itself still fans out through
+utils.parse_pool when that is enabled.
+
+Job state lives in Mongo so any API worker can answer a status poll:
+  status   queued | running | done | failed
+  progress {"done": pages finished, "total": pages queued so far}
+  items    candidate rows once done
+Jobs expire IMPORT_JOB_TTL seconds after creation via the TTL index on
+`expires_at`; deleting a running job makes it stop at the next page.
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from config import Config
+from db import import_jobs
+from utils import import_pipeline, ledger
+
+_executor = ThreadPoolExecutor(max_workers=max(1, Config.IMPORT_JOB_WORKERS),
+                               thread_name_prefix="import-job")
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def submit(user_id, uploads):
+    """Queue parsing of spooled `uploads` (the job takes ownership and closes them)."""
+    now = datetime.utcnow()
+    job_id = uuid.uuid4().hex
+    import_jobs.insert_one({
+        "_id": job_id,
+        "user_id": user_id,
+        "status": "queued",
+        "files": [name for name, _, _ in uploads],
+        "progress": {"done": 0, "total": 0},
+        "items": None,
+        "error": None,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=Config.IMPORT_JOB_TTL),
+    })
+    _executor.submit(_run, job_id, user_id, uploads)
+    return job_id
+
+
+def _update(job_id, fields):
+    res = import_jobs.update_one({"_id": job_id}, {"$set": fields})
+    if res.matched_count == 0:
+        raise _Cancelled()
+
+
+def _run(job_id, user_id, uploads):
+    try:
+        _update(job_id, {"status": "running", "started_at": datetime.utcnow()})
+
+        def on_change(done, total):
+            _update(job_id, {"progress": {"done": done, "total": total}})
+
+        items = import_pipeline.parse_uploads(uploads, import_pipeline.Progress(on_change))
+        ledger.flag_duplicates(str(user_id), items)
+        _update(job_id, {"status": "done", "items": items, "finished_at": datetime.utcnow()})
+    except _Cancelled:
+        pass
+    except Exception as e:
+        import_jobs.update_one({"_id": job_id}, {"$set": {
+            "status": "failed", "error": str(e), "finished_at": datetime.utcnow()}})
+    finally:
+        import_pipeline.close_uploads(uploads)
+
+
+def get(job_id, user_id):
+    """Public view of a job, or None if it does not exist / belongs to someone else / expired."""
+    job = import_jobs.find_one({"_id": job_id, "user_id": user_id})
+    if not job or job["expires_at"] <= datetime.utcnow():
+        return None
+    out = {
+        "id": job["_id"],
+        "status": job["status"],
+        "files": job["files"],
+        "progress": job["progress"],
+        "created_at": job["created_at"].isoformat() + "Z",
+    }
+    if job["status"] == "done":
+        out["items"] = job["items"]
+    if job["status"] == "failed":
+        out["error"] = job["error"]
+    return out
+
+
+def delete(job_id, user_id):
+    """Drop a job (cancelling it if still running). Returns True if it existed."""
+    return import_jobs.delete_one({"_id": job_id, "user_id": user_id}).deleted_count > 0
+
+
+def cleanup():
+    """Remove expired jobs now (the TTL monitor does this lazily, about once a minute)."""
+    return import_jobs.delete_many({"expires_at": {"$lte": datetime.utcnow()}}).deleted_count
@@ -0,0 +1,218 @@
+"""
+Parsing of uploaded statement/receipt files into candidate transactions.
+
+Shared by the synchronous /api/imports/parse path and background import jobs:
+every PDF page is classified once and parsed by the cheapest parser that works
+(tables, then text-layer lines, OCR only for scanned pages); images go
+straight to OCR; CSV/OFX exports are read by utils.statement_import. Work is fanned out per file and per page
+through utils.parse_pool in contiguous page batches, and results are cached by file content.
+
+Uploads never touch a named file: `spool_upload` keeps files up to a threshold
+as bytes and spools larger ones to an anonymous TemporaryFile (unlinked at
+creation, so nothing is left behind if the worker dies), and the parsers read
+bytes / file objects directly.
+"""
+import hashlib
+import shutil
+import tempfile
+import threading
+
+from utils import parse_cache, pdf_table, parse_pool, statement_import
+
+# utils.ocr_receipt (OpenCV, Tesseract, pdfium) is imported on first use so
+# app start-up and non-import requests never load it
+
+# bump whenever parsing/normalization output changes: invalidates utils.parse_cache
+PARSER_VERSION = 4
+
+
+class Progress:
+    """Thread-safe pages done / pages total counter with an optional change callback."""
+
+    def __init__(self, on_change=None):
+        self.done = 0
+        self.total = 0
+        self._on_change = on_change
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.total += n
+        self._notify()
+
+    def step(self, n=1):
+        with self._lock:
+            self.done += n
+        self._notify()
+
+    def _notify(self):
+        if self._on_change:
+            self._on_change(self.done, self.total)
+
+
+def spool_upload(stream, threshold, spool_dir=None):
+    """Read an upload stream into bytes (≤ threshold) or an anonymous temp file."""
+    head = stream.read(threshold + 1)
+    if len(head) <= threshold:
+        return head
+    spool = tempfile.TemporaryFile(dir=spool_dir)
+    spool.write(head)
+    shutil.copyfileobj(stream, spool, 1 << 20)
+    spool.seek(0)
+    return spool
+
+
+def close_uploads(uploads):
+    for _, src, _ in uploads:
+        if hasattr(src, "close"):
+            src.close()
+
+
+# per-page fan-out: every call reopens its file, so a file is split into at most
+# this many page batches per pool worker (or in total, inline) instead of one
+# call per page, which would parse a large PDF once for each of its pages
+BATCHES_PER_WORKER = 4
+
+def _calls(src, fn, pages, per_page):
+    """
+    [(call, #pages)]: contiguous page batches of the file (for fan-out /
+    progress), else one call for the whole file/page set.
+    """
+    if not per_page:
+        return [((fn, src) if pages is None else (fn, src, list(pages)), 1)]
+    from utils import ocr_receipt
+    pages = list(pages if pages is not None else range(ocr_receipt.page_count(src)))
+    batches = max(1, parse_pool.size()) * BATCHES_PER_WORKER
+    step = max(1, -(-len(pages) // batches))
+    return [((fn, src, pages[n:n + step]), len(pages[n:n + step])) for n in range(0, len(pages), step)]
+
+def _run_parallel(jobs, progress=None):
+    """
+    jobs: list of (key, src, fn, pages or None) → {key: concatenated results},
+    with the page batches of every job running in parallel on the parse pool.
+    """
+    per_page = parse_pool.enabled() or progress is not None
+    calls, owner, sizes = [], [], []
+    for key, src, fn, pages in jobs:
+        if parse_pool.enabled() and hasattr(src, "read"):
+            # pool workers need a picklable payload; file objects stay in this process
+            src.seek(0)
+            src = src.read()
+        for c, n in _calls(src, fn, pages, per_page):
+            calls.append(c)
+            owner.append(key)
+            sizes.append(n)
+    on_done = None
+    if progress:
+        progress.add(sum(sizes))
+        done = iter(sizes)  # results are collected in call order
+        on_done = lambda: progress.step(next(done))
+    out = {key: [] for key, _, _, _ in jobs}
+    for key, rows in zip(owner, parse_pool.run_ordered(calls, on_done=on_done)):
+        out[key].extend(rows or [])
+    return out
+
+def _scanned_runs(pages):
+    """Consecutive scanned pages of one PDF as [pages] runs ([None]: the whole file)."""
+    runs = []
+    for pg in pages:
+        if pg["kind"] != "image":
+            continue
+        p = pg["page"]
+        if p is not None and runs and runs[-1][-1] is not None and runs[-1][-1] == p - 1:
+            runs[-1].append(p)
+        else:
+            runs.append([p])
+    return runs
+
+def parse_uploads(uploads, progress=None):
+    """
+    uploads: list of (original filename, src, ext) in upload order, where src is
+    bytes or a file object from spool_upload.
+    Returns normalized candidate rows (not committed). Files seen before (same
+    bytes, same PARSER_VERSION) come from utils.parse_cache. `progress`, if
+    given, is a Progress that is told about every page queued and finished.
+    """
+    from utils import ocr_receipt
+    keys = [parse_cache.file_key(src, ext, PARSER_VERSION) for _, src, ext in uploads]
+    per_file = [parse_cache.get(k) for k in keys]
+    todo = [i for i, rows in enumerate(per_file) if rows is None]
+    # exports are parsed inline: no OCR or table extraction to fan out
+    exports = [i for i in todo if uploads[i][2] in statement_import.FORMATS]
+    todo = [i for i in todo if i not in exports]
+
+    # pass 1: PDFs get every page classified once (table / text layer / image)
+    # and the first two parsed on the spot; images go straight to OCR
+    first = _run_parallel([
+        (i, uploads[i][1],
+         pdf_table.parse_pdf_pages if uploads[i][2] == "pdf" else ocr_receipt.parse_receipt_image_or_pdf,
+         None)
+        for i in todo
+    ], progress)
+    # pass 2: OCR only the PDF pages without a text layer, a run of consecutive
+    # scanned pages per job (keyed by its first page)
+    ocr_pages = _run_parallel([
+        ((i, run[0]), uploads[i][1], ocr_receipt.parse_receipt_image_or_pdf,
+         None if run[0] is None else run)
+        for i in todo if uploads[i][2] == "pdf"
+        for run in _scanned_runs(first[i])
+    ], progress)
+
+    for i in exports:
+        ext = uploads[i][2]
+        mode = statement_import.FORMATS[ext]
+        per_file[i] = [{**r, "_source": {"mode": mode}}
+                       for r in statement_import.iter_rows(uploads[i][1], ext)]
+        parse_cache.put(keys[i], per_file[i])
+
+    for i in todo:
+        if uploads[i][2] != "pdf":
+            rows = [_from_ocr(it, "ocr_image") for it in first[i]]
+        else:
+            rows = []
+            for pg in pdf_table.stitch_pages(first[i]):  # page order
+                if pg["kind"] == "image":
+                    # a run's rows come with its first page, in page order
+                    rows.extend(_from_ocr(it, "ocr_pdf") for it in ocr_pages.get((i, pg["page"]), []))
+                else:
+                    rows.extend(_from_table(r, "pdf_" + pg["kind"]) for r in pg["rows"])
+        # Basic sanitization: drop empties
+        per_file[i] = [c for c in rows if c.get("amount")]
+        parse_cache.put(keys[i], per_file[i])
+
+    all_candidates = []
+    for key, (name, _, _), rows in zip(keys, uploads, per_file):
+        for n, c in enumerate(rows):
+            all_candidates.append({
+                **c,
+                # stable per (file content, row): committing the same statement
+                # twice, or retrying a commit, cannot insert the row twice;
+                # exports bring their own (e.g. OFX FITIDs)
+                "idempotency_key": c.get("idempotency_key")
+                                   or hashlib.sha1(f"{key}:{n}".encode()).hexdigest(),
+                "_source": {"file": name, "mode": c["_source"]["mode"]},
+            })
+    return all_candidates
+
+
+def _from_table(r, mode):
+    # normalize to unified schema
+    return {
+        "date": r.get("date"),
+        "type": r.get("type"),
+        "category": r.get("category") or "",  # user can adjust
+        "description": r.get("description") or "",
+        "amount": float(r.get("amount") or 0),
+        "_source": {"mode": mode}
+    }
+
+
+def _from_ocr(it, mode):
+    return {
+        "date": it.get("date"),
+        "type": it.get("type") or "expense",
+        "category": it.get("category") or "",
+        "description": it.get("description") or "",
+        "amount": float(it.get("amount") or 0),
+        "_source": {"mode": mode}
+    }
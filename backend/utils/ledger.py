@@ -0,0 +1,314 @@
+"""
+Transaction write path shared by every route that creates, edits or removes rows.
+
+`build_doc` normalizes client input into the stored document shape (schema v2,
+see utils.schema, including the search tokens and duplicate fingerprint), and the insert helpers keep derived data in step with the
+collection: monthly rollups are $inc'ed for exactly the rows that were written
+and the user's response-cache version is bumped once per write.
+
+Edits and removals do the same from the documents they replaced. The bulk
+variants (`recategorize`, `delete_matching`) never load the rows: one aggregate
+takes their rollup totals, one update_many / delete_many changes them, one
+bulk_write moves the totals, whatever the number of rows.
+"""
+import sys
+from datetime import datetime, date
+
+from pymongo.errors import BulkWriteError
+
+from db import transactions
+from utils import cache, fingerprint, rollups, schema, search
+
+# rows per insert_many round trip in bulk commits
+CHUNK_SIZE = 500
+
+_DUPLICATE_KEY = 11000
+
+
+def norm_date_str(x):
+    # accept datetime/date/str and return 'YYYY-MM-DD' or None
+    if isinstance(x, (datetime, date)):
+        return x.isoformat()[:10]
+    if isinstance(x, str):
+        return x[:10] if len(x) >= 10 else None
+    return None
+
+
+def build_doc(uid, data):
+    """Normalized transaction document for `data` (create_transaction semantics)."""
+    doc = {
+        "user_id": uid,  # keep as string id
+        "v": schema.VERSION,
+        "date": schema.to_date(norm_date_str(data.get("date"))),
+        "type": "income" if (data.get("type") == "income") else "expense",
+        "category": (data.get("category") or "").strip() or "Uncategorized",
+        "description": (data.get("description") or "").strip(),
+        "cents": schema.to_cents(data.get("amount")),
+    }
+    doc[fingerprint.FIELD] = fingerprint.of_doc(doc)
+    return search.with_tokens(doc)
+
+
+def validate(data, partial=False):
+    """
+    Error message for a row that must not be committed as-is, else None. With
+    `partial` (edits) only the fields present in `data` are checked.
+    """
+    if not isinstance(data, dict):
+        return "row must be an object"
+    if not partial or "date" in data:
+        d = norm_date_str(data.get("date"))
+        try:
+            datetime.strptime(d or "", "%Y-%m-%d")
+        except ValueError:
+            return "date must be YYYY-MM-DD"
+    if not partial or "amount" in data:
+        try:
+            amount = float(data.get("amount"))
+        except (TypeError, ValueError):
+            return "amount must be a number"
+        if amount <= 0:
+            return "amount must be positive"
+    for k in ("category", "description"):
+        if data.get(k) is not None and not isinstance(data[k], str):
+            return f"{k} must be a string"
+    return None
+
+
+def _file_of(row):
+    return (row.get("_source") or {}).get("file")
+
+
+def flag_duplicates(uid, rows, group_of=_file_of):
+    """
+    Mark candidate rows that look like transactions the user already has:
+    `duplicate` is True (and `duplicate_of` the stored id) when the row's
+    fingerprint is already stored, or appeared in an earlier group (file) of the
+    same batch; repeats inside one statement are kept, they are usually genuine.
+    One indexed $in lookup for the whole batch. Returns rows.
+    """
+    fps = [build_doc(uid, r)[fingerprint.FIELD] for r in rows]
+    existing = fingerprint.find_existing(uid, fps)
+    first_group = {}
+    for r, fp in zip(rows, fps):
+        group = group_of(r)
+        first_group.setdefault(fp, group)
+        if fp in existing:
+            r["duplicate"], r["duplicate_of"] = True, str(existing[fp])
+        else:
+            r["duplicate"], r["duplicate_of"] = first_group[fp] != group, None
+    return rows
+
+
+def insert_one(uid, doc):
+    res = transactions.insert_one(doc)
+    rollups.apply([doc])
+    cache.bump(uid)
+    return res.inserted_id
+
+
+def insert_many(uid, docs, chunk_size=CHUNK_SIZE):
+    """
+    Unordered, chunked insert. Returns one entry per doc, in order:
+      ("inserted", _id) | ("duplicate", None) | ("error", message)
+    Duplicates are rows whose (user_id, import_key) already exists.
+    """
+    results = []
+    written = []
+    for start in range(0, len(docs), chunk_size):
+        chunk = docs[start:start + chunk_size]
+        failed = {}
+        try:
+            transactions.insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                failed[err["index"]] = err
+        for n, doc in enumerate(chunk):
+            err = failed.get(n)
+            if err is None:
+                results.append(("inserted", doc["_id"]))
+                written.append(doc)
+            elif err.get("code") == _DUPLICATE_KEY:
+                results.append(("duplicate", None))
+            else:
+                results.append(("error", err.get("errmsg", "write failed")))
+    if written:
+        rollups.apply(written)
+        cache.bump(uid)
+    return results
+
+
+def commit_rows(uid, items, import_id=None):
+    """
+    Validate and insert reviewed candidate rows, idempotent per `idempotency_key`.
+    Rows whose fingerprint matches a stored transaction, or a row of an earlier
+    file (`_source.file`) in this batch, are skipped unless they set
+    `allow_duplicate` (repeats inside one file are kept, as in flag_duplicates);
+    `import_id` tags the written rows so later batches of the same streamed
+    import do not count its own rows as duplicates.
+    Returns one result per item:
+      {"index", "status": inserted|duplicate|invalid|error, "id"/"reason"/"error"}
+    """
+    results = [None] * len(items)
+    docs, positions, dup_positions = [], [], []
+    seen = set()
+    for n, row in enumerate(items):
+        err = validate(row)
+        key = str(row.get("idempotency_key") or "").strip() if isinstance(row, dict) else ""
+        if not err and not key:
+            err = "idempotency_key is required"
+        if err:
+            results[n] = {"index": n, "status": "invalid", "error": err}
+            continue
+        if key in seen:  # repeated within this batch
+            dup_positions.append((n, key))
+            continue
+        seen.add(key)
+        doc = build_doc(uid, row)
+        doc["import_key"] = key
+        if import_id:
+            doc["import_id"] = import_id
+        docs.append(doc)
+        positions.append(n)
+
+    # overlapping statements: skip rows already stored (one indexed $in for the batch)
+    existing = fingerprint.find_existing(uid, [
+        d[fingerprint.FIELD] for d, n in zip(docs, positions) if not items[n].get("allow_duplicate")],
+        exclude_import=import_id)
+    keep, repeats, first_file = [], [], {}
+    for doc, n in zip(docs, positions):
+        fp, allow = doc[fingerprint.FIELD], items[n].get("allow_duplicate")
+        match = None if allow else existing.get(fp)
+        if match:
+            results[n] = {"index": n, "status": "duplicate", "reason": "fingerprint", "id": str(match)}
+        elif not allow and first_file.get(fp, _file_of(items[n])) != _file_of(items[n]):
+            repeats.append((n, fp))  # the same row, already accepted from another file
+        else:
+            first_file.setdefault(fp, _file_of(items[n]))
+            keep.append((doc, n))
+
+    key_to_id, fp_to_id = {}, {}
+    for (doc, n), (status, value) in zip(keep, insert_many(uid, [d for d, _ in keep])):
+        if status == "inserted":
+            key_to_id[doc["import_key"]] = value
+            fp_to_id.setdefault(doc[fingerprint.FIELD], value)
+            results[n] = {"index": n, "status": "inserted", "id": str(value)}
+        elif status == "duplicate":
+            dup_positions.append((n, doc["import_key"]))
+        else:
+            results[n] = {"index": n, "status": "error", "error": value}
+
+    # rows committed by an earlier attempt: one $in lookup for their ids
+    missing = list({k for _, k in dup_positions if k not in key_to_id})
+    if missing:
+        for d in transactions.find({"user_id": uid, "import_key": {"$in": missing}}, {"import_key": 1}):
+            key_to_id[d["import_key"]] = d["_id"]
+    for n, key in dup_positions:
+        found = key_to_id.get(key)
+        results[n] = {"index": n, "status": "duplicate", "reason": "idempotency_key",
+                      "id": str(found) if found else None}
+    for n, fp in repeats:
+        found = fp_to_id.get(fp)
+        results[n] = {"index": n, "status": "duplicate", "reason": "fingerprint",
+                      "id": str(found) if found else None}
+    return results
+
+
+# ---------- edits ----------
+EDITABLE = ("date", "type", "category", "description", "amount")
+
+
+def _edited(uid):
+    cache.bump(uid)
+    # analytics snapshots only catch up on appended rows; edits need a reload
+    # (the module is only loaded, and only holds snapshots, once analytics ran)
+    analytics = sys.modules.get("utils.analytics")
+    if analytics is not None:
+        analytics.forget(uid)
+
+
+# stored fields `_fields` reads, in either schema version
+_BUILT_FROM = ("v", "date", "type", "category", "description", "amount", "cents")
+
+
+def _fields(doc):
+    return {"date": schema.date_str(doc), "type": doc.get("type"), "category": doc.get("category"),
+            "description": doc.get("description"), "amount": schema.amount(doc)}
+
+
+def update_one(uid, tx_id, data):
+    """
+    Apply the EDITABLE fields present in `data` to one of the user's transactions
+    (build_doc semantics, so search tokens and fingerprint follow and a v1 row is
+    rewritten as v2). Only the fields sent are validated, so e.g. recategorizing
+    an undated row works. The write is conditional on the stored fields it was
+    built from and retried if another edit got in between. Returns the stored
+    document, None if there is no such transaction, or raises ValueError with
+    the validation error.
+    """
+    err = validate(data, partial=True)
+    if err:
+        raise ValueError(err)
+    edits = {k: data[k] for k in EDITABLE if k in data}
+    flt = {"_id": tx_id, "user_id": uid}
+    while True:
+        old = transactions.find_one(flt)
+        if old is None:
+            return None
+        new = build_doc(uid, {**_fields(old), **edits})
+        unset = {"amount": "", "created_at": ""}
+        if "date" in edits:
+            unset[schema.LEGACY_DATE] = ""
+        elif new["date"] is None and isinstance(old.get("date"), str):
+            new[schema.LEGACY_DATE] = old["date"]  # as schema.upgrade keeps it
+        read = {k: old.get(k) for k in _BUILT_FROM}  # None also matches a missing field
+        if transactions.update_one({**flt, **read}, {"$set": new, "$unset": unset}).matched_count:
+            break
+    rollups.apply([old], sign=-1)
+    rollups.apply([new])
+    _edited(uid)
+    return {**old, **new}
+
+
+def delete_one(uid, tx_id):
+    """Remove one of the user's transactions. Returns False if there is none."""
+    old = transactions.find_one_and_delete({"_id": tx_id, "user_id": uid})
+    if old is None:
+        return False
+    rollups.apply([old], sign=-1)
+    _edited(uid)
+    return True
+
+
+def _up_to(flt, last_id):
+    # rows inserted after the totals were taken are left alone, so the rollup
+    # shift matches what the write changed
+    return {"$and": [flt, {"_id": {"$lte": last_id}}]}
+
+
+def recategorize(uid, flt, category):
+    """
+    Move every transaction matching `flt` (scoped to `uid` by the caller) to
+    `category`. Returns the number of rows changed.
+    """
+    category = (category or "").strip() or "Uncategorized"
+    flt = {"$and": [flt, {"user_id": uid, "category": {"$ne": category}}]}
+    groups, last_id = rollups.totals(flt)
+    if last_id is None:
+        return 0
+    res = transactions.update_many(_up_to(flt, last_id), {"$set": {"category": category}})
+    rollups.shift(groups, {"category": category})
+    _edited(uid)
+    return res.modified_count
+
+
+def delete_matching(uid, flt):
+    """Remove every transaction matching `flt` (scoped to `uid`). Returns the number removed."""
+    flt = {"$and": [flt, {"user_id": uid}]}
+    groups, last_id = rollups.totals(flt)
+    if last_id is None:
+        return 0
+    res = transactions.delete_many(_up_to(flt, last_id))
+    rollups.shift(groups)
+    _edited(uid)
+    return res.deleted_count
@@ -0,0 +1,195 @@
+"""
+In-process metrics with Prometheus text exposition (no client library needed).
+
+  http_request_duration_seconds   histogram {method, endpoint, status}
+  mongodb_command_duration_seconds histogram {command, collection}
+  mongodb_command_failures_total  counter   {command, collection}
+  parse_stage_duration_seconds    histogram {stage}
+  ocr_timeouts_total              counter   {engine}
+
+`init_app` adds per-request timing: every response carries a `Server-Timing`
+header with the total, the time spent in Mongo commands and in parse stages.
+`CommandTimer` is a pymongo CommandListener (registered by db.get_client).
+Parse code wraps its stages in `stage("...")`; inside parse_pool worker
+processes the samples are captured and replayed in the parent, so they land
+in the serving process's histograms.
+
+Metrics are per process: with several gunicorn workers each exposes its own
+counts, and Prometheus sums them per instance.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, doc, labelnames=()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {v}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels → [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                for le, n in zip(self.buckets, s):
+                    out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, [('le', le)])} {n}")
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, [('le', '+Inf')])} {s[-1]}")
+                out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {s[-2]}")
+                out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {s[-1]}")
+        return out
+
+
+def render():
+    """All metrics in Prometheus text exposition format 0.0.4."""
+    lines = []
+    for m in _registry:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency",
+                          ("method", "endpoint", "status"))
+MONGO_DURATION = Histogram("mongodb_command_duration_seconds", "MongoDB command latency",
+                           ("command", "collection"))
+MONGO_FAILURES = Counter("mongodb_command_failures_total", "Failed MongoDB commands",
+                         ("command", "collection"))
+STAGE_DURATION = Histogram("parse_stage_duration_seconds", "OCR / PDF parse stage time per page",
+                           ("stage",))
+OCR_TIMEOUTS = Counter("ocr_timeouts_total", "OCR pages abandoned after OCR_TIMEOUT", ("engine",))
+
+
+# ---------- per-request timing ----------
+def _add_request_timing(name, seconds):
+    if has_request_context():
+        timing = g.setdefault("_timing", defaultdict(float))
+        timing[name] += seconds
+
+
+def init_app(app):
+    @app.before_request
+    def _start_timer():
+        g._t0 = time.perf_counter()
+
+    @app.after_request
+    def _finish_timer(resp):
+        t0 = g.pop("_t0", None)
+        if t0 is None:
+            return resp
+        total = time.perf_counter() - t0
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_DURATION.observe(total, method=request.method, endpoint=rule, status=resp.status_code)
+        parts = [f"total;dur={total * 1000:.1f}"]
+        parts += [f"{name};dur={secs * 1000:.1f}" for name, secs in sorted(g.get("_timing", {}).items())]
+        resp.headers["Server-Timing"] = ", ".join(parts)
+        return resp
+
+
+# ---------- MongoDB command monitoring ----------
+class CommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):  # getMore carries the cursor id here
+            target = event.command.get("collection", "")
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = target
+
+    def _finish(self, event):
+        with self._lock:
+            coll = self._pending.pop((event.connection_id, event.request_id), "")
+        secs = event.duration_micros / 1e6
+        MONGO_DURATION.observe(secs, command=event.command_name, collection=coll)
+        _add_request_timing("db", secs)
+        return coll
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        coll = self._finish(event)
+        MONGO_FAILURES.inc(command=event.command_name, collection=coll)
+
+
+# ---------- parse stages ----------
+_capture = threading.local()
+
+
+def observe_stage(name, seconds):
+    samples = getattr(_capture, "samples", None)
+    if samples is not None:
+        samples.append((name, seconds))
+    STAGE_DURATION.observe(seconds, stage=name)
+    _add_request_timing(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def captured(fn, *args):
+    """Run fn(*args) and also return the stage samples it recorded (for pool workers)."""
+    _capture.samples = []
+    try:
+        return fn(*args), _capture.samples
+    finally:
+        _capture.samples = None
@@ -0,0 +1,248 @@
+"""
+OCR engines behind `recognize(image, psm)`, used by utils.ocr_receipt.
+
+  TesserocrEngine   – libtesseract through tesserocr (optional dependency,
+                      `pip install tesserocr`): the language model is loaded
+                      once per engine and pages are handed over as in-memory
+                      pixel buffers.
+  PytesseractEngine – the original path and the fallback when tesserocr is not
+                      installed: one `tesseract` CLI process per page, which
+                      writes the image to a temp file and reloads the model.
+
+OCR_ENGINE (auto | tesserocr | pytesseract) picks one; auto prefers tesserocr.
+With tesserocr and OCR_WORKERS > 0, pages go to `OcrPool`: long-lived worker
+processes that each keep one engine loaded and receive the raw pixels over a
+pipe. A page that runs past OCR_TIMEOUT seconds has its worker killed (and
+replaced on the next job) and raises OcrTimeout; the pytesseract fallback
+applies the same timeout to its subprocess. Code already running inside a
+parse_pool worker process uses an in-process engine instead of starting a
+nested pool (the parse pool already bounds concurrency there; only the
+pytesseract path can time out in-process).
+"""
+import atexit
+import functools
+import multiprocessing
+import threading
+
+import numpy as np
+
+from config import Config
+from utils import metrics
+
+
+class OcrTimeout(RuntimeError):
+    pass
+
+
+class TesserocrEngine:
+    name = "tesserocr"
+
+    def __init__(self, lang="eng"):
+        import tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=lang, oem=tesserocr.OEM.DEFAULT)
+
+    def recognize(self, image, psm=6):
+        img = np.ascontiguousarray(image, dtype=np.uint8)
+        h, w = img.shape[:2]
+        bpp = 1 if img.ndim == 2 else img.shape[2]
+        self._api.SetPageSegMode(psm)
+        self._api.SetImageBytes(img.tobytes(), w, h, bpp, w * bpp)
+        return self._api.GetUTF8Text()
+
+
+class PytesseractEngine:
+    name = "pytesseract"
+
+    def __init__(self, lang="eng", timeout=0):
+        self.lang, self.timeout = lang, timeout
+
+    def recognize(self, image, psm=6):
+        import pytesseract
+        try:
+            return pytesseract.image_to_string(image, lang=self.lang, config=f"--oem 3 --psm {psm}",
+                                               timeout=self.timeout)
+        except RuntimeError as e:  # pytesseract signals its subprocess timeout this way
+            if "timeout" in str(e).lower():
+                raise OcrTimeout(f"tesseract exceeded {self.timeout}s") from e
+            raise
+
+
+@functools.lru_cache(maxsize=None)
+def tesserocr_available():
+    try:
+        import tesserocr  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# ---------- worker pool ----------
+def _serve(conn, factory):
+    """Worker process loop: one engine, jobs are (shape, psm) + raw pixel bytes."""
+    engine = factory()
+    while True:
+        try:
+            header = conn.recv()
+            if header is None:
+                return
+            shape, psm = header
+            buf = conn.recv_bytes()
+        except (EOFError, OSError):
+            return
+        try:
+            image = np.frombuffer(buf, np.uint8).reshape(shape)
+            conn.send((True, engine.recognize(image, psm)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, ctx, factory):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_serve, args=(child, factory), daemon=True)
+        self.proc.start()
+        child.close()
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.proc.kill()
+            else:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proc.join(timeout=1)
+        self.conn.close()
+
+
+class OcrPool:
+    """
+    `size` persistent OCR worker processes (spawned on demand) each holding one
+    engine from `factory` (a picklable zero-arg callable). `recognize` blocks
+    while all workers are busy; a worker that is released or discarded wakes
+    one waiter, which takes the idle worker or starts a replacement.
+    """
+
+    def __init__(self, size, timeout, factory, name="tesserocr"):
+        self.size, self.timeout, self.name = size, timeout, name
+        self._factory = factory
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = []  # most recently used last: its engine is warm
+        self._started = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._started >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            return _Worker(self._ctx, self._factory)
+        except Exception:
+            self._gone()
+            raise
+
+    def _release(self, worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def _gone(self):
+        with self._cond:
+            self._started -= 1
+            self._cond.notify()
+
+    def _discard(self, worker):
+        worker.stop(kill=True)
+        self._gone()
+
+    def recognize(self, image, psm=6):
+        img = np.ascontiguousarray(image, dtype=np.uint8)
+        worker = self._acquire()
+        try:
+            worker.conn.send((img.shape, psm))
+            worker.conn.send_bytes(img.reshape(-1))  # the pixel buffer itself, no encode
+            if not worker.conn.poll(self.timeout or None):
+                self._discard(worker)
+                metrics.OCR_TIMEOUTS.inc(engine=self.name)
+                raise OcrTimeout(f"OCR worker exceeded {self.timeout}s")
+            ok, value = worker.conn.recv()
+        except (EOFError, OSError) as e:  # worker died mid-job
+            self._discard(worker)
+            raise RuntimeError(f"OCR worker failed: {e}") from e
+        self._release(worker)
+        if not ok:
+            raise RuntimeError(value)
+        return value
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+# ---------- process-wide engine ----------
+_pool = None
+_local = threading.local()
+_setup_lock = threading.Lock()
+
+
+def _kind():
+    want = (Config.OCR_ENGINE or "auto").lower()
+    if want == "auto":
+        return "tesserocr" if tesserocr_available() else "pytesseract"
+    return want
+
+
+def _tesserocr_factory():
+    return TesserocrEngine(Config.OCR_LANG)
+
+
+def _in_pool_worker():
+    # spawned parse_pool / OCR workers have a multiprocessing parent; gunicorn
+    # forks and the dev server do not
+    return multiprocessing.parent_process() is not None
+
+
+def _local_engine():
+    engine = getattr(_local, "engine", None)
+    if engine is None:
+        if _kind() == "tesserocr":
+            engine = TesserocrEngine(Config.OCR_LANG)  # not thread-safe: one per thread
+        else:
+            engine = PytesseractEngine(Config.OCR_LANG, Config.OCR_TIMEOUT)
+        _local.engine = engine
+    return engine
+
+
+def get_pool():
+    """The process's OcrPool, or None when recognition runs in-process."""
+    global _pool
+    if _pool is None and Config.OCR_WORKERS > 0 and _kind() == "tesserocr" and not _in_pool_worker():
+        with _setup_lock:
+            if _pool is None:
+                _pool = OcrPool(Config.OCR_WORKERS, Config.OCR_TIMEOUT, _tesserocr_factory)
+                atexit.register(shutdown)
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def recognize(image, psm=6):
+    """OCR text of a grayscale/binary uint8 image. Raises OcrTimeout past OCR_TIMEOUT."""
+    pool = get_pool()
+    if pool is not None:
+        return pool.recognize(image, psm)
+    try:
+        return _local_engine().recognize(image, psm)
+    except OcrTimeout:
+        metrics.OCR_TIMEOUTS.inc(engine=_kind())
+        raise
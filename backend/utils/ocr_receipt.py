@@ -1,95 +1,182 @@
 import re
-import os
+import math
+import logging
+import threading
 import cv2
-import pytesseract
-from pdf2image import convert_from_path
+import numpy as np
+import pypdfium2 as pdfium
 from datetime import datetime
 
+from utils import ocr_engine, receipt_prep
+from utils.metrics import stage
+
+log = logging.getLogger(__name__)
+
 DATE_PAT = re.compile(r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})')
 TOTAL_PAT = re.compile(r'(?:TOTAL|Amount Payable|Grand Total|Balance Due)\D{0,10}(\d+[.,]\d{2})', re.IGNORECASE)
 AMOUNT_PAT = re.compile(r'(\d{1,3}(?:,\d{3})*(?:\.\d{2}))')
 ITEM_LINE_PAT = re.compile(r'^[A-Za-z].{2,}(\d+[.,]\d{2})$') 
 
-def parse_receipt_image_or_pdf(path):
-    """Return array of candidate transactions from a POS receipt (image or pdf)."""
-    images = []
-    if path.lower().endswith(".pdf"):
-        # convert each page to image (dpi 200→300 gives better OCR)
-        pil_pages = convert_from_path(path, dpi=220, fmt="png")
-        for p in pil_pages:
-            images.append(cv2.cvtColor(cv2.imdecode(
-                cv2.imencode(".png", cv2.cvtColor(
-                    cv2.cvtColor(
-                        cv2.UMat(cv2.cvtColor(
-                            cv2.UMat(cv2.cvtColor(
-                                cv2.UMat(cv2.cvtColor(
-                                    cv2.UMat(cv2.cvtColor(
-                                        cv2.UMat(cv2.cvtColor(
-                                            cv2.UMat(cv2.cvtColor(
-                                                cv2.UMat(cv2.cvtColor(
-                                                    cv2.UMat(cv2.cvtColor(
-                                                        cv2.UMat(cv2.cvtColor(
-                                                            cv2.UMat(cv2.cvtColor(
-                                                                cv2.UMat(cv2.cvtColor(
-                                                                    cv2.UMat(cv2.cvtColor(
-                                                                        cv2.UMat(p), cv2.COLOR_RGB2BGR)
-                                                                    ).get(), cv2.COLOR_BGR2RGB)
-                                                                ).get(), cv2.COLOR_RGB2BGR)
-                                                            ).get(), cv2.COLOR_BGR2RGB)
-                                                        ).get(), cv2.COLOR_RGB2BGR)
-                                                    ).get(), cv2.COLOR_BGR2RGB)
-                                                ).get(), cv2.COLOR_RGB2BGR)
-                                            ).get(), cv2.COLOR_BGR2RGB)
-                                        ).get(), cv2.COLOR_RGB2BGR)
-                                    ).get(), cv2.COLOR_BGR2RGB)
-                                ).get(), cv2.COLOR_RGB2BGR)
-                            ).get(), cv2.COLOR_BGR2RGB), cv2.COLOR_RGB2BGR)
-                        ).get(), cv2.COLOR_BGR2GRAY), cv2.IMREAD_UNCHANGED), 1.0)[1],
-                cv2.IMREAD_UNCHANGED))
-    else:
-        images.append(cv2.imdecode(
-            cv2.imencode(".png", cv2.imread(path))[1], cv2.IMREAD_UNCHANGED))
+# rasterization budget: PDFs render at OCR_DPI unless that would exceed
+# MAX_PAGE_PIXELS for the page; images larger than the cap are downscaled.
+# Only one page is held in memory at a time, so peak memory per request is
+# bounded by a single grayscale page (~MAX_PAGE_PIXELS bytes) regardless of
+# how many pages the document has.
+OCR_DPI = 220
+MAX_PAGE_PIXELS = 4000 * 4000
 
+def parse_receipt_image_or_pdf(src, pages=None):
+    """
+    Return array of candidate transactions from a POS receipt (image or pdf).
+    `src` is a path, the file bytes, or a seekable binary file object.
+    `pages` (0-based indexes) restricts a PDF to those pages.
+    """
     items = []
-    for img in images:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    for gray in _iter_gray_pages(src, pages):
+        item = _ocr_page(gray)
+        if item:
+            items.append(item)
+    return items
+
+def page_count(src):
+    """Number of OCR units in the file: PDF pages, or 1 for an image."""
+    if not _is_pdf(src):
+        return 1
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(_rewind(src))
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+def _is_pdf(src):
+    if isinstance(src, str):
+        return src.lower().endswith(".pdf")
+    if isinstance(src, (bytes, bytearray)):
+        return bytes(src[:4]) == b"%PDF"
+    head = _rewind(src).read(4)
+    _rewind(src)
+    return head == b"%PDF"
+
+def _rewind(src):
+    if hasattr(src, "seek"):
+        src.seek(0)
+    return src
+
+# PDFium is not thread-safe; import jobs may render from several threads
+_PDFIUM_LOCK = threading.Lock()
+
+def _iter_gray_pages(src, pages=None):
+    """Yield each page as a 2-D uint8 grayscale array, one page at a time."""
+    if not _is_pdf(src):
+        with stage("rasterize"):
+            if isinstance(src, str):
+                gray = cv2.imread(src, cv2.IMREAD_GRAYSCALE)
+            else:
+                data = src if isinstance(src, (bytes, bytearray)) else _rewind(src).read()
+                # decode straight from the upload buffer; no temp file
+                gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if gray is not None:
+                gray = _fit(gray)
+        if gray is not None:
+            yield gray
+        return
+
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(_rewind(src))  # path, bytes or file object; no temp file
+    try:
+        for i in (range(len(pdf)) if pages is None else pages):
+            with _PDFIUM_LOCK, stage("rasterize"):
+                if i >= len(pdf):
+                    continue
+                page = pdf[i]
+                dpi = _page_dpi(*page.get_size())
+                # render grayscale directly; no RGB→BGR→GRAY hops or re-encodes
+                bitmap = page.render(scale=dpi / 72.0, grayscale=True)
+                page.close()
+            # the array is a view over the bitmap buffer; `bitmap` stays alive
+            # until the consumer is done with this page
+            yield bitmap.to_numpy()
+    finally:
+        with _PDFIUM_LOCK:
+            pdf.close()
+
+def _page_dpi(width_pt, height_pt):
+    """Render DPI for a page: OCR_DPI, lowered where it would exceed MAX_PAGE_PIXELS."""
+    area_in2 = (float(width_pt) / 72.0) * (float(height_pt) / 72.0)
+    if area_in2 <= 0:
+        return OCR_DPI
+    return int(min(OCR_DPI, math.sqrt(MAX_PAGE_PIXELS / area_in2)))
+
+def _fit(gray):
+    h, w = gray.shape[:2]
+    if h * w <= MAX_PAGE_PIXELS:
+        return gray
+    scale = math.sqrt(MAX_PAGE_PIXELS / float(h * w))
+    return cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+def _ocr_page(gray):
+    """
+    Prepare + threshold + OCR one grayscale page and turn it into a candidate txn
+    (or None). Tall receipts OCR only the header/footer bands first; the full
+    page is read only when those do not give both a total and a date.
+    """
+    with stage("prepare"):
+        # crop to the paper, deskew, scale text to a Tesseract-friendly height
+        page = receipt_prep.prepare(gray, MAX_PAGE_PIXELS)
+
+    with stage("threshold"):
         # binarize (adaptive works well for receipts)
-        bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        bw = cv2.adaptiveThreshold(page, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
                                    cv2.THRESH_BINARY, 35, 15)
-        # mild denoise
-        den = cv2.medianBlur(bw, 3)
+        # mild denoise, in place
+        cv2.medianBlur(bw, 3, dst=bw)
 
-        text = pytesseract.image_to_string(den, config="--oem 3 --psm 6")
-        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    try:
+        fields = None
+        parts = receipt_prep.bands(bw)
+        if parts:
+            header, footer = (_ocr_lines(band) for band in parts)
+            with stage("extract"):
+                fields = _fields(header + footer, header, footer, banded=True)
+        if fields is None:
+            lines = _ocr_lines(bw)
+            with stage("extract"):
+                fields = _fields(lines, lines, lines)
+    except ocr_engine.OcrTimeout as e:
+        log.warning("skipping receipt page: %s", e)
+        return None
 
-        # date guess
-        date = _extract_date(lines)
-        # total by keyword (fallback to last amount)
-        total = _extract_total(lines)
+    date, amount, merchant = fields
+    if not amount:
+        return None
+    return {
+        "date": date or datetime.utcnow().strftime("%Y-%m-%d"),
+        "type": "expense",
+        "category": "Shopping",  # let user adjust later
         # description: store/merchant name = first non-numeric line
-        description = _guess_merchant(lines)
-
-        if total:
-            items.append({
-                "date": date or datetime.utcnow().strftime("%Y-%m-%d"),
-                "type": "expense",
-                "category": "Shopping",  # let user adjust later
-                "description": description,
-                "amount": float(total)
-            })
-        else:
-            # fallback: look for the last line with an amount and treat as total
-            amt = _last_amount(lines)
-            if amt:
-                items.append({
-                    "date": date or datetime.utcnow().strftime("%Y-%m-%d"),
-                    "type": "expense",
-                    "category": "Shopping",
-                    "description": description,
-                    "amount": float(amt)
-                })
+        "description": merchant,
+        "amount": float(amount)
+    }
 
-    return items
+def _ocr_lines(bw):
+    with stage("tesseract"):
+        # persistent engine / worker pool; see utils.ocr_engine
+        text = ocr_engine.recognize(bw, psm=6)
+    return [ln.strip() for ln in text.splitlines() if ln.strip()]
+
+def _fields(lines, header, footer, banded=False):
+    """
+    (date, amount, merchant) from OCR lines. With banded=True only a keyword
+    total counts and a date is required; None tells the caller to OCR the full page.
+    """
+    date = _extract_date(lines)
+    amount = _extract_total(footer)
+    if banded and (amount is None or date is None):
+        return None
+    # total by keyword (fallback: last line with an amount)
+    amount = amount or _extract_total(lines) or _last_amount(lines)
+    return date, amount, _guess_merchant(header)
 
 def _extract_date(lines):
     for ln in lines:
@@ -0,0 +1,142 @@
+"""
+Content-addressed cache of parse results for uploaded files.
+
+Key: sha256 of the file bytes + file extension + import_pipeline.PARSER_VERSION,
+so re-uploading the same statement/receipt (retries, other devices) returns
+the normalized candidate rows without re-running pdfplumber or Tesseract, and
+bumping PARSER_VERSION invalidates everything parsed by older code.
+
+Two tiers:
+  * memory – utils.cache.MemoryBackend (LRU, PARSE_CACHE_MAX_BYTES)
+  * disk   – optional JSON files under PARSE_CACHE_DIR, oldest evicted first
+             once PARSE_CACHE_DISK_MAX_BYTES is exceeded; survives restarts
+             and is shared by workers on the same host
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from config import Config
+from utils.cache import MemoryBackend
+
+# cached rows are immutable for a given key; the TTL only bounds staleness of
+# entries nobody asks for
+_TTL = 7 * 24 * 3600
+
+
+class DiskStore:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as fh:
+                data = fh.read()
+        except OSError:
+            return None
+        try:
+            os.utime(self._path(key))  # mark recently used for eviction order
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(value)
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+
+_memory = MemoryBackend(max_entries=Config.PARSE_CACHE_MAX_ENTRIES,
+                        max_bytes=Config.PARSE_CACHE_MAX_BYTES, ttl=_TTL)
+_disk = DiskStore(Config.PARSE_CACHE_DIR, Config.PARSE_CACHE_DISK_MAX_BYTES) \
+    if Config.PARSE_CACHE_DIR else None
+_counts = {"hits": 0, "disk_hits": 0, "misses": 0}
+_counts_lock = threading.Lock()
+
+
+def _count(name):
+    with _counts_lock:
+        _counts[name] += 1
+
+
+def file_key(src, ext, version):
+    """Cache key for an upload given as bytes or a seekable binary file object."""
+    h = hashlib.sha256()
+    if isinstance(src, (bytes, bytearray)):
+        h.update(src)
+    else:
+        src.seek(0)
+        for chunk in iter(lambda: src.read(1 << 20), b""):
+            h.update(chunk)
+        src.seek(0)
+    return f"{h.hexdigest()}-{ext}-v{version}"
+
+
+def get(key):
+    """Cached rows for `key`, or None."""
+    raw = _memory.get(key)
+    if raw is not None:
+        _count("hits")
+        return json.loads(raw)
+    if _disk is not None:
+        raw = _disk.get(key)
+        if raw is not None:
+            _count("disk_hits")
+            _memory.set(key, raw)
+            return json.loads(raw)
+    _count("misses")
+    return None
+
+
+def put(key, rows):
+    raw = json.dumps(rows, separators=(",", ":")).encode()
+    _memory.set(key, raw)
+    if _disk is not None:
+        _disk.set(key, raw)
+
+
+def stats():
+    lookups = _counts["hits"] + _counts["disk_hits"] + _counts["misses"]
+    mem = _memory.stats()
+    return {
+        **_counts,
+        "hit_rate": ((_counts["hits"] + _counts["disk_hits"]) / lookups) if lookups else 0.0,
+        "entries": mem["entries"],
+        "bytes": mem["bytes"],
+        "max_bytes": mem["max_bytes"],
+        "evictions": mem["evictions"] + (_disk.evictions if _disk else 0),
+        "disk": bool(_disk),
+    }
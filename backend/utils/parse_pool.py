@@ -0,0 +1,70 @@
+"""
+Process pool for CPU-bound import parsing (Tesseract, OpenCV, pdfplumber).
+
+`init(workers)` starts one pool per process (idempotent, called from
+create_app). `run_ordered(calls)` fans a list of `(fn, *args)` calls out to the
+pool and returns their results in the original order; without a pool
+(PARSE_WORKERS=0) the calls run inline on the request thread.
+
+Workers are started with the "spawn" method so they never inherit the
+parent's MongoClient sockets or Flask state; the parse functions they run are
+plain module-level functions from utils/ that need neither.
+"""
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import metrics
+
+_executor = None
+
+
+def init(workers):
+    """Start the pool with `workers` processes (0 → disabled). Safe to call repeatedly."""
+    global _executor
+    if _executor is None and workers and workers > 0:
+        _executor = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        atexit.register(shutdown)
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def enabled():
+    return _executor is not None
+
+
+def size():
+    """Worker processes in the pool (0 without one)."""
+    return _executor._max_workers if _executor is not None else 0
+
+
+def run_ordered(calls, on_done=None):
+    """
+    Run `(fn, *args)` calls, in parallel when the pool is up; results keep input order.
+    `on_done()` is called after each result is collected (progress reporting).
+    """
+    if _executor is None:
+        results = []
+        for fn, *args in calls:
+            results.append(fn(*args))
+            if on_done:
+                on_done()
+        return results
+    # workers send their parse-stage timings back so they land in this process's metrics
+    futures = [_executor.submit(metrics.captured, fn, *args) for fn, *args in calls]
+    results = []
+    for f in futures:
+        result, stages = f.result()
+        for name, secs in stages:
+            metrics.observe_stage(name, secs)
+        results.append(result)
+        if on_done:
+            on_done()
+    return results
@@ -1,63 +1,289 @@
-import pdfplumber
-from datetime import datetime
+import io
+import re
+
+from utils.metrics import stage
 
 HEADER_MAP = {
     "date": ["date","txn date","transaction date","value date"],
     "description": ["description","narration","details","particulars"],
     "category": ["category","title"],
     "amount":["amount","txn amount","amt"],
+    "debit": ["debit","withdrawal"],
+    "credit": ["credit","deposit"],
     "type": ["type"]
 }
 
+# pages with fewer text-layer characters than this are treated as scanned images
+MIN_TEXT_CHARS = 20
+
+_AMT = r'-?[\d,]+\.\d{2}(?:\s?(?:Cr|Dr))?'
+TEXT_LINE_PAT = re.compile(
+    r'^(?P<date>\d{1,2}[-/. ](?:\d{1,2}|[A-Za-z]{3})[-/. ]\d{2,4}|\d{4}-\d{2}-\d{2})\s+'
+    r'(?P<desc>.+?)\s+(?P<amount>' + _AMT + r')(?:\s+' + _AMT + r')?$'
+)
+
 def normalize_header(h):
     return (h or "").strip().lower().replace("\n"," ").replace("  "," ")
 
-def parse_tabular_pdf(path):
+def parse_tabular_pdf(src, pages=None):
     """
     Parses PDFs that contain tabular (bank-like) data.
+    `src` is a path, the file bytes, or a seekable binary file object.
     Returns list of dict rows with date, description, amount, type.
+    `pages` (0-based indexes) restricts parsing to those pages.
     """
-    rows = []
-    with pdfplumber.open(path) as pdf:
+    rows, carry = [], None
+    with _open(src, pages) as pdf:
+        for page in pdf.pages:
+            with stage("pdf_tables"):
+                found, profile, orphans = _page_tables(page)
+                lead = _continued(carry, orphans)
+            rows.extend(lead)
+            rows.extend(found)
+            carry = profile or (carry if lead else None)
+    return rows
+
+def parse_pdf_pages(src, pages=None):
+    """
+    Classify every page once and parse it with the cheapest parser that works:
+      table – extracted tables with a recognizable header
+      text  – text layer without tables → statement-style line parsing
+      image – no text layer (scanned) → left for OCR, rows = []
+    Returns [{"page": 0-based index, "kind": ..., "rows": [...]}] in page order;
+    pages with table profiles or header-less tables carry extra keys until the
+    results of every page of the file go through stitch_pages.
+    If pdfminer cannot read the file at all, returns a single
+    {"page": None, "kind": "image"} entry so the caller OCRs the whole file.
+    """
+    try:
+        pdf = _open(src, pages)
+    except Exception:
+        return [{"page": None, "kind": "image", "rows": []}]
+    out = []
+    with pdf:
         for page in pdf.pages:
-            tables = page.extract_tables()
-            for tbl in tables or []:
-                if not tbl or len(tbl) < 2: 
-                    continue
-                header = [normalize_header(c) for c in (tbl[0] or [])]
-                idx = _map_header_indexes(header)
-                # if we fail to map essential columns, skip
-                if not (idx.get("date") and (idx.get("amount") or (idx.get("debit") or idx.get("credit")))):
-                    continue
-                for r in tbl[1:]:
-                    if not any(r): 
-                        continue
-                    date = _parse_date(_get(r, idx["date"]))
-                    desc = _get(r, idx.get("description"))
-                    amt = None
-                    if idx.get("amount") is not None:
-                        amt = _to_float(_get(r, idx["amount"]))
-                    else:
-                        debit = _to_float(_get(r, idx.get("debit")))
-                        credit = _to_float(_get(r, idx.get("credit")))
-                        if credit: amt = abs(credit)
-                        elif debit: amt = -abs(debit)
-                    if amt is None:
-                        continue
-                    if idx.get("type") is not None:
-                        ttype = _get(r, idx.get("type"))
-                    if idx.get("category") is not None:
-                        category = _get(r, idx.get("category"))
-
-                    rows.append({
-                        "date": date or "",
-                        "description": (desc or "").strip(),
-                        "amount": abs(amt),
-                        "type": ttype,
-                        "category": category, 
-                    })
+            out.append({"page": page.page_number - 1, **classify_page(page)})
+    return out
+
+def classify_page(page):
+    with stage("pdf_classify"):
+        scanned = len(page.chars) < MIN_TEXT_CHARS
+    if scanned:
+        return {"kind": "image", "rows": []}
+    with stage("pdf_tables"):
+        rows, profile, orphans = _page_tables(page)
+    out = {"kind": "table", "rows": rows}
+    if profile:
+        out["profile"] = profile
+    if orphans:
+        out["orphans"] = orphans
+    if rows:
+        return out
+    with stage("pdf_text"):
+        text_rows = parse_text_lines(page.extract_text() or "")
+    if orphans:
+        out["fallback"] = text_rows  # used if the tables continue no earlier page
+        return out
+    return {**out, "kind": "text", "rows": text_rows}
+
+def parse_text_lines(text):
+    """Statement-style lines: `<date> <description> <amount>[ Dr|Cr] [<balance>]`."""
+    rows = []
+    for ln in text.splitlines():
+        m = TEXT_LINE_PAT.match(ln.strip())
+        if not m:
+            continue
+        date = _parse_date(m.group("date"))
+        amt = _to_float(m.group("amount").replace(" ", ""))
+        if not date or amt is None:
+            continue
+        raw = m.group("amount")
+        rows.append({
+            "date": date,
+            "description": m.group("desc").strip(),
+            "amount": abs(amt),
+            "type": "income" if raw.rstrip().endswith("Cr") else "expense",
+            "category": "",
+        })
     return rows
 
+def _open(src, pages=None):
+    import pdfplumber  # heavy (pdfminer); loaded on first PDF, not at app start
+    if isinstance(src, (bytes, bytearray)):
+        src = io.BytesIO(src)
+    elif hasattr(src, "seek"):
+        src.seek(0)
+    return pdfplumber.open(src, pages=[i + 1 for i in pages] if pages is not None else None)
+
+def _page_tables(page):
+    """
+    (rows, profile, orphans) of one page. A table whose first row is a header
+    gets its own profile; a header-less table after it on the same page is read
+    with that profile when it fits. Header-less tables before the page's first
+    header (continuation pages) are returned as `orphans` for the caller to
+    resolve against the previous page's profile; `profile` is the last one seen.
+    """
+    rows, profile, orphans = [], None, []
+    for tbl in page.extract_tables() or []:
+        if not tbl:
+            continue
+        found = _header_profile(tbl)
+        if found:
+            profile = found
+            rows.extend(_table_rows(tbl[1:], profile))
+        elif profile:
+            rows.extend(_table_rows(tbl, profile) if _continues(profile, tbl) else [])
+        else:
+            orphans.append(tbl)
+    return rows, profile, orphans
+
+def _continued(profile, orphans):
+    """Rows of header-less `orphans` tables that continue the table `profile` describes."""
+    if not profile:
+        return []
+    return [row for tbl in orphans if _continues(profile, tbl) for row in _table_rows(tbl, profile)]
+
+def stitch_pages(pages):
+    """
+    Resolve the continuation tables of parse_pdf_pages results, in page order:
+    each page's last table profile carries into the next page's header-less
+    tables. A page whose header-less tables continue nothing keeps its text-line
+    parse. Pages are classified independently (possibly in different worker
+    processes), so this runs once all of a file's pages are back. In place;
+    returns `pages` without the internal keys.
+    """
+    carry = None
+    for pg in pages:
+        profile, orphans = pg.pop("profile", None), pg.pop("orphans", None)
+        fallback = pg.pop("fallback", None)
+        lead = _continued(carry, orphans or [])
+        if lead:
+            pg["kind"], pg["rows"] = "table", lead + pg["rows"]
+        elif fallback is not None:
+            pg["kind"], pg["rows"] = "text", fallback
+        carry = profile or (carry if lead else None)
+    return pages
+
+# ---------- column profile ----------
+# A table is profiled once, from its header and its first SAMPLE_ROWS rows: the
+# header mapping, the date layout and the amount convention. Every row is then
+# read with one precompiled match per cell instead of guessing per row.
+SAMPLE_ROWS = 50
+
+_SEP = r"[-/. ]"
+# layout → (pattern, group index of year, month, day); tried in this order, so
+# an ambiguous 01/02/2024 reads day-first unless the column says otherwise
+DATE_LAYOUTS = {
+    "dmy": (re.compile(rf"(\d{{1,2}}){_SEP}(\d{{1,2}}){_SEP}(\d{{4}})$"), (2, 1, 0)),
+    "ymd": (re.compile(rf"(\d{{4}}){_SEP}(\d{{1,2}}){_SEP}(\d{{1,2}})$"), (0, 1, 2)),
+    "dmy2": (re.compile(rf"(\d{{1,2}}){_SEP}(\d{{1,2}}){_SEP}(\d{{2}})$"), (2, 1, 0)),
+    "dby": (re.compile(rf"(\d{{1,2}}){_SEP}([A-Za-z]{{3}}){_SEP}(\d{{4}})$"), (2, 1, 0)),
+    "dby2": (re.compile(rf"(\d{{1,2}}){_SEP}([A-Za-z]{{3}}){_SEP}(\d{{2}})$"), (2, 1, 0)),
+    "mdy": (re.compile(rf"(\d{{1,2}}){_SEP}(\d{{1,2}}){_SEP}(\d{{4}})$"), (2, 0, 1)),
+}
+_MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+_DAYS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# [currency] [sign] 1,23,456.78 [Cr|Dr]
+_AMOUNT = re.compile(r"(?:₹|INR|Rs\.?)?\s*([+-])?\s*(?:₹|INR)?\s*(\d[\d,]*(?:\.\d+)?|\.\d+)"
+                     r"\s*(?:INR)?\s*((?i:cr|dr))?\.?$")
+
+def _has_columns(idx):
+    return "date" in idx and ("amount" in idx or "debit" in idx or "credit" in idx)
+
+def _header_profile(tbl):
+    """Profile of `tbl` if its first row is a statement header mapping a date and an amount, else None."""
+    header = [normalize_header(c) for c in (tbl[0] or [])]
+    idx = _map_header_indexes(header)
+    if not _has_columns(idx):
+        return None
+    return _profile_table(idx, tbl[1:1 + SAMPLE_ROWS], len(header))
+
+def _profile_table(idx, sample, width=None):
+    """
+    {"idx": header indexes, "width": #columns, "date": DATE_LAYOUTS key (None →
+    try every layout per row), "amount": split | suffix | signed | plain}:
+      split  – separate debit / credit columns
+      suffix – amounts marked Cr / Dr
+      signed – negative amounts are expenses, positive ones income
+      plain  – unsigned amounts; the type column (if any) decides
+    """
+    dates = [d for d in (_get(r, idx["date"]) for r in sample) if d]
+    layout, hits = None, 0
+    for name in DATE_LAYOUTS:
+        n = sum(1 for d in dates if _date_in(name, d))
+        if n > hits:
+            layout, hits = name, n
+    if "amount" not in idx:
+        amount = "split"
+    else:
+        parsed = [_amount(_get(r, idx["amount"])) for r in sample]
+        parsed = [p for p in parsed if p]
+        if any(mark for _, mark in parsed):
+            amount = "suffix"
+        elif any(v < 0 for v, _ in parsed):
+            amount = "signed"
+        else:
+            amount = "plain"
+    return {"idx": idx, "width": width, "date": layout, "amount": amount}
+
+def _continues(profile, tbl):
+    """Whether header-less `tbl` has the profiled columns and (mostly) dates in its layout."""
+    if profile["width"] is not None and len(tbl[0] or []) != profile["width"]:
+        return False
+    dates = [d for d in (_get(r, profile["idx"]["date"]) for r in tbl[:SAMPLE_ROWS]) if d]
+    ok = sum(1 for d in dates if _profiled_date(profile, d))
+    return ok > 0 and ok * 2 > len(dates)
+
+def _profiled_date(profile, s):
+    layout = profile["date"]
+    return (_date_in(layout, s) if layout else None) or _parse_date(s)
+
+def _table_rows(rows, profile):
+    return [row for row in (_table_row(r, profile) for r in rows) if row]
+
+def _table_row(r, profile):
+    """
+    Normalize one data row of a profiled table (PDF table or CSV line).
+    Returns None for blank rows and rows without an amount.
+    """
+    if not any(r):
+        return None
+    idx, mode = profile["idx"], profile["amount"]
+    side = None
+    if mode == "split":
+        credit = _to_float(_get(r, idx.get("credit")))
+        debit = _to_float(_get(r, idx.get("debit")))
+        if credit: amt, side = credit, "income"
+        elif debit: amt, side = debit, "expense"
+        else: return None
+    else:
+        parsed = _amount(_get(r, idx["amount"]))
+        if not parsed:
+            return None
+        amt, mark = parsed
+        if mode == "suffix":
+            side = _TYPE_WORDS.get(mark)
+        elif mode == "signed":
+            side = "expense" if amt < 0 else "income"
+    raw = _get(r, idx["date"])
+    date = _profiled_date(profile, raw) if raw else None
+    return {
+        "date": date or "",
+        "description": _get(r, idx.get("description")) or "",
+        "amount": abs(amt),
+        "type": _norm_type(_get(r, idx.get("type"))) or side,
+        "category": _get(r, idx.get("category")),
+    }
+
+_TYPE_WORDS = {"cr": "income", "credit": "income", "income": "income",
+               "dr": "expense", "debit": "expense", "expense": "expense"}
+
+def _norm_type(s):
+    # bank type columns say Cr/Dr or Credit/Debit; keep anything else as-is
+    return _TYPE_WORDS.get((s or "").strip().lower().rstrip("."), s)
+
 def _map_header_indexes(header):
     idx = {}
     for want, aliases in HEADER_MAP.items():
@@ -74,26 +300,46 @@ def _get(row, i):
         return None
     return (row[i] or "").strip()
 
+def _amount(s):
+    """(signed value, "cr" | "dr" | None) of an amount cell, or None."""
+    m = _AMOUNT.match(s.strip()) if s else None
+    if not m:
+        return None
+    sign, digits, mark = m.groups()
+    value = float(digits.replace(",", ""))
+    mark = mark.lower() if mark else None
+    if (sign == "-") != (mark == "dr"):
+        value = -value
+    return value, mark
+
 def _to_float(s):
-    if not s: return None
-    s = s.replace(",", "").replace("₹","").replace("INR","").strip()
-    # handle Dr/Cr suffix
-    if s.endswith("Cr"):
-        try: return float(s[:-2].strip())
-        except: return None
-    if s.endswith("Dr"):
-        try: return -float(s[:-2].strip())
-        except: return None
-    try:
-        return float(s)
-    except:
+    parsed = _amount(s)
+    return parsed[0] if parsed else None
+
+def _date_in(layout, s):
+    """'YYYY-MM-DD' if `s` is a valid date in DATE_LAYOUTS[layout], else None."""
+    rx, (yi, mi, di) = DATE_LAYOUTS[layout]
+    m = rx.match(s)
+    if not m:
+        return None
+    g = m.groups()
+    mon = g[mi]
+    mon = _MONTHS.get(mon.lower(), 0) if mon.isalpha() else int(mon)
+    year, day = int(g[yi]), int(g[di])
+    if len(g[yi]) == 2:
+        year += 2000 if year < 69 else 1900  # strptime's %y pivot
+    if not (1 <= mon <= 12 and 1 <= day <= _DAYS[mon - 1]):
+        return None
+    if mon == 2 and day == 29 and not (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)):
         return None
+    return f"{year:04d}-{mon:02d}-{day:02d}"
 
 def _parse_date(s):
+    """Any DATE_LAYOUTS date (first layout that fits) → 'YYYY-MM-DD', else None."""
     if not s: return None
-    s = s.replace(".", "-").replace("/", "-")
-    for fmt in ("%d-%m-%Y","%Y-%m-%d","%d-%m-%y","%d-%b-%Y","%d %b %Y","%m-%d-%Y"):
-        try:
-            return datetime.strptime(s, fmt).strftime("%Y-%m-%d")
-        except: pass
+    s = s.strip()
+    for layout in DATE_LAYOUTS:
+        d = _date_in(layout, s)
+        if d:
+            return d
     return None
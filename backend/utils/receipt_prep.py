@@ -0,0 +1,176 @@
+"""
+Receipt preprocessing before OCR: find the paper, straighten it, scale it.
+
+Phone photos are mostly table / background and often 12 MP, while Tesseract
+time grows with pixel count and it reads best at cap heights of roughly
+20-40 px. `prepare(gray)` therefore:
+
+  1. crop_receipt  – finds the largest bright quadrilateral-ish blob on a
+                     downscaled copy (Otsu + close + largest contour) and crops
+                     the full-resolution image to it;
+  2. deskew        – rotates by the paper's minAreaRect angle (and crops the
+                     straightened paper again), or, when no paper edge was
+                     found, by the angle of the text pixels;
+  3. rescale       – measures the median character height from connected
+                     components and resizes so it lands on TARGET_TEXT_PX.
+
+`bands(image)` then splits the prepared page into the header / footer strips
+that merchant, date and total extraction read; ocr_receipt OCRs those first
+and only runs a full-page pass when they do not yield a total and a date.
+Every step is conservative: anything implausible leaves the image unchanged.
+"""
+import math
+
+import cv2
+import numpy as np
+
+DETECT_MAX_SIDE = 800          # detection runs on a copy this size
+MIN_RECEIPT_AREA = 0.08        # of the image; smaller blobs are not the receipt
+MAX_RECEIPT_AREA = 0.97        # larger → already cropped (scan / PDF page)
+CROP_MARGIN = 0.01
+MAX_SKEW_DEG = 15.0
+MIN_SKEW_DEG = 0.5
+TARGET_TEXT_PX = 28            # median glyph height Tesseract reads well
+MAX_UPSCALE = 2.0
+HEADER_FRAC = 0.30             # merchant, date
+FOOTER_FRAC = 0.35             # total, often the date too
+MIN_BANDED_HEIGHT = 900        # shorter pages are OCRed whole
+
+
+def _small(gray):
+    h, w = gray.shape[:2]
+    scale = min(1.0, DETECT_MAX_SIDE / float(max(h, w)))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def find_receipt(gray):
+    """
+    (x, y, w, h, angle) of the receipt in `gray` coordinates, or None when no
+    plausible paper region stands out from the background.
+    """
+    small, scale = _small(gray)
+    blur = cv2.GaussianBlur(small, (5, 5), 0)
+    _, mask = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    k = max(3, int(min(small.shape[:2]) * 0.03)) | 1
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((k, k), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    c = max(contours, key=cv2.contourArea)
+    frac = cv2.contourArea(c) / float(small.shape[0] * small.shape[1])
+    if not MIN_RECEIPT_AREA <= frac <= MAX_RECEIPT_AREA:
+        return None
+    x, y, w, h = cv2.boundingRect(c)
+    (_, _), (rw, rh), angle = cv2.minAreaRect(c)
+    return (int(x / scale), int(y / scale), int(math.ceil(w / scale)), int(math.ceil(h / scale)),
+            _upright(angle, rw, rh))
+
+
+def _upright(angle, w, h):
+    """minAreaRect angle → small correcting rotation (degrees) that makes the long side vertical."""
+    if w > h:
+        angle -= 90
+    while angle <= -45:
+        angle += 90
+    while angle > 45:
+        angle -= 90
+    return angle
+
+
+def crop_receipt(gray, found=None):
+    found = found if found is not None else find_receipt(gray)
+    if found is None:
+        return gray
+    x, y, w, h, _ = found
+    H, W = gray.shape[:2]
+    mx, my = int(W * CROP_MARGIN), int(H * CROP_MARGIN)
+    return gray[max(0, y - my):min(H, y + h + my), max(0, x - mx):min(W, x + w + mx)]
+
+
+def text_angle(gray):
+    """Rotation (degrees, for `deskew`) that levels the text block; 0.0 with too little ink."""
+    small, _ = _small(gray)
+    ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    # smear characters into lines so the block's orientation dominates
+    ink = cv2.dilate(ink, np.ones((3, 15), np.uint8))
+    pts = cv2.findNonZero(ink)
+    if pts is None or len(pts) < 50:
+        return 0.0
+    (_, _), (w, h), angle = cv2.minAreaRect(pts)
+    # text lines run horizontally: the long side should end up horizontal
+    return _upright(angle, h, w)
+
+
+def needs_deskew(angle):
+    return MIN_SKEW_DEG <= abs(angle) <= MAX_SKEW_DEG
+
+
+def _border_level(gray):
+    edges = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    return int(np.median(edges))
+
+
+def deskew(gray, angle, fill=255):
+    """Rotate by `angle` degrees (no-op outside MIN/MAX_SKEW_DEG); new corners get `fill`."""
+    if not needs_deskew(angle):
+        return gray
+    h, w = gray.shape[:2]
+    m = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
+    cos, sin = abs(m[0, 0]), abs(m[0, 1])
+    nw, nh = int(h * sin + w * cos), int(h * cos + w * sin)
+    m[0, 2] += nw / 2.0 - w / 2.0
+    m[1, 2] += nh / 2.0 - h / 2.0
+    return cv2.warpAffine(gray, m, (nw, nh), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=fill)
+
+
+def text_height(gray):
+    """Median glyph height in pixels from connected components, or None."""
+    ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    n, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    if n < 2:
+        return None
+    hs, ws = stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_WIDTH]
+    H = gray.shape[0]
+    # glyph-like: not specks, not rules / borders / photos
+    keep = (hs >= 4) & (hs <= H * 0.1) & (ws <= hs * 3)
+    if keep.sum() < 10:
+        return None
+    return float(np.median(hs[keep]))
+
+
+def rescale(gray, max_pixels):
+    th = text_height(gray)
+    if not th:
+        return gray
+    scale = min(MAX_UPSCALE, TARGET_TEXT_PX / th)
+    h, w = gray.shape[:2]
+    scale = min(scale, math.sqrt(max_pixels / float(h * w)))
+    if 0.9 <= scale <= 1.1:
+        return gray
+    interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=interp)
+
+
+def prepare(gray, max_pixels):
+    """Crop → deskew → rescale a grayscale page (see module docstring)."""
+    found = find_receipt(gray)
+    if found is None:
+        page = deskew(gray, text_angle(gray))
+    else:
+        page = crop_receipt(gray, found)
+        if needs_deskew(found[4]):
+            # the bounding box of tilted paper includes background wedges: rotate
+            # with background fill, then crop the now axis-aligned paper again
+            page = crop_receipt(deskew(page, found[4], fill=_border_level(page)))
+    return rescale(page, max_pixels)
+
+
+def bands(image):
+    """(header, footer) strips of a prepared page, or None when it is short enough to OCR whole."""
+    h = image.shape[0]
+    if h < MIN_BANDED_HEIGHT:
+        return None
+    return image[:int(h * HEADER_FRAC)], image[h - int(h * FOOTER_FRAC):]
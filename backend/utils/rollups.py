@@ -0,0 +1,237 @@
+"""
+Monthly rollups: one document per (user_id, month, type, category) holding the
+running `cents` total and `count` of the matching transactions. (Rollups built
+before integer cents hold a float `total`; readers add both until the next
+rebuild.)
+
+Every transaction write calls `apply()` with the written documents (sign=-1 for
+removals) so the rollups move with the data via `$inc`; bulk edits that never
+load the rows take their `totals()` first and `shift()` them afterwards.
+`rebuild()` recomputes them from the raw collection for backfill / drift repair
+(`flask rebuild-rollups`), user by user, overwriting the rollup docs in place.
+
+When the dashboard window covers whole calendar months and no free-text `q`
+filter is active, `dashboard()` answers total/totals/series/kpis from the
+rollups, so the cost is O(months x categories) instead of O(transactions).
+"""
+import calendar
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+from db import transactions, monthly_rollups
+from utils import schema
+
+
+def _month(d):
+    return (d or "")[:7]
+
+
+def _cents(r):
+    return r.get("cents", 0) + schema.to_cents(r.get("total"))
+
+
+def _key(doc):
+    return {
+        "user_id": doc.get("user_id"),
+        "month": schema.month(doc),
+        "type": doc.get("type"),
+        "category": doc.get("category"),
+    }
+
+
+# ---------- write side ----------
+def _add(acc, key, cents, count):
+    kt = tuple(key.values())
+    if kt not in acc:
+        acc[kt] = [key, 0, 0]
+    acc[kt][1] += cents
+    acc[kt][2] += count
+
+
+def _inc(acc):
+    ops = [UpdateOne(k, {"$inc": {"cents": cents, "count": count}}, upsert=True)
+           for k, cents, count in acc.values() if cents or count]
+    if ops:
+        monthly_rollups.bulk_write(ops, ordered=False)
+
+
+def apply(docs, sign=1):
+    """$inc the rollups for freshly written (sign=1) or removed (sign=-1) docs."""
+    acc = {}
+    for d in docs:
+        _add(acc, _key(d), sign * schema.cents(d), sign)
+    _inc(acc)
+
+
+def _grouped(match):
+    return transactions.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "month": schema.month_expr(),
+                "type": "$type",
+                "category": "$category",
+            },
+            "cents": {"$sum": schema.cents_expr()},
+            "count": {"$sum": 1},
+            "last_id": {"$max": "$_id"},
+        }},
+    ])
+
+
+def totals(match):
+    """
+    Rollup-shaped totals of the transactions matching `match`, for a bulk edit
+    that is about to change them: (groups [(key, cents, count)], highest _id
+    seen or None). One aggregate, however many rows match.
+    """
+    groups, last_id = [], None
+    for r in _grouped(match):
+        groups.append((r["_id"], int(round(r["cents"])), int(r["count"])))
+        if last_id is None or r["last_id"] > last_id:
+            last_id = r["last_id"]
+    return groups, last_id
+
+
+def shift(groups, changes=None):
+    """
+    Take `groups` (from `totals`) out of their rollups and, unless `changes` is
+    None (removal), add them back with those fields replaced, e.g.
+    {"category": "Travel"}. One bulk_write.
+    """
+    acc = {}
+    for key, cents, count in groups:
+        _add(acc, key, -cents, -count)
+        if changes is not None:
+            _add(acc, {**key, **changes}, cents, count)
+    _inc(acc)
+
+
+def _tuple(key):
+    return (key.get("user_id"), key.get("month"), key.get("type"), key.get("category"))
+
+
+def rebuild(user_id=None):
+    """
+    Recompute rollups from raw transactions (all users, or one), one user at a
+    time. Each user's rollup docs are overwritten in place with one bulk_write of
+    $set upserts, and keys with no rows left are zeroed rather than deleted, so
+    a concurrent apply() never hits a missing or duplicate key. Returns #rollup
+    docs with rows.
+    """
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = sorted(set(transactions.distinct("user_id")) | set(monthly_rollups.distinct("user_id")),
+                          key=str)
+    written = 0
+    for uid in user_ids:
+        fresh = {_tuple(r["_id"]): (r["_id"], int(round(r["cents"])), int(r["count"]))
+                 for r in _grouped({"user_id": uid})}
+        stale = [d for d in monthly_rollups.find({"user_id": uid}, {"_id": 0, "user_id": 1, "month": 1,
+                                                                    "type": 1, "category": 1})
+                 if _tuple(d) not in fresh]
+        ops = [UpdateOne(key, {"$set": {"cents": cents, "count": count}, "$unset": {"total": ""}}, upsert=True)
+               for key, cents, count in fresh.values()]
+        ops += [UpdateOne(key, {"$set": {"cents": 0, "count": 0}, "$unset": {"total": ""}}) for key in stale]
+        if ops:
+            monthly_rollups.bulk_write(ops, ordered=False)
+        written += len(fresh)
+    return written
+
+
+# ---------- read side ----------
+def covers_whole_months(start, end):
+    """True if [start, end] (YYYY-MM-DD or None) starts/ends on month boundaries."""
+    if start and start[8:10] != "01":
+        return False
+    if end:
+        try:
+            y, m, d = int(end[:4]), int(end[5:7]), int(end[8:10])
+            return d >= calendar.monthrange(y, m)[1]
+        except ValueError:
+            return False
+    return True
+
+
+def dashboard(user_id, category, start, end, mom, sections):
+    """
+    Same shape as utils.dashboard.run_dashboard (minus items), served from rollups.
+    Caller guarantees covers_whole_months(start, end) and no `q` filter.
+    """
+    lo, hi = _month(start) or None, _month(end) or None
+    rng = {}
+    if lo:
+        rng["$gte"] = lo
+    if hi:
+        rng["$lte"] = hi
+    flt = {"user_id": user_id}
+    if category:
+        flt["category"] = category
+    if rng:
+        flt["$or"] = [{"month": rng},
+                      {"month": {"$in": [_month(mom["cur_start"]), _month(mom["prev_start"])]}}]
+    docs = list(monthly_rollups.find(flt, {"_id": 0, "month": 1, "type": 1, "category": 1,
+                                          "cents": 1, "total": 1, "count": 1}))
+
+    def in_window(month):
+        if lo and not (month and month >= lo):
+            return False
+        if hi and not (month and month <= hi):
+            return False
+        return True
+
+    window = [r for r in docs if in_window(r["month"]) and r.get("count")]
+    out = {}
+
+    if "total" in sections:
+        out["total"] = int(sum(r["count"] for r in window))
+
+    by_type = defaultdict(int)
+    for r in window:
+        by_type[r["type"]] += _cents(r)
+    inc, exp = schema.from_cents(by_type.get("income")), schema.from_cents(by_type.get("expense"))
+    if "totals" in sections or "kpis" in sections:
+        out["totals"] = {"income": inc, "expense": exp, "net": inc - exp}
+
+    if "series" in sections:
+        months = defaultdict(lambda: {"income": 0, "expense": 0})
+        cats = defaultdict(int)
+        for r in window:
+            if r["type"] in ("income", "expense"):
+                months[r["month"]][r["type"]] += _cents(r)
+            if r["type"] == "expense":
+                cats[r["category"] if r["category"] is not None else "Uncategorized"] += _cents(r)
+        out["by_month"] = [{"month": m, **{t: schema.from_cents(c) for t, c in v.items()}}
+                           # undated rows (month None) first, like the raw $sort
+                           for m, v in sorted(months.items(), key=lambda kv: (kv[0] is not None, kv[0] or ""))]
+        out["by_category"] = [{"category": c, "total": schema.from_cents(t)}
+                              for c, t in sorted(cats.items(), key=lambda kv: -kv[1])]
+
+    if "kpis" in sections:
+        cur_m, prev_m = _month(mom["cur_start"]), _month(mom["prev_start"])
+        sums = defaultdict(int)
+        for r in docs:
+            if r["month"] in (cur_m, prev_m):
+                sums[(r["month"], r["type"])] += _cents(r)
+        # the current-month window stops at today: back out future-dated rows
+        y, m = int(cur_m[:4]), int(cur_m[5:7])
+        month_end = f"{cur_m}-{calendar.monthrange(y, m)[1]:02d}"
+        future = {"user_id": user_id, **schema.date_clause(schema.next_day(mom["today"]), month_end)}
+        if category:
+            future["category"] = category
+        for r in transactions.aggregate([
+            {"$match": future},
+            {"$group": {"_id": "$type", "total": {"$sum": schema.cents_expr()}}},
+        ]):
+            sums[(cur_m, r["_id"])] -= round(r["total"])
+        out["mom"] = {
+            "cur_income": schema.from_cents(sums[(cur_m, "income")]),
+            "cur_expense": schema.from_cents(sums[(cur_m, "expense")]),
+            "prev_income": schema.from_cents(sums[(prev_m, "income")]),
+            "prev_expense": schema.from_cents(sums[(prev_m, "expense")]),
+        }
+
+    return out
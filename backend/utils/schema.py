@@ -0,0 +1,169 @@
+"""
+Stored transaction schema.
+
+    v1 (original)                 v2 (current)
+      date: "YYYY-MM-DD" string     date: BSON date, midnight UTC (8 bytes)
+      amount: float                 cents: int (int32 up to ±21M, int64 beyond)
+      created_at: datetime          —  (the ObjectId already carries insert time)
+                                    v: 2
+
+Integer cents make totals exact (sums stay integers until they are divided for
+display), and BSON dates are smaller than the 10-character strings in both the
+documents and the (user_id, date) index. Field names are unchanged: WiredTiger
+block compression already shrinks repeated names on disk, and renaming them
+would touch every query and index.
+
+New writes are v2 (`ledger.build_doc`). `flask migrate-schema` rewrites v1
+documents in batches, newest first per user, so the date-descending list order
+stays right while the rollout is in progress (v2 dates sort before v1 strings).
+While SCHEMA_READ_V1 is on, every read goes through the helpers below and
+accepts both versions; switch it off once the migration reports 0 remaining
+to get plain, single-type predicates again. A v1 date that is not a
+YYYY-MM-DD day cannot become a BSON date: the migration stores null instead
+and keeps the original string in `date_v1`.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from config import Config
+
+VERSION = 2
+FIELDS = ("date", "cents", "amount", "v")  # what the accessors below read
+LEGACY_DATE = "date_v1"  # unparseable v1 date string, kept by the migration
+
+
+def reads_v1():
+    return Config.SCHEMA_READ_V1
+
+
+# ---------- values ----------
+def to_date(day):
+    """'YYYY-MM-DD' → naive UTC midnight datetime; None if missing or malformed."""
+    try:
+        return datetime.strptime((day or "")[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def next_day(day):
+    return (to_date(day) + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def to_cents(amount):
+    return int(round(float(amount or 0) * 100))
+
+
+def from_cents(cents):
+    return round(cents or 0) / 100
+
+
+# ---------- document accessors (either version) ----------
+def date_str(doc):
+    """Stored date as 'YYYY-MM-DD' or None."""
+    d = doc.get("date")
+    if isinstance(d, datetime):
+        return d.strftime("%Y-%m-%d")
+    if isinstance(d, str):
+        return d[:10] if len(d) >= 10 else None
+    return None
+
+
+def month(doc):
+    """'YYYY-MM', or None for an undated row (as month_expr groups it)."""
+    day = date_str(doc)
+    return day[:7] if day else None
+
+
+def cents(doc):
+    if "cents" in doc:
+        return int(doc["cents"] or 0)
+    return to_cents(doc.get("amount"))
+
+
+def amount(doc):
+    return from_cents(cents(doc))
+
+
+# ---------- query fragments ----------
+def date_clause(start=None, end=None):
+    """
+    Filter clause for start <= date <= end (inclusive 'YYYY-MM-DD' bounds, either
+    may be None). Returns {} when unbounded; with SCHEMA_READ_V1 on, an $or that
+    also matches v1 string dates, so callers must not merge it next to another $or.
+    """
+    v2, v1 = {}, {}
+    if start:
+        v2["$gte"], v1["$gte"] = to_date(start), start
+    if end:
+        v2["$lte"], v1["$lte"] = to_date(end), end
+    if not v2:
+        return {}
+    if reads_v1():
+        return {"$or": [{"date": v2}, {"date": v1}]}
+    return {"date": v2}
+
+
+def _either(v2_expr, v1_expr):
+    if not reads_v1():
+        return v2_expr
+    return {"$cond": [{"$eq": ["$v", VERSION]}, v2_expr, v1_expr]}
+
+
+def cents_expr():
+    """Aggregation expression for a row's amount in cents (sum it, then from_cents)."""
+    return _either("$cents", {"$multiply": ["$amount", 100]})
+
+
+def month_expr():
+    """Aggregation expression for a row's 'YYYY-MM' month (null for undated rows)."""
+    # the server's $dateToString already yields null for a null date; the guard
+    # spells it out for mongomock, which raises instead
+    v2 = {"$cond": [{"$lte": ["$date", None]}, None,
+                    {"$dateToString": {"format": "%Y-%m", "date": "$date"}}]}
+    return _either(v2, {"$substr": ["$date", 0, 7]})
+
+
+def on_or_after_expr(day):
+    """Aggregation expression: row date >= 'YYYY-MM-DD' `day`."""
+    return _either({"$gte": ["$date", to_date(day)]}, {"$gte": ["$date", day]})
+
+
+# ---------- migration ----------
+def upgrade(doc):
+    """$set/$unset update turning a v1 document into v2."""
+    day = to_date(date_str(doc))
+    fields = {"date": day, "cents": cents(doc), "v": VERSION}
+    if day is None and doc.get("date"):
+        # v1 stored any 10+ character string (e.g. "05/01/2024"). A v2 date must
+        # be a BSON date or null for $dateToString and the range filters, so the
+        # row becomes undated and keeps what it had for a manual fix.
+        fields[LEGACY_DATE] = doc["date"]
+    return {"$set": fields, "$unset": {"amount": "", "created_at": ""}}
+
+
+def migrate(collection, batch_size=1000, user_id=None):
+    """
+    Rewrite v1 transactions as v2, newest first per user, in bulk_write batches.
+    Online-safe: each update is conditional on the document still being v1, so
+    rows rewritten concurrently are left alone. Returns #migrated.
+    """
+    pending = {"v": {"$ne": VERSION}}
+    user_ids = [user_id] if user_id else collection.distinct("user_id", pending)
+    migrated = 0
+    for uid in user_ids:
+        while True:
+            batch = list(collection.find({"user_id": uid, **pending},
+                                         {"date": 1, "amount": 1, "cents": 1})
+                         .sort([("date", -1), ("_id", -1)])
+                         .limit(batch_size))
+            if not batch:
+                break
+            res = collection.bulk_write([UpdateOne({"_id": d["_id"], **pending}, upgrade(d))
+                                         for d in batch], ordered=False)
+            migrated += res.modified_count
+    return migrated
+
+
+def remaining(collection):
+    return collection.count_documents({"v": {"$ne": VERSION}})
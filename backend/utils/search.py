@@ -0,0 +1,67 @@
+"""
+Indexed description search.
+
+Each transaction carries `search_tokens`: the lowercased word tokens of its
+description, maintained on write and covered by the multikey
+(user_id, search_tokens) index. A free-text `q` is tokenized the same way and
+every query token becomes an anchored prefix lookup (`^token`) on that field,
+which Mongo answers as an index range scan instead of running an unanchored
+case-insensitive regex over every one of the user's documents. Query tokens are
+escaped, so user input is never interpreted as a regex.
+
+Existing documents are backfilled with `flask backfill-search`.
+"""
+import re
+
+from pymongo import UpdateOne
+
+from db import transactions
+
+FIELD = "search_tokens"
+MAX_TOKENS = 32
+MAX_TOKEN_LEN = 32
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Distinct lowercased word tokens of `text`, in order of first appearance."""
+    seen = []
+    for tok in _WORD.findall((text or "").casefold()):
+        tok = tok[:MAX_TOKEN_LEN]
+        if tok not in seen:
+            seen.append(tok)
+            if len(seen) >= MAX_TOKENS:
+                break
+    return seen
+
+
+def with_tokens(doc):
+    """Set the search field on a transaction doc about to be written; returns doc."""
+    doc[FIELD] = tokenize(doc.get("description"))
+    return doc
+
+
+def query_filter(q):
+    """
+    Filter fragment for free text `q`: every query token must prefix-match some
+    description token. Returns {} if `q` has no word characters.
+    """
+    toks = tokenize(q)
+    if not toks:
+        return {}
+    return {"$and": [{FIELD: {"$regex": "^" + re.escape(t)}} for t in toks]}
+
+
+def backfill(batch_size=1000):
+    """Populate the search field on documents written before it existed. Returns #updated."""
+    updated = 0
+    while True:
+        batch = list(transactions.find({FIELD: {"$exists": False}}, {"description": 1})
+                     .limit(batch_size))
+        if not batch:
+            return updated
+        ops = [UpdateOne({"_id": d["_id"]}, {"$set": {FIELD: tokenize(d.get("description"))}})
+               for d in batch]
+        transactions.bulk_write(ops, ordered=False)
+        updated += len(ops)
@@ -0,0 +1,190 @@
+"""
+Streaming importer for bank CSV and OFX/QFX exports.
+
+Files are read incrementally (CSV line by line, OFX in fixed-size chunks), rows
+are normalized with the same header mapping and column profile as PDF tables
+(utils.pdf_table), and `commit_stream` writes them through `ledger.commit_rows`
+in ledger.CHUNK_SIZE batches, so memory stays bounded by one batch no matter
+how many years the export covers.
+
+Every row carries a stable `idempotency_key`: the OFX FITID (scoped by account)
+when present, otherwise a hash of the file (or, for an unseekable stream, its
+preamble and header) and the row's position and content, so importing the
+same file twice writes nothing new while equal rows of another account's
+export still get keys of their own.
+"""
+import codecs
+import csv
+import hashlib
+import html
+import io
+import itertools
+import re
+import uuid
+
+from utils import ledger
+from utils.pdf_table import (SAMPLE_ROWS, _has_columns, _map_header_indexes, _parse_date, _profile_table,
+                             _table_row, _to_float, normalize_header)
+
+FORMATS = {"csv": "csv", "ofx": "ofx", "qfx": "ofx"}
+
+# preamble lines (account info etc.) tolerated before the CSV header row
+HEADER_SCAN_LINES = 30
+_DELIMITERS = (",", ";", "\t", "|")
+
+_READ = 64 * 1024
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def _key(*parts):
+    return hashlib.sha1("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _binary(src):
+    if isinstance(src, (bytes, bytearray)):
+        return io.BytesIO(src)
+    if hasattr(src, "seek"):
+        src.seek(0)
+    return src
+
+
+def _file_id(stream):
+    """sha1 of a seekable export, read once in chunks and rewound; None otherwise."""
+    if not hasattr(stream, "seek"):
+        return None
+    h = hashlib.sha1()
+    for chunk in iter(lambda: stream.read(_READ), b""):
+        h.update(chunk)
+    stream.seek(0)
+    return h.hexdigest()
+
+
+def _find_header(line):
+    """(delimiter, header indexes, #columns) if `line` is a header mapping a date + amount, else None."""
+    for delim in _DELIMITERS:
+        cells = next(csv.reader([line], delimiter=delim), [])
+        idx = _map_header_indexes([normalize_header(c) for c in cells])
+        if len(cells) > 1 and _has_columns(idx):
+            return delim, idx, len(cells)
+    return None
+
+
+def iter_csv(src):
+    """Yield normalized rows of a CSV export (bytes or binary file object)."""
+    raw = _binary(src)
+    file_id = _file_id(raw)
+    text = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        found, seen = None, []
+        for _ in range(HEADER_SCAN_LINES):
+            line = text.readline()
+            if not line:
+                break
+            seen.append(line)
+            found = _find_header(line)
+            if found:
+                break
+        if not found:
+            return
+        delim, idx, width = found
+        file_id = file_id or _key(*seen)  # account lines + header
+        reader = csv.reader(text, delimiter=delim)
+        # date layout and amount convention are profiled once, from the first rows
+        head = list(itertools.islice(reader, SAMPLE_ROWS))
+        profile = _profile_table(idx, head, width)
+        for n, cells in enumerate(itertools.chain(head, reader)):
+            row = _table_row(cells, profile)
+            if row and row["date"]:
+                row["category"] = row["category"] or ""
+                row["idempotency_key"] = _key("csv", file_id, n, *cells)
+                yield row
+    finally:
+        text.detach()  # leave the caller's stream open
+
+
+def _iter_ofx_tags(stream):
+    """(closing, TAG, text) for every tag of an OFX (SGML or XML) stream, chunk by chunk."""
+    chunk = stream.read(_READ)
+    # OFX 2 is XML (UTF-8); OFX 1 SGML headers usually declare CHARSET:1252
+    utf8 = b"<?xml" in chunk[:1024] or b"ENCODING:UTF-8" in chunk[:1024].upper()
+    decoder = codecs.getincrementaldecoder("utf-8" if utf8 else "cp1252")(errors="replace")
+    buf = ""
+    while True:
+        buf += decoder.decode(chunk or b"", final=not chunk)
+        cut = len(buf) if not chunk else buf.rfind("<")
+        if cut > 0:
+            for closing, tag, value in _OFX_TAG.findall(buf[:cut]):
+                yield closing, tag.upper(), value.strip()
+            buf = buf[cut:]
+        if not chunk:
+            return
+        chunk = stream.read(_READ)
+
+
+def _ofx_date(s):
+    # YYYYMMDD[HHMMSS[.XXX]][[-5:EST]]
+    return _parse_date(f"{s[:4]}-{s[4:6]}-{s[6:8]}") if s and len(s) >= 8 else None
+
+
+def iter_ofx(src):
+    """Yield normalized rows of an OFX/QFX export (bytes or binary file object)."""
+    account, txn, n = "", None, 0
+    for closing, tag, value in _iter_ofx_tags(_binary(src)):
+        if tag == "STMTTRN":
+            if not closing:
+                txn = {}
+                continue
+            amt = _to_float(txn.get("TRNAMT"))
+            date = _ofx_date(txn.get("DTPOSTED"))
+            if amt is not None and date:
+                fitid = txn.get("FITID")
+                desc = " ".join(v for v in (txn.get("NAME"), txn.get("MEMO")) if v)
+                yield {
+                    "date": date,
+                    "description": html.unescape(desc),
+                    "amount": abs(amt),
+                    "type": "income" if amt > 0 else "expense",
+                    "category": "",
+                    "idempotency_key": _key("ofx", account, fitid) if fitid
+                                       else _key("ofx", account, n, date, amt, desc),
+                }
+            txn, n = None, n + 1
+        elif closing:
+            continue
+        elif txn is not None:
+            txn[tag] = value
+        elif tag == "ACCTID":
+            account = value
+
+
+def iter_rows(src, fmt):
+    return iter_csv(src) if FORMATS[fmt] == "csv" else iter_ofx(src)
+
+
+def batches(rows, size=ledger.CHUNK_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def commit_stream(uid, src, fmt, max_errors=20):
+    """
+    Parse and commit a statement export in ledger.CHUNK_SIZE batches. Genuine
+    repeats within the export are kept (rows of this import are excluded from the
+    fingerprint check); rows already stored from other sources are skipped.
+    Returns {"rows", "inserted", "duplicate", "invalid", "error", "errors": [first few]}.
+    """
+    import_id = uuid.uuid4().hex
+    out = {"rows": 0, "inserted": 0, "duplicate": 0, "invalid": 0, "error": 0, "errors": []}
+    for batch in batches(iter_rows(src, fmt), ledger.CHUNK_SIZE):
+        for res in ledger.commit_rows(uid, batch, import_id=import_id):
+            out[res["status"]] += 1
+            if "error" in res and len(out["errors"]) < max_errors:
+                out["errors"].append({"row": out["rows"] + res["index"], "error": res["error"]})
+        out["rows"] += len(batch)
+    return out